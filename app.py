@@ -6,17 +6,28 @@ from typing import Dict, Any, List
 
 # Import RAG chain và các thành phần cần thiết
 # Đảm bảo các đường dẫn import này chính xác với cấu trúc thư mục của bạn
-from src.core.chain import rag_chain
-from src.core.llm_handle import get_llm
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from src.core.config import PREWARM_ON_STARTUP
+from src.core.resources import ResourceRegistry, get_registry
 
 # --- 1. CẤU HÌNH TRANG VÀ TIÊU ĐỀ ---
 st.set_page_config(page_title="Chatbot Lịch sử", page_icon="📜", layout="wide")
 st.title("📜 Chatbot Lịch sử Việt Nam")
 st.caption("Trò chuyện, khám phá và học hỏi về lịch sử dân tộc.")
 
-# --- 2. HÀM TIỆN ÍCH ---
+# --- 2. TÀI NGUYÊN DÙNG CHUNG VÀ HÀM TIỆN ÍCH ---
+
+@st.cache_resource(show_spinner="Đang khởi tạo chatbot...")
+def load_resources() -> ResourceRegistry:
+    """
+    Model, backend truy xuất, LLM client và các chain sống suốt vòng đời tiến trình,
+    dùng chung cho mọi session và mọi lần Streamlit chạy lại script.
+    """
+    registry = get_registry()
+    if PREWARM_ON_STARTUP:
+        registry.warm(background=True)
+    return registry
+
+resources = load_resources()
 
 def format_chat_history(messages: List[Dict[str, str]]) -> str:
     """Định dạng lịch sử chat thành một chuỗi duy nhất cho chain."""
@@ -30,14 +41,7 @@ def generate_conversation_title(question, answer):
     """
     Dùng LLM (model nhanh) để tạo tiêu đề cho cuộc hội thoại.
     """
-    title_prompt = ChatPromptTemplate.from_template(
-        "Dựa vào câu hỏi và câu trả lời đầu tiên dưới đây, hãy tạo ra một tiêu đề ngắn gọn (tối đa 7 từ) cho cuộc trò chuyện này.\n\n"
-        "Câu hỏi: {question}\n"
-        "Câu trả lời: {answer}\n\n"
-        "Tiêu đề:"
-    )
-    title_generation_chain = title_prompt | get_llm("gemini") | StrOutputParser()
-    return title_generation_chain.invoke({"question": question, "answer": answer})
+    return resources.title_chain.invoke({"question": question, "answer": answer})
 
 # --- 3. KHỞI TẠO VÀ QUẢN LÝ SESSION STATE ---
 
@@ -114,6 +118,24 @@ with st.sidebar:
             st.session_state.active_conversation_id = None
             st.rerun()
 
+    st.divider()
+    with st.expander("⚙️ Tài nguyên hệ thống"):
+        stats = resources.stats()
+        memory = stats["memory"]
+        if memory["rss_mb"] is not None:
+            st.metric("RAM tiến trình", f"{memory['rss_mb']:.0f} MB", help=f"PID {memory['pid']}")
+        if memory["peak_rss_mb"] is not None:
+            st.caption(f"Đỉnh RAM: {memory['peak_rss_mb']:.0f} MB")
+        loaded = [name for name, s in stats["singletons"].items() if s["initialized"]]
+        st.caption("Đã nạp: " + (", ".join(loaded) if loaded else "chưa có"))
+        if st.button("🔄 Tải lại tài nguyên", use_container_width=True):
+            resources.reload()
+            st.rerun()
+        if st.button("⏹️ Giải phóng tài nguyên", use_container_width=True):
+            resources.shutdown()
+            load_resources.clear()
+            st.rerun()
+
 # --- 5. HIỂN THỊ GIAO DIỆN CHAT CHÍNH ---
 
 if st.session_state.active_conversation_id:
@@ -132,18 +154,21 @@ if st.session_state.active_conversation_id:
             st.markdown(user_prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Đang suy nghĩ..."):
-                # CẬP NHẬT: Thêm các lựa chọn mới vào input_data
-                input_data: Dict[str, Any] = {
-                    "question": user_prompt,
-                    "llm_choice": selected_model,
-                    "search_type": selected_search_type, # Thêm lựa chọn tìm kiếm
-                    "top_k": top_k_value,                 # Thêm giá trị top_k
-                    "chat_history": chat_history_for_chain,
-                    "use_web_search": use_web_search
-                }
-                response = rag_chain.invoke(input_data)
-                st.markdown(response)
+            # CẬP NHẬT: Thêm các lựa chọn mới vào input_data
+            input_data: Dict[str, Any] = {
+                "question": user_prompt,
+                "llm_choice": selected_model,
+                "search_type": selected_search_type, # Thêm lựa chọn tìm kiếm
+                "top_k": top_k_value,                 # Thêm giá trị top_k
+                "chat_history": chat_history_for_chain,
+                "use_web_search": use_web_search
+            }
+            with st.spinner("Đang tìm tài liệu..."):
+                # Chạy bất đồng bộ: retrieval và web search chạy chồng lên nhau
+                # Mọi coroutine chạy trên event loop dùng chung của tiến trình (client async của LLM gắn với loop)
+                context_state = resources.run(resources.rag_context_chain.ainvoke(input_data))
+            # Stream từng token của câu trả lời, danh sách nguồn được thêm vào khi stream kết thúc
+            response = st.write_stream(resources.iter_async(resources.astream_final_answer(context_state)))
         
         st.session_state.conversations[active_id]["messages"].append({"role": "assistant", "content": response})
 
@@ -0,0 +1,142 @@
+"""
+Benchmark chunk_full_text_by_words trên sách tổng hợp nhiều trang (mặc định 1200 trang).
+
+So sánh:
+  - cách cũ: một match object cho mỗi từ, quét toàn bộ page_offsets cho mỗi chunk (O(chunk x trang))
+  - cách mới: biên từ tính một lần thành mảng số nguyên, tra trang bằng bisect
+và kiểm tra hai cách cho kết quả giống hệt nhau (kể cả với khoảng trắng Unicode, trang rỗng).
+Đo thêm chế độ theo câu (sentence_aware).
+
+Cách dùng:
+    python scripts/bench_chunker.py --pages 1200 --words-per-page 450
+    python scripts/bench_chunker.py --pages 3000 --chunk-size 512 --overlap 128
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import random
+import re
+import time
+
+from src.data_processing.extract_pdf import chunk_full_text_by_words
+
+WORDS = (
+    "lịch sử Việt Nam thời kỳ dựng nước và giữ nước triều đại nhà Lý nhà Trần kháng chiến chống quân "
+    "Nguyên Mông trên sông Bạch Đằng Ngô Quyền đánh bại quân Nam Hán năm 938"
+).split()
+SPACES = [" "] * 40 + ["  ", "\n", " ", "　", "\t"]
+
+
+def old_chunk_full_text_by_words(full_text, page_offsets, chunk_size_words, chunk_overlap_words):
+    """Bản cài đặt trước đây, giữ lại để so sánh kết quả và tốc độ."""
+    if not full_text:
+        return []
+    tokens = list(re.finditer(r'\S+', full_text))
+    n_words = len(tokens)
+    if n_words == 0:
+        return []
+    chunk_size = max(1, int(chunk_size_words))
+    chunk_overlap = max(0, int(chunk_overlap_words))
+    step = max(1, chunk_size - chunk_overlap)
+    chunks = []
+    start_word_idx = 0
+    text_len = len(full_text)
+    while start_word_idx < n_words:
+        end_word_idx_excl = min(n_words, start_word_idx + chunk_size)
+        start_char = tokens[start_word_idx].start()
+        end_char = tokens[end_word_idx_excl - 1].end()
+        pages_in_chunk = []
+        for i, (page_num, offset) in enumerate(page_offsets):
+            next_offset = page_offsets[i + 1][1] if i + 1 < len(page_offsets) else text_len
+            if start_char < next_offset and end_char > offset:
+                pages_in_chunk.append(page_num)
+        chunks.append({
+            "text": full_text[start_char:end_char],
+            "start_char": start_char,
+            "end_char": end_char,
+            "pages": pages_in_chunk,
+            "word_start": start_word_idx,
+            "word_end": end_word_idx_excl - 1
+        })
+        if end_word_idx_excl >= n_words:
+            break
+        start_word_idx += step
+    return chunks
+
+
+def make_book(n_pages, words_per_page, rng):
+    """full_text + page_offsets giống build_file_chunks (mỗi trang kèm một dấu cách), có cả trang rỗng."""
+    pages = []
+    for _ in range(n_pages):
+        if rng.random() < 0.01:
+            pages.append("")
+            continue
+        parts = []
+        for i in range(rng.randint(words_per_page // 2, words_per_page)):
+            word = rng.choice(WORDS)
+            if rng.random() < 0.08:
+                word += rng.choice([".", "!", "?", ".”", "…"])
+            parts.append(word)
+            parts.append(rng.choice(SPACES))
+        pages.append("".join(parts).strip())
+    page_offsets = []
+    offset = 0
+    for i, text in enumerate(pages, start=1):
+        page_offsets.append((i, offset))
+        offset += len(text) + 1
+    return "".join(p + " " for p in pages), page_offsets
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunker theo số từ.")
+    parser.add_argument("--pages", type=int, default=1200)
+    parser.add_argument("--words-per-page", type=int, default=450)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--verify-rounds", type=int, default=200, help="Số sách nhỏ ngẫu nhiên để so sánh kết quả.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # 1) Kết quả giống hệt cách cũ trên nhiều sách nhỏ ngẫu nhiên
+    for _ in range(args.verify_rounds):
+        text, offsets = make_book(rng.randint(0, 30), rng.randint(1, 60), rng)
+        size = rng.randint(1, 80)
+        overlap = rng.randint(0, size + 5)
+        expected = old_chunk_full_text_by_words(text, offsets, size, overlap)
+        actual = chunk_full_text_by_words(text, offsets, size, overlap)
+        if expected != actual:
+            raise SystemExit(f"KHÁC KẾT QUẢ (size={size}, overlap={overlap}, {len(offsets)} trang)")
+    print(f"Kết quả giống hệt cách cũ trên {args.verify_rounds} sách ngẫu nhiên.")
+
+    # 2) Tốc độ trên sách lớn
+    text, offsets = make_book(args.pages, args.words_per_page, rng)
+    print(f"\nSách tổng hợp: {len(offsets)} trang, {len(text.split())} từ, {len(text) / 1e6:.1f}M ký tự "
+          f"(chunk {args.chunk_size} từ, chồng lấn {args.overlap})")
+    old, old_s = timed(lambda: old_chunk_full_text_by_words(text, offsets, args.chunk_size, args.overlap), args.repeat)
+    new, new_s = timed(lambda: chunk_full_text_by_words(text, offsets, args.chunk_size, args.overlap), args.repeat)
+    sent, sent_s = timed(lambda: chunk_full_text_by_words(text, offsets, args.chunk_size, args.overlap, sentence_aware=True), args.repeat)
+    print(f"   cách cũ       : {old_s * 1000:9.1f} ms  ({len(old)} chunk, {len(offsets) / old_s:,.0f} trang/s)")
+    print(f"   cách mới      : {new_s * 1000:9.1f} ms  ({len(new)} chunk, {len(offsets) / new_s:,.0f} trang/s, x{old_s / new_s:.1f})")
+    print(f"   giống hệt     : {old == new}")
+    ended = sum(1 for c in sent if c["text"].rstrip("\"'”’)]»")[-1:] in ".!?…")
+    print(f"   theo câu      : {sent_s * 1000:9.1f} ms  ({len(sent)} chunk, {ended} chunk kết thúc ở cuối câu)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark bước sửa lỗi OCR (apply_corrections) theo số trang / giây.
+
+So sánh:
+  - cách cũ: mỗi mục của bảng tra một lượt str.replace trên cả trang
+  - cách mới: CorrectionEngine (trie -> một regex, một lượt quét, khớp dài nhất, trọn từ)
+với bảng tra có sẵn (CORRECTION_MAP) và với một từ điển lớn sinh ngẫu nhiên (--dict-size mục,
+nạp từ file TSV để đo cả thời gian nạp / biên dịch).
+
+Trang lấy từ các file .txt đã làm sạch trong --text-dir (ví dụ "data/clean data"), nếu không có
+thì sinh trang tổng hợp.
+
+Cách dùng:
+    python scripts/bench_corrections.py --pages 500 --dict-size 50000
+    python scripts/bench_corrections.py --text-dir "data/clean data"
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import glob
+import random
+import tempfile
+import time
+
+from src.data_processing.corrections import CorrectionEngine, build_correction_engine
+from src.data_processing.extract_pdf import CORRECTION_MAP
+
+SYLLABLES = (
+    "lịch sử việt nam thời kỳ dựng nước giữ nước triều đại nhà lý trần lê nguyễn kháng chiến bạch đằng "
+    "ngô quyền quân nam hán sông số nơi với của được hơn có về thế lại bỏ miền cũ những riêng"
+).split()
+WORDS_PER_PAGE = 450
+
+
+def old_apply(text, correction_map):
+    for wrong, correct in correction_map.items():
+        text = text.replace(wrong, correct)
+    return text
+
+
+def load_pages(text_dir, n_pages, seed):
+    pages = []
+    if text_dir:
+        for path in sorted(glob.glob(os.path.join(text_dir, "*.txt"))):
+            with open(path, "r", encoding="utf-8") as f:
+                words = f.read().split()
+            pages.extend(" ".join(words[i:i + WORDS_PER_PAGE]) for i in range(0, len(words), WORDS_PER_PAGE))
+            if len(pages) >= n_pages:
+                break
+    if pages:
+        return pages[:n_pages]
+
+    # Trang tổng hợp: từ thường xen lẫn các lỗi có trong bảng tra
+    rng = random.Random(seed)
+    errors = list(CORRECTION_MAP)
+    return [
+        " ".join(rng.choice(errors) if rng.random() < 0.05 else rng.choice(SYLLABLES) for _ in range(WORDS_PER_PAGE))
+        for _ in range(n_pages)
+    ]
+
+
+def write_large_dictionary(path, size, seed):
+    rng = random.Random(seed)
+    letters = "abcdeghiklmnopqrstuvxyàáảãạăâđêôơưéèẻẽẹíìỉĩịóòỏõọúùủũụýỳỷỹỵ"
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(size):
+            wrong = " ".join("".join(rng.choice(letters) for _ in range(rng.randint(2, 6))) for _ in range(rng.randint(1, 3)))
+            f.write(f"{wrong}\t{wrong.upper()}\n")
+
+
+def pages_per_second(fn, pages, min_seconds=1.0):
+    done = 0
+    started = time.perf_counter()
+    while True:
+        for page in pages:
+            fn(page)
+        done += len(pages)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark apply_corrections (trang / giây).")
+    parser.add_argument("--text-dir", default=None, help="Thư mục chứa .txt đã làm sạch (mặc định: trang tổng hợp).")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--dict-size", type=int, default=50000, help="Số mục của từ điển lớn (0 = bỏ qua).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = load_pages(args.text_dir, args.pages, args.seed)
+    print(f"{len(pages)} trang, trung bình {sum(len(p) for p in pages) / len(pages):.0f} ký tự / trang\n")
+
+    started = time.perf_counter()
+    engine = CorrectionEngine(CORRECTION_MAP)
+    build_ms = (time.perf_counter() - started) * 1000
+    old_rate = pages_per_second(lambda p: old_apply(p, CORRECTION_MAP), pages)
+    new_rate = pages_per_second(engine.apply, pages)
+    changed = sum(old_apply(p, CORRECTION_MAP) != engine.apply(p) for p in pages)
+    print(f"Bảng tra có sẵn ({len(CORRECTION_MAP)} mục, dựng engine {build_ms:.1f} ms):")
+    print(f"   cách cũ  : {old_rate:10.1f} trang/s")
+    print(f"   cách mới : {new_rate:10.1f} trang/s  (x{new_rate / old_rate:.1f})")
+    print(f"   {changed}/{len(pages)} trang cho kết quả khác (cách mới không sửa giữa từ / chồng lên kết quả trước)")
+
+    if args.dict_size <= 0:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        dict_path = os.path.join(tmp, "corrections.tsv")
+        write_large_dictionary(dict_path, args.dict_size, args.seed)
+        started = time.perf_counter()
+        large_engine = build_correction_engine(CORRECTION_MAP, [dict_path])
+        load_seconds = time.perf_counter() - started
+    large_map = dict(large_engine.mapping)
+    # cách cũ quá chậm với từ điển lớn: chỉ đo trên một phần nhỏ số trang
+    sample = pages[:max(1, min(len(pages), 5))]
+    old_rate = pages_per_second(lambda p: old_apply(p, large_map), sample, min_seconds=0.5)
+    new_rate = pages_per_second(large_engine.apply, pages)
+    print(f"\nTừ điển lớn ({len(large_engine)} mục, nạp + biên dịch {load_seconds:.2f}s):")
+    print(f"   cách cũ  : {old_rate:10.1f} trang/s")
+    print(f"   cách mới : {new_rate:10.1f} trang/s  (x{new_rate / old_rate:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Benchmark truy xuất offline trên bộ câu hỏi có ground_truth_ids (evaluate/generated_dataset.jsonl).
+
+Chạy `retriever_fn` ở các chế độ hybrid / semantic / keyword với nhiều giá trị top_k, báo cáo:
+  - chất lượng: recall@k, MRR, nDCG@k (so khớp với ground_truth_ids)
+  - độ trễ p50 / p95 / p99 của toàn bộ lời gọi và từng bước (embed, search / bm25 / vector / legs, fusion, format)
+và ghi kết quả ra file JSON để so sánh giữa các lần chạy (--compare).
+
+Một kết quả truy xuất khớp ground truth nếu `uuid`, `content_uuid` (UUID theo nội dung, cách tạo UUID
+cũ mà bộ dữ liệu đang dùng) hoặc một trong `merged_uuids` / `merged_content_uuids` (đoạn đã gộp)
+nằm trong ground_truth_ids.
+
+Backend:
+  - local   : index cục bộ (LOCAL_INDEX_DIR), không cần mạng
+  - weaviate: Weaviate Cloud theo config
+  - replay  : phát lại các phản hồi đã ghi bằng --record (không cần mạng, không cần index, không tải model)
+    chỉ số chất lượng giống lần ghi; độ trễ chỉ còn phần xử lý cục bộ (fusion, gộp chunk, format)
+
+Cách dùng:
+    python scripts/bench_retrieval.py --backend local --top-k 1 3 5 10
+    python scripts/bench_retrieval.py --backend weaviate --record evaluate/recorded_responses.json
+    python scripts/bench_retrieval.py --replay evaluate/recorded_responses.json --compare evaluate/bench_results/old.json
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_DATASET = os.path.join(project_root, "evaluate/generated_dataset.jsonl")
+DEFAULT_OUTPUT_DIR = os.path.join(project_root, "evaluate/bench_results")
+SEARCH_TYPES = ("hybrid", "semantic", "keyword")
+PERCENTILES = (50, 95, 99)
+
+
+def load_dataset(path, limit=None):
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("question") and item.get("ground_truth_ids"):
+                questions.append({"question": item["question"], "ground_truth_ids": list(item["ground_truth_ids"])})
+            if limit and len(questions) >= limit:
+                break
+    return questions
+
+
+# ---------- Ghi / phát lại phản hồi của backend ----------
+class ResponseRecorder:
+    """Bọc `query_hybrid_alpha` / `get_query_embedding` của retriever để ghi lại mọi phản hồi."""
+
+    def __init__(self, retriever):
+        self.embeddings = {}
+        self.responses = {}
+        self._lock = threading.Lock()
+        query_fn, embed_fn = retriever.query_hybrid_alpha, retriever.get_query_embedding
+
+        def recording_query(query_text, vector, alpha, limit):
+            results = query_fn(query_text, vector, alpha, limit)
+            with self._lock:
+                self.responses[_response_key(query_text, alpha, limit)] = results
+            return results
+
+        def recording_embed(query, embedding_model, *args, **kwargs):
+            vector = embed_fn(query, embedding_model, *args, **kwargs)
+            with self._lock:
+                self.embeddings[query] = list(vector)
+            return vector
+
+        retriever.query_hybrid_alpha = recording_query
+        retriever.get_query_embedding = recording_embed
+
+    def save(self, path, meta):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "embeddings": self.embeddings, "responses": self.responses}, f, ensure_ascii=False)
+        print(f"Đã ghi {len(self.responses)} phản hồi, {len(self.embeddings)} embedding vào {path}")
+
+
+class ResponseReplayer:
+    """Thay backend của retriever bằng các phản hồi đã ghi; phản hồi có `limit` lớn hơn được cắt bớt khi cần."""
+
+    def __init__(self, retriever, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.meta = data.get("meta", {})
+        self.embeddings = data["embeddings"]
+        self.responses = {}
+        for key, results in data["responses"].items():
+            query_text, alpha, limit = json.loads(key)
+            self.responses.setdefault((query_text, float(alpha)), []).append((int(limit), results))
+
+        def replay_query(query_text, vector, alpha, limit):
+            candidates = sorted(self.responses.get((query_text, float(alpha)), []), key=lambda x: x[0])
+            for recorded_limit, results in candidates:
+                # phản hồi ghi với limit lớn hơn chứa đúng top-`limit` ở đầu (trừ khi backend trả về ít hơn)
+                if recorded_limit >= limit:
+                    return [dict(item) for item in results[:limit]]
+            raise KeyError(f"Không có phản hồi đã ghi cho alpha={alpha}, limit={limit}: {query_text[:60]}... "
+                           f"Hãy ghi lại bằng --record với cùng chế độ / top_k.")
+
+        def replay_embed(query, embedding_model, *args, **kwargs):
+            if query not in self.embeddings:
+                raise KeyError(f"Không có embedding đã ghi cho câu hỏi: {query[:60]}...")
+            return self.embeddings[query]
+
+        retriever.query_hybrid_alpha = replay_query
+        retriever.get_query_embedding = replay_embed
+
+
+def _response_key(query_text, alpha, limit):
+    return json.dumps([query_text, float(alpha), int(limit)], ensure_ascii=False)
+
+
+# ---------- Chỉ số chất lượng ----------
+def _content_uuid(content):
+    # giống generate_uuid(content) khi không có metadata (src/data_processing/ingestion_utils.py)
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, content))
+
+
+def result_ids(doc):
+    """Các id dùng để so khớp một kết quả với ground truth."""
+    ids = {doc.get("uuid"), doc.get("content_uuid")}
+    ids.update(doc.get("merged_uuids") or ())
+    ids.update(doc.get("merged_content_uuids") or ())
+    if not doc.get("content_uuid") and doc.get("content") and not doc.get("merged_uuids"):
+        # index tạo trước khi có property content_uuid
+        ids.add(_content_uuid(doc["content"]))
+    ids.discard(None)
+    return ids
+
+
+def score_ranking(docs, ground_truth_ids, k):
+    """recall@k, reciprocal rank và nDCG@k (độ liên quan nhị phân, mỗi id ground truth chỉ được tính một lần)."""
+    relevant = set(ground_truth_ids)
+    found = set()
+    dcg = 0.0
+    reciprocal_rank = 0.0
+    for rank, doc in enumerate(docs[:k], start=1):
+        new = (result_ids(doc) & relevant) - found
+        if not new:
+            continue
+        found |= new
+        dcg += 1.0 / math.log2(rank + 1)
+        if not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return {
+        "recall": len(found) / len(relevant) if relevant else 0.0,
+        "mrr": reciprocal_rank,
+        "ndcg": dcg / ideal if ideal else 0.0,
+        "hit": 1.0 if found else 0.0,
+    }
+
+
+def percentiles_ms(seconds):
+    values = np.array(seconds, dtype=np.float64) * 1000.0
+    if not len(values):
+        return None
+    out = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    out["mean"] = float(values.mean())
+    return out
+
+
+# ---------- Chạy benchmark ----------
+def run_config(retriever_fn, embedding_model, questions, search_type, top_k, quiet=True):
+    totals, stages, metrics = [], {}, []
+    errors = 0
+    for item in questions:
+        timings = {}
+        started = time.perf_counter()
+        try:
+            # retriever_fn in một dòng cho mỗi lời gọi; tắt đi để không lấn át báo cáo
+            with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                retrieved = retriever_fn(item["question"], embedding_model, search_type, top_k, timings=timings)
+        except Exception as e:
+            errors += 1
+            print(f"   ! Lỗi ({search_type}, top_k={top_k}): {e}")
+            continue
+        totals.append(time.perf_counter() - started)
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+        metrics.append(score_ranking(retrieved["docs"], item["ground_truth_ids"], top_k))
+
+    summary = {name: float(np.mean([m[name] for m in metrics])) if metrics else 0.0 for name in ("recall", "mrr", "ndcg", "hit")}
+    return {
+        "search_type": search_type,
+        "top_k": top_k,
+        "queries": len(metrics),
+        "errors": errors,
+        f"recall@{top_k}": summary["recall"],
+        "mrr": summary["mrr"],
+        f"ndcg@{top_k}": summary["ndcg"],
+        f"hit@{top_k}": summary["hit"],
+        "latency_ms": percentiles_ms(totals),
+        "stage_latency_ms": {stage: percentiles_ms(values) for stage, values in stages.items()},
+    }
+
+
+def print_report(runs):
+    print(f"\n{'chế độ':<9} {'k':>3} {'recall@k':>9} {'MRR':>7} {'nDCG@k':>7} {'hit@k':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  bước (p50 / p95 ms)")
+    for run in runs:
+        k = run["top_k"]
+        lat = run["latency_ms"] or {"p50": float("nan"), "p95": float("nan"), "p99": float("nan")}
+        stages = ", ".join(f"{name} {v['p50']:.1f}/{v['p95']:.1f}" for name, v in run["stage_latency_ms"].items())
+        print(f"{run['search_type']:<9} {k:>3} {run[f'recall@{k}']:>9.3f} {run['mrr']:>7.3f} {run[f'ndcg@{k}']:>7.3f} "
+              f"{run[f'hit@{k}']:>7.3f} {lat['p50']:>8.1f} {lat['p95']:>8.1f} {lat['p99']:>8.1f}  {stages}")
+        if run["errors"]:
+            print(f"{'':<13} ! {run['errors']} câu hỏi bị lỗi, không tính vào chỉ số")
+
+
+def print_comparison(runs, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["search_type"], r["top_k"]): r for r in json.load(f)["runs"]}
+    print(f"\nSo với {baseline_path} (mới - cũ):")
+    for run in runs:
+        k = run["top_k"]
+        old = baseline.get((run["search_type"], k))
+        if old is None:
+            continue
+        deltas = [f"{name} {run[name] - old[name]:+.3f}" for name in (f"recall@{k}", "mrr", f"ndcg@{k}")]
+        if run["latency_ms"] and old.get("latency_ms"):
+            deltas.append(f"p95 {run['latency_ms']['p95'] - old['latency_ms']['p95']:+.1f} ms")
+        print(f"   {run['search_type']:<9} k={k:<3} " + ", ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark truy xuất offline (recall@k, MRR, nDCG, độ trễ từng bước).")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--backend", choices=("local", "weaviate", "replay"), default="local")
+    parser.add_argument("--modes", nargs="+", choices=SEARCH_TYPES, default=list(SEARCH_TYPES))
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--limit", type=int, default=None, help="Chỉ dùng N câu hỏi đầu tiên.")
+    parser.add_argument("--warmup", type=int, default=3, help="Số câu hỏi chạy trước (không tính) để nạp model / index.")
+    parser.add_argument("--record", default=None, help="Ghi phản hồi của backend vào file JSON để phát lại offline.")
+    parser.add_argument("--replay", default=None, help="Phát lại phản hồi đã ghi (tương đương --backend replay).")
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định evaluate/bench_results/retrieval_<thời gian>.json).")
+    parser.add_argument("--compare", default=None, help="File JSON kết quả của lần chạy trước để so sánh.")
+    parser.add_argument("--verbose", action="store_true", help="Giữ lại log của retriever.")
+    args = parser.parse_args()
+    if args.replay:
+        args.backend = "replay"
+    if args.backend == "replay" and not args.replay:
+        parser.error("--backend replay cần --replay PATH")
+    if args.backend == "replay" and args.record:
+        parser.error("không thể vừa --replay vừa --record")
+
+    # config đọc biến môi trường lúc import: chọn backend trước khi import retriever
+    if args.backend == "local":
+        os.environ["RETRIEVAL_BACKEND"] = "local"
+        os.environ.setdefault("BM25_BACKEND", "local")
+    elif args.backend == "weaviate":
+        os.environ["RETRIEVAL_BACKEND"] = "weaviate"
+
+    import src.core.retriever as retriever
+    from src.core.config import EMBEDDING_MODEL_ID, MERGE_ADJACENT_CHUNKS
+
+    questions = load_dataset(args.dataset, args.limit)
+    if not questions:
+        raise SystemExit(f"Không có câu hỏi nào có ground_truth_ids trong {args.dataset}")
+    top_ks = sorted(set(k for k in args.top_k if k > 0))
+
+    recorder = None
+    if args.backend == "replay":
+        ResponseReplayer(retriever, args.replay)
+        embedding_model = None
+    else:
+        if args.record:
+            recorder = ResponseRecorder(retriever)
+        from src.core.embedding_model import load_embedding_model
+        from src.core.lazy import LazySingleton
+        # model chỉ được tải khi câu hỏi không trúng cache embedding
+        embedding_model = LazySingleton(load_embedding_model, "embedding_model")
+
+    print(f"{len(questions)} câu hỏi, backend {args.backend}, chế độ {args.modes}, top_k {top_ks}")
+    if args.warmup:
+        # nạp model / index / kết nối trước khi đo; với --record thì phản hồi lúc khởi động cũng được ghi
+        for item in questions[:args.warmup]:
+            for search_type in args.modes:
+                run_config(retriever.retriever_fn, embedding_model, [item], search_type, max(top_ks), quiet=not args.verbose)
+
+    started = time.perf_counter()
+    runs = []
+    for search_type in args.modes:
+        for k in top_ks:
+            runs.append(run_config(retriever.retriever_fn, embedding_model, questions, search_type, k, quiet=not args.verbose))
+    print_report(runs)
+    print(f"\nTổng thời gian: {time.perf_counter() - started:.1f}s")
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "dataset": os.path.relpath(os.path.abspath(args.dataset), project_root),
+        "questions": len(questions),
+        "backend": args.backend,
+        "replay_file": args.replay,
+        "embedding_model": EMBEDDING_MODEL_ID,
+        "merge_adjacent_chunks": MERGE_ADJACENT_CHUNKS,
+        "rrf_k": retriever.RRF_K,
+        "runs": runs,
+    }
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"retrieval_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {output}")
+
+    if recorder is not None:
+        recorder.save(args.record, {key: result[key] for key in ("created_at", "dataset", "backend", "embedding_model")})
+    if args.compare:
+        print_comparison(runs, args.compare)
+
+
+if __name__ == "__main__":
+    main()
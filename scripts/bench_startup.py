@@ -0,0 +1,68 @@
+"""
+Đo thời gian khởi động: import `src.core.chain` trong một tiến trình Python mới (như khi Streamlit
+chạy app.py lần đầu), và thời gian khởi tạo từng singleton nặng khi prewarm.
+
+Cách dùng:
+    python scripts/bench_startup.py --repeat 5
+    python scripts/bench_startup.py --repeat 3 --prewarm
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import json
+import statistics
+import subprocess
+
+# Đoạn mã chạy trong tiến trình con: in ra một dòng JSON cuối cùng
+CHILD_CODE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import src.core.chain as chain
+result = {{"import_seconds": time.perf_counter() - start}}
+if {prewarm!r}:
+    start = time.perf_counter()
+    result["prewarm"] = chain.prewarm()
+    result["prewarm_seconds"] = time.perf_counter() - start
+print("BENCH_RESULT " + json.dumps(result))
+"""
+
+
+def run_child(prewarm: bool) -> dict:
+    env = dict(os.environ, PREWARM_ON_STARTUP="false")
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(root=project_root, prewarm=prewarm)],
+        capture_output=True, text=True, env=env, cwd=project_root,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            return json.loads(line[len("BENCH_RESULT "):])
+    raise RuntimeError(f"Tiến trình con lỗi (mã {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động của pipeline RAG.")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần đo import (mỗi lần một tiến trình mới).")
+    parser.add_argument("--prewarm", action="store_true", help="Đo thêm thời gian khởi tạo từng singleton.")
+    args = parser.parse_args()
+
+    import_times = [run_child(False)["import_seconds"] for _ in range(args.repeat)]
+    print(f"[Import src.core.chain] {args.repeat} lần")
+    print(f"  median: {statistics.median(import_times) * 1000:8.1f} ms")
+    print(f"  min   : {min(import_times) * 1000:8.1f} ms")
+    print(f"  max   : {max(import_times) * 1000:8.1f} ms")
+
+    if args.prewarm:
+        result = run_child(True)
+        print(f"\n[Prewarm] tổng {result['prewarm_seconds']:.2f}s")
+        for name, item in result["prewarm"].items():
+            status = "ok" if item["ok"] else f"lỗi: {item['error']}"
+            print(f"  {name:<20}: {item['seconds'] * 1000:8.1f} ms  ({status})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark giai đoạn scrape của web_search_fn trên một HTTP server stub cục bộ (không cần mạng).
+
+So sánh:
+  - cách cũ: requests.get mới cho từng trang, tuần tự, parse bằng BeautifulSoup
+  - cách mới: scrape_urls_parallel (session dùng chung, song song, có deadline), parse bằng lxml.html
+
+Cách dùng:
+    python scripts/bench_web_scraping.py --pages 3 --delay 0.5 --paragraphs 400
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from bs4 import BeautifulSoup
+
+# Benchmark không gọi Google nên chỉ cần giá trị giả cho các khoá bắt buộc
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+os.environ.setdefault("GOOGLE_CSE_ID", "bench")
+from src.core.web_search import extract_meaningful_text, scrape_urls_parallel
+
+PARAGRAPH = (
+    "Chiến thắng Bạch Đằng năm 938 do Ngô Quyền lãnh đạo đã chấm dứt hơn một nghìn năm Bắc thuộc, "
+    "mở ra thời kỳ độc lập tự chủ lâu dài của dân tộc Việt Nam."
+)
+
+
+def make_html(paragraphs: int) -> bytes:
+    body = "".join(
+        f"<div class='row'><p>{PARAGRAPH} <a href='#'>[{i}]</a></p><span>menu {i}</span></div>" for i in range(paragraphs)
+    )
+    return f"<html><head><title>stub</title><script>var x = 1;</script></head><body>{body}</body></html>".encode("utf-8")
+
+
+def start_stub_server(html: bytes, delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(html)))
+                self.end_headers()
+                self.wfile.write(html)
+            except (BrokenPipeError, ConnectionResetError):
+                # client đã bỏ request do hết deadline
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_scrape(url: str) -> str:
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, "lxml")
+    paragraphs = [p.get_text() for p in soup.find_all("p")]
+    return " ".join(p for p in paragraphs if len(p.split()) > 10).strip()
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scrape web với server stub cục bộ.")
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=0.5, help="Độ trễ giả lập của mỗi trang (giây).")
+    parser.add_argument("--paragraphs", type=int, default=400, help="Số thẻ <p> trong mỗi trang.")
+    parser.add_argument("--deadline", type=float, default=6.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    html = make_html(args.paragraphs)
+    server = start_stub_server(html, args.delay)
+    urls = [f"http://127.0.0.1:{server.server_address[1]}/page/{i}" for i in range(args.pages)]
+    print(f"Server stub: {len(urls)} trang, mỗi trang {len(html) / 1024:.0f} KB, trễ {args.delay}s")
+
+    html_text = html.decode("utf-8")
+    bs4_time, bs4_text = timed(lambda: " ".join(
+        p for p in (p.get_text() for p in BeautifulSoup(html_text, "lxml").find_all("p")) if len(p.split()) > 10
+    ).strip(), args.repeat)
+    lxml_time, lxml_text = timed(lambda: extract_meaningful_text(html_text), args.repeat)
+    print("\n[Parse một trang]")
+    print(f"  BeautifulSoup : {bs4_time * 1000:8.1f} ms")
+    print(f"  lxml.html     : {lxml_time * 1000:8.1f} ms  (x{bs4_time / lxml_time:.1f}, cùng kết quả: {bs4_text == lxml_text})")
+
+    legacy_time, _ = timed(lambda: [legacy_scrape(u) for u in urls], args.repeat)
+    parallel_time, contents = timed(lambda: scrape_urls_parallel(urls, deadline=args.deadline), args.repeat)
+    print(f"\n[Scrape {len(urls)} trang]")
+    print(f"  Tuần tự (cũ)  : {legacy_time * 1000:8.1f} ms")
+    print(f"  Song song     : {parallel_time * 1000:8.1f} ms  (x{legacy_time / parallel_time:.1f}, "
+          f"{sum(1 for c in contents if c)}/{len(urls)} trang có nội dung)")
+
+    short_deadline = args.delay / 2
+    late_time, late_contents = timed(lambda: scrape_urls_parallel(urls, deadline=short_deadline), 1)
+    print(f"\n[Deadline {short_deadline:.2f}s < độ trễ trang]")
+    print(f"  Trả về sau    : {late_time * 1000:8.1f} ms, {sum(1 for c in late_contents if c)} trang (trang về muộn bị bỏ)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Hiệu chỉnh ngưỡng cho quality gate cục bộ (QUALITY_GATE_MODE=score/classifier)
+trên evaluate/generated_dataset.jsonl.
+
+Với mỗi câu hỏi, chạy retriever_fn và gán nhãn "context hữu ích" nếu top_k chứa ít nhất
+một ground_truth_id. Sau đó chọn ngưỡng sao cho vùng GOOD đạt precision mong muốn
+(không gọi web search khi không cần) và vùng BAD hiếm khi chứa câu hỏi đã truy xuất đúng.
+
+Cách dùng:
+    python scripts/calibrate_quality_gate.py --search-type hybrid --top-k 5
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import json
+
+import numpy as np
+
+from src.core.config import QUALITY_GATE_THRESHOLDS_PATH
+from src.core.quality_gate import DEFAULT_THRESHOLDS, FEATURE_NAMES, signal_features
+
+AGREEMENT_GRID = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5]
+
+
+def doc_ids(doc):
+    """
+    Id so khớp với ground_truth_ids (UUID theo nội dung): `content_uuid` (cả của các chunk trong đoạn đã gộp),
+    hoặc `uuid` với index tạo trước khi có property này.
+    """
+    ids = {doc.get("uuid"), doc.get("content_uuid"), *(doc.get("merged_content_uuids") or ())}
+    ids.discard(None)
+    return ids
+
+
+def load_dataset(path):
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+def collect_signals(dataset, embedding_model, search_type, top_k):
+    from src.core.retriever import retriever_fn
+
+    samples = []
+    for i, row in enumerate(dataset):
+        retrieved = retriever_fn(row["question"], embedding_model, search_type=search_type, top_k=top_k)
+        # chỉ tính các tài liệu thực sự được đưa vào context (sources)
+        source_uuids = {s.get("uuid") for s in retrieved["sources"]}
+        retrieved_ids = set().union(*(doc_ids(d) for d in retrieved["docs"] if d.get("uuid") in source_uuids))
+        hit = bool(retrieved_ids & set(row.get("ground_truth_ids", [])))
+        samples.append({"signals": retrieved["signals"], "hit": hit})
+        print(f"[{i + 1}/{len(dataset)}] hit={hit} signals={retrieved['signals']}")
+    return samples
+
+
+def pick_good_threshold(values, hits, target_precision, extra_mask=None):
+    """Ngưỡng nhỏ nhất (phủ nhiều câu nhất) mà precision của vùng value >= ngưỡng đạt mục tiêu."""
+    best = None
+    for t in sorted(set(values)):
+        mask = values >= t
+        if extra_mask is not None:
+            mask &= extra_mask
+        if mask.sum() == 0:
+            continue
+        precision = hits[mask].mean()
+        if precision >= target_precision:
+            coverage = mask.mean()
+            if best is None or coverage > best[1]:
+                best = (float(t), float(coverage), float(precision))
+    return best
+
+
+def pick_bad_threshold(values, hits, max_hit_rate):
+    """Ngưỡng lớn nhất mà trong vùng value < ngưỡng, tỉ lệ câu truy xuất đúng không vượt quá `max_hit_rate`."""
+    best = float(values.min()) if values.size else 0.0
+    for t in sorted(set(values)):
+        mask = values < t
+        if mask.sum() == 0:
+            continue
+        if hits[mask].mean() <= max_hit_rate:
+            best = float(t)
+    return best
+
+
+def fit_logistic(X, y, lr=0.5, epochs=3000, l2=1e-3):
+    """Hồi quy logistic nhỏ bằng gradient descent (đủ cho 3 đặc trưng, không cần thêm thư viện)."""
+    w = np.zeros(X.shape[1])
+    b = 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(X @ w + b)))
+        grad_w = X.T @ (p - y) / len(y) + l2 * w
+        grad_b = float(np.mean(p - y))
+        w -= lr * grad_w
+        b -= lr * grad_b
+    return w, b
+
+
+def calibrate(samples, target_precision, bad_max_hit_rate):
+    hits = np.array([s["hit"] for s in samples], dtype=bool)
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    report = {"n": len(samples), "hit_rate": float(hits.mean()) if len(samples) else 0.0}
+
+    sims = np.array([s["signals"].get("top_vector_similarity") or 0.0 for s in samples])
+    agrees = np.array([
+        s["signals"]["leg_agreement"] if s["signals"].get("leg_agreement") is not None else 1.0 for s in samples
+    ])
+    best = None
+    for agreement in AGREEMENT_GRID:
+        candidate = pick_good_threshold(sims, hits, target_precision, extra_mask=agrees >= agreement)
+        if candidate and (best is None or candidate[1] > best[1][1]):
+            best = (agreement, candidate)
+    if best:
+        thresholds["good_agreement"] = best[0]
+        thresholds["good_similarity"] = best[1][0]
+        report["good_coverage"], report["good_precision"] = best[1][1], best[1][2]
+    thresholds["bad_similarity"] = min(pick_bad_threshold(sims, hits, bad_max_hit_rate), thresholds["good_similarity"])
+
+    rrfs = np.array([s["signals"].get("top_rrf_score") or 0.0 for s in samples])
+    if rrfs.any():
+        good_rrf = pick_good_threshold(rrfs, hits, target_precision)
+        if good_rrf:
+            thresholds["good_rrf"] = good_rrf[0]
+        thresholds["bad_rrf"] = min(pick_bad_threshold(rrfs, hits, bad_max_hit_rate), thresholds["good_rrf"])
+
+    classifier = None
+    if 0 < hits.sum() < len(hits):
+        X = np.array([signal_features(s["signals"]) for s in samples])
+        w, b = fit_logistic(X, hits.astype(float))
+        probs = 1.0 / (1.0 + np.exp(-(X @ w + b)))
+        classifier = {"features": FEATURE_NAMES, "weights": [float(v) for v in w], "bias": float(b)}
+        good_prob = pick_good_threshold(probs, hits, target_precision)
+        if good_prob:
+            thresholds["classifier_good_prob"] = good_prob[0]
+        thresholds["classifier_bad_prob"] = min(
+            pick_bad_threshold(probs, hits, bad_max_hit_rate), thresholds["classifier_good_prob"]
+        )
+    else:
+        print("   ! Tập dữ liệu chỉ có một loại nhãn, bỏ qua huấn luyện classifier.")
+
+    return {"thresholds": thresholds, "classifier": classifier, "report": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hiệu chỉnh ngưỡng quality gate cục bộ.")
+    parser.add_argument("--dataset", default=os.path.join(project_root, "evaluate/generated_dataset.jsonl"))
+    parser.add_argument("--search-type", default="hybrid", choices=["hybrid", "semantic", "keyword"])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--target-precision", type=float, default=0.9,
+                        help="Precision tối thiểu của vùng GOOD (tỉ lệ câu có ground truth trong top_k).")
+    parser.add_argument("--bad-max-hit-rate", type=float, default=0.3,
+                        help="Tỉ lệ tối đa câu truy xuất đúng bị xếp vào vùng BAD.")
+    parser.add_argument("--output", default=QUALITY_GATE_THRESHOLDS_PATH)
+    args = parser.parse_args()
+
+    from src.core.embedding_model import load_embedding_model
+
+    dataset = load_dataset(args.dataset)
+    print(f"Đã đọc {len(dataset)} câu hỏi từ {args.dataset}")
+    print("Đang tải model embedding...")
+    embedding_model = load_embedding_model()
+
+    samples = collect_signals(dataset, embedding_model, args.search_type, args.top_k)
+    result = calibrate(samples, args.target_precision, args.bad_max_hit_rate)
+    result["report"].update({"search_type": args.search_type, "top_k": args.top_k, "dataset": args.dataset})
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Đã lưu ngưỡng vào {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+So sánh encoder ONNX int8 với model fp32 (SentenceTransformer):
+  - độ lệch embedding: cosine giữa hai vector của cùng một câu hỏi / đoạn văn
+  - retrieval: với các câu hỏi trong evaluate/generated_dataset.jsonl, trên tập chunk của index cục bộ,
+    tỉ lệ top-k của fp32 được int8 giữ lại (overlap@k) và recall ground truth @k của từng model
+  - tốc độ encode câu truy vấn và RAM tăng thêm khi nạp model
+
+Cần index cục bộ (RETRIEVAL_BACKEND=local khi ingest) để có nội dung chunk.
+
+Cách dùng:
+    python scripts/check_onnx_parity.py --corpus-size 3000 --top-k 5
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+
+import numpy as np
+
+from src.core.config import LOCAL_INDEX_DIR
+from src.core.local_index import load_chunk_metadata
+from src.core.memory_stats import process_memory
+
+
+def load_dataset(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ground_truth_id(record):
+    """ground_truth_ids là UUID theo nội dung (`content_uuid`), không phải `uuid` (nội dung + metadata) của chunk."""
+    return record.get("content_uuid") or str(uuid.uuid5(uuid.NAMESPACE_DNS, record.get("content") or ""))
+
+
+def build_corpus(records, dataset, size, seed):
+    """Lấy mẫu `size` chunk, luôn gồm các chunk ground truth của tập câu hỏi."""
+    wanted = {gid for row in dataset for gid in row.get("ground_truth_ids", [])}
+    must = [r for r in records if ground_truth_id(r) in wanted]
+    rest = [r for r in records if ground_truth_id(r) not in wanted]
+    random.Random(seed).shuffle(rest)
+    return must + rest[:max(0, size - len(must))]
+
+
+def load_model_timed(loader):
+    rss_before = process_memory()["rss_mb"]
+    start = time.perf_counter()
+    model = loader()
+    seconds = time.perf_counter() - start
+    rss_after = process_memory()["rss_mb"]
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return model, seconds, rss_delta
+
+
+def query_latency_ms(model, questions, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        for q in questions:
+            start = time.perf_counter()
+            model.encode(q)
+            samples.append((time.perf_counter() - start) * 1000.0)
+    return statistics.median(samples), float(np.percentile(samples, 95))
+
+
+def top_k_ids(query_vectors, corpus_vectors, ids, k):
+    scores = query_vectors @ corpus_vectors.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [[ids[j] for j in row] for row in top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra độ khớp giữa encoder ONNX int8 và model fp32.")
+    parser.add_argument("--dataset", default=os.path.join(project_root, "evaluate/generated_dataset.jsonl"))
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--corpus-size", type=int, default=3000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Ngưỡng cosine trung bình để coi là đạt.")
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="Ngưỡng overlap@k trung bình để coi là đạt.")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from src.core.config import embedding_model_name
+    from src.core.onnx_encoder import OnnxEmbeddingEncoder
+
+    dataset = load_dataset(args.dataset)
+    questions = [row["question"] for row in dataset]
+    corpus = build_corpus(load_chunk_metadata(args.index_dir), dataset, args.corpus_size, args.seed)
+    texts = [r["content"] for r in corpus]
+    ids = [ground_truth_id(r) for r in corpus]
+    print(f"{len(questions)} câu hỏi, {len(texts)} chunk.")
+
+    fp32, fp32_load, fp32_rss = load_model_timed(lambda: SentenceTransformer(embedding_model_name))
+    int8, int8_load, int8_rss = load_model_timed(OnnxEmbeddingEncoder)
+
+    q32 = np.asarray(fp32.encode(questions, batch_size=args.batch_size, normalize_embeddings=True), dtype=np.float32)
+    q8 = np.asarray(int8.encode(questions, batch_size=args.batch_size), dtype=np.float32)
+    c32 = np.asarray(fp32.encode(texts, batch_size=args.batch_size, normalize_embeddings=True, show_progress_bar=True), dtype=np.float32)
+    c8 = np.asarray(int8.encode(texts, batch_size=args.batch_size), dtype=np.float32)
+
+    query_cos = np.sum(q32 * q8, axis=1)
+    chunk_cos = np.sum(c32 * c8, axis=1)
+
+    top32 = top_k_ids(q32, c32, ids, args.top_k)
+    top8 = top_k_ids(q8, c8, ids, args.top_k)
+    overlap = [len(set(a) & set(b)) / args.top_k for a, b in zip(top32, top8)]
+
+    def gt_recall(tops):
+        values = []
+        for row, top in zip(dataset, tops):
+            gt = set(row.get("ground_truth_ids", []))
+            if gt:
+                values.append(len(gt & set(top)) / min(len(gt), args.top_k))
+        return float(np.mean(values)) if values else None
+
+    fp32_latency = query_latency_ms(fp32, questions[:50])
+    int8_latency = query_latency_ms(int8, questions[:50])
+
+    report = {
+        "cosine_query": {"mean": float(query_cos.mean()), "min": float(query_cos.min())},
+        "cosine_chunk": {"mean": float(chunk_cos.mean()), "min": float(chunk_cos.min())},
+        f"overlap@{args.top_k}": float(np.mean(overlap)),
+        f"recall@{args.top_k}": {"fp32": gt_recall(top32), "int8": gt_recall(top8)},
+        "query_latency_ms": {
+            "fp32": {"p50": fp32_latency[0], "p95": fp32_latency[1]},
+            "int8": {"p50": int8_latency[0], "p95": int8_latency[1]},
+        },
+        "load": {
+            "fp32": {"seconds": fp32_load, "rss_delta_mb": fp32_rss},
+            "int8": {"seconds": int8_load, "rss_delta_mb": int8_rss},
+        },
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    passed = report["cosine_query"]["mean"] >= args.min_cosine and report[f"overlap@{args.top_k}"] >= args.min_overlap
+    print("ĐẠT" if passed else "KHÔNG ĐẠT", f"(cosine >= {args.min_cosine}, overlap@{args.top_k} >= {args.min_overlap})")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
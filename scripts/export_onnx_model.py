@@ -0,0 +1,33 @@
+"""
+Xuất model embedding (src/core/config.py::embedding_model_name) sang ONNX và lượng tử hoá động int8.
+
+Cách dùng:
+    python scripts/export_onnx_model.py
+    python scripts/export_onnx_model.py --output-dir models/onnx/qwen3 --no-quantize
+Sau đó đặt EMBEDDING_BACKEND=onnx (và ONNX_MODEL_DIR nếu đổi thư mục).
+"""
+import sys
+import os
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import argparse
+
+from src.core.config import embedding_model_name, ONNX_MODEL_DIR
+from src.core.onnx_encoder import export_onnx
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuất model embedding sang ONNX (int8).")
+    parser.add_argument("--model", default=embedding_model_name)
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-quantize", action="store_true", help="Chỉ xuất fp32, không lượng tử hoá.")
+    args = parser.parse_args()
+
+    export_onnx(args.model, args.output_dir, opset=args.opset, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,240 @@
+"""
+Trích xuất PDF -> chunk -> embedding -> nạp vào Weaviate và/hoặc index cục bộ.
+
+Các bước chạy dạng streaming, song song với nhau và nối bằng hàng đợi có giới hạn
+(src/data_processing/streaming.py): chunk được embed và nạp ngay khi file tương ứng trích xuất xong,
+nên bộ nhớ không tăng theo kích thước thư viện.
+
+Ingest tăng dần theo manifest (INGEST_MANIFEST_PATH): chỉ file PDF mới hoặc có nội dung / config entry /
+tham số chunk thay đổi mới được xử lý lại; chunk cũ của file thay đổi hoặc đã bị xoá được xoá theo UUID.
+
+Cách dùng:
+    python scripts/ingest_data.py              # ingest tăng dần
+    python scripts/ingest_data.py --dry-run    # chỉ in ra những gì sẽ thay đổi
+    python scripts/ingest_data.py --full       # bỏ qua manifest, xử lý lại toàn bộ
+"""
 import sys
 import os
 script_dir = os.path.dirname(os.path.abspath(__file__)) # Lấy đường dẫn thư mục 'scripts'
 project_root = os.path.dirname(script_dir) # Đi ngược lên một cấp để lấy thư mục gốc
-sys.path.append(project_root) 
+sys.path.append(project_root)
 
-from src.core.weaviate_client import client
-from src.data_processing.extract_pdf import process_all_pdfs_in_directory
+import argparse
+import time
 from pathlib import Path
-from src.data_processing.ingestion_utils import embedd_chunks, load_data_to_weaviate
-from sentence_transformers import SentenceTransformer
-from src.core.config import class_name
-
-# tạo collection trên weaviate
-if client.collections.exists(class_name):
-    print(f"Collection '{class_name}' đã tồn tại. Đang tải về...")
-    collection = client.collections.get(class_name)
-    print(f"Collection '{class_name}' đã được tải thành công.")
-else:
-    print(f"Đang tạo collection cho class '{class_name}'...")
-    collection = client.collections.create(name=class_name, vector_config= None)
-    print("Collections đã được tạo thành công.")
 
+from src.data_processing.extract_pdf import iter_pdf_chunks, load_config, find_config_for_filename, get_correction_engine
+from src.data_processing.ingestion_utils import (iter_embedded_batches, load_data_to_weaviate, LocalIndexSink,
+                                                 delete_from_weaviate, generate_uuid)
+from src.data_processing.ingest_manifest import IngestManifest, print_plan, json_hash
+from src.data_processing.streaming import background_stage, fan_out
+from src.core.memory_stats import process_memory
+from src.core.lazy import LazySingleton
+from src.core.config import (class_name, EMBEDDING_MODEL_ID, RETRIEVAL_BACKEND, BM25_BACKEND, LOCAL_INDEX_DIR, INGEST_MANIFEST_PATH,
+                             CHUNK_EMBEDDING_STORE_DIR, INGEST_FAILURE_REPORT_PATH)
 
 base_dir = Path("/home/misa/history-chatbot")
 
-# extract và làm sạch data
-pdf_directory = base_dir / "data/raw data"
-output_directory = base_dir / "data/clean data"
-config_path = base_dir  / "src/data_processing/config_extract_data.json"
+CHUNK_SIZE_WORDS = 512
+CHUNK_OVERLAP_WORDS = 128
+CHUNK_BY_SENTENCE = False  # True = biên chunk bám theo cuối / đầu câu
+DEFAULT_START_PAGE = 1
+DEFAULT_END_PAGE = None   # None = tới cuối file
+EMBED_BATCH_SIZE = 32
+QUEUE_SIZE = 8            # số batch tối đa chờ giữa hai stage
+# Cách tạo UUID của chunk (generate_uuid): đổi cách tạo thì mọi file được xử lý lại và object cũ bị xoá
+UUID_SCHEME = "content+metadata"
+
+
+def get_collection():
+    from src.core.weaviate_client import get_client
+    client = get_client()
+
+    # tạo collection trên weaviate
+    if client.collections.exists(class_name):
+        print(f"Collection '{class_name}' đã tồn tại. Đang tải về...")
+        collection = client.collections.get(class_name)
+        print(f"Collection '{class_name}' đã được tải thành công.")
+    else:
+        print(f"Đang tạo collection cho class '{class_name}'...")
+        collection = client.collections.create(name=class_name, vector_config= None)
+        print("Collections đã được tạo thành công.")
+    return collection
+
+
+def replay_failures(report_path):
+    """Nạp lại các object trong báo cáo lỗi; object vẫn lỗi được ghi lại vào chính báo cáo đó."""
+    from src.data_processing.bulk_loader import AdaptiveBulkLoader, read_failure_report
+
+    if not os.path.exists(report_path):
+        print(f"Không có báo cáo lỗi tại {report_path}.")
+        return
+    items = list(read_failure_report(report_path))
+    print(f"Đang nạp lại {len(items)} object từ {report_path}...")
+    tmp_path = report_path + ".retry"
+    report = AdaptiveBulkLoader(get_collection(), failure_report_path=tmp_path).load(items)
+    report.print_summary()
+    if report.failed:
+        os.replace(tmp_path, report_path)
+    else:
+        os.remove(report_path)
+        print("Đã nạp lại toàn bộ, xoá báo cáo lỗi.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDF vào Weaviate / index cục bộ (tăng dần theo manifest).")
+    parser.add_argument("--pdf-dir", default=str(base_dir / "data/raw data"))
+    parser.add_argument("--output-dir", default=str(base_dir / "data/clean data"))
+    parser.add_argument("--config", default=str(base_dir / "src/data_processing/config_extract_data.json"))
+    parser.add_argument("--manifest", default=INGEST_MANIFEST_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in ra file mới / thay đổi / bị xoá, không ghi gì.")
+    parser.add_argument("--full", action="store_true", help="Bỏ qua manifest, xử lý lại toàn bộ file.")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình trích xuất PDF.")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--no-embedding-store", action="store_true",
+                        help="Không dùng store embedding theo nội dung (CHUNK_EMBEDDING_STORE_DIR), embed lại mọi chunk.")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Số batch tối đa chờ giữa hai stage.")
+    parser.add_argument("--failure-report", default=INGEST_FAILURE_REPORT_PATH,
+                        help="File JSONL ghi các object không nạp được vào Weaviate.")
+    parser.add_argument("--replay-failures", action="store_true",
+                        help="Chỉ nạp lại các object trong --failure-report rồi thoát.")
+    args = parser.parse_args()
+
+    if args.replay_failures:
+        replay_failures(args.failure_report)
+        return
+
+    # Tham số ảnh hưởng tới chunk / vector: đổi bất kỳ giá trị nào thì mọi file đều được xử lý lại
+    params = {
+        "chunk_size_words": CHUNK_SIZE_WORDS,
+        "chunk_overlap_words": CHUNK_OVERLAP_WORDS,
+        "chunk_by_sentence": CHUNK_BY_SENTENCE,
+        "default_start_page": DEFAULT_START_PAGE,
+        "default_end_page": DEFAULT_END_PAGE,
+        "embedding_model": EMBEDDING_MODEL_ID,
+        "uuid_scheme": UUID_SCHEME,
+        # bảng tra sửa lỗi (CORRECTION_MAP + từ điển ngoài) quyết định nội dung chunk
+        "corrections": json_hash(get_correction_engine().mapping),
+    }
+
+    config = load_config(args.config)
+    pdf_files = sorted(f for f in os.listdir(args.pdf_dir) if f.lower().endswith(".pdf"))
+    config_entries = {f: find_config_for_filename(f, config)[1] for f in pdf_files}
+
+    manifest = IngestManifest(args.manifest)
+    if args.full:
+        manifest.files = {name: {"uuids": entry.get("uuids", [])} for name, entry in manifest.files.items()}
+    plan = manifest.plan(args.pdf_dir, pdf_files, config_entries, params)
+    print_plan(plan, manifest)
+
+    to_process = plan["new"] + plan["changed"]
+    if args.dry_run:
+        print("\n(dry-run: không thay đổi gì)")
+        return
+    if not to_process and not plan["removed"]:
+        print("\nKhông có gì thay đổi.")
+        return
+
+    use_local = RETRIEVAL_BACKEND == "local" or BM25_BACKEND == "local"
+    use_weaviate = RETRIEVAL_BACKEND != "local"
+    collection = get_collection() if use_weaviate else None
+    # index cục bộ (vector memory-mapped + BM25) cho chế độ offline / nhánh từ khoá cục bộ
+    local_sink = LocalIndexSink(LOCAL_INDEX_DIR, model_name=EMBEDDING_MODEL_ID) if use_local else None
+
+    new_uuids_by_file = {}
+    upload_failed = 0
+    if to_process:
+        from src.core.embedding_model import load_embedding_model
+        store = None
+        if CHUNK_EMBEDDING_STORE_DIR and not args.no_embedding_store:
+            from src.core.chunk_embedding_store import ChunkEmbeddingStore
+            store = ChunkEmbeddingStore(CHUNK_EMBEDDING_STORE_DIR, model_name=EMBEDDING_MODEL_ID)
+            print(f"Store embedding: {store.dir} ({len(store)} vector).")
+            # model chỉ được tải khi có chunk chưa có trong store
+            embedding_model = LazySingleton(load_embedding_model, "embedding_model")
+        else:
+            print("Đang tải model embedding...")
+            embedding_model = load_embedding_model()
+            print("Tải model thành công.")
+
+        counts = {"extracted": 0, "embedded": 0}
+
+        def extract_stage():
+            # extrac từ file pdf và làm sạch, chunking data
+            for c in iter_pdf_chunks(
+                args.pdf_dir,
+                args.output_dir,
+                config_path=args.config,
+                default_start_page=DEFAULT_START_PAGE,
+                default_end_page=DEFAULT_END_PAGE,
+                chunk_size_words=CHUNK_SIZE_WORDS,
+                chunk_overlap_words=CHUNK_OVERLAP_WORDS,
+                sentence_aware=CHUNK_BY_SENTENCE,
+                max_workers=args.workers,
+                only_files=to_process,
+            ):
+                new_uuids_by_file.setdefault(c["metadata"]["file"], []).append(generate_uuid(c["text"], c["metadata"]))
+                counts["extracted"] += 1
+                yield c
+
+        def embed_stage(chunks):
+            for batch in iter_embedded_batches(chunks, embedding_model, batch_size=args.embed_batch_size, store=store):
+                counts["embedded"] += len(batch)
+                yield batch
+
+        # trích xuất -> (hàng đợi chunk) -> embedding -> (hàng đợi batch) -> nạp vào từng đích song song
+        started = time.perf_counter()
+        chunks = background_stage(extract_stage(), maxsize=args.queue_size * args.embed_batch_size, name="extract")
+        batches = background_stage(embed_stage(chunks), maxsize=args.queue_size, name="embed")
+        objects = (obj for batch in batches for obj in batch)
+        sinks = []
+        if local_sink is not None:
+            sinks.append(local_sink.write)
+        if collection is not None:
+            sinks.append(lambda stream: load_data_to_weaviate(stream, collection, failure_report_path=args.failure_report))
+        results = fan_out(objects, sinks, maxsize=args.queue_size * args.embed_batch_size)
+        if collection is not None:
+            upload_failed = results[-1]
 
-print("Đang tải model embedding...")
-embedding_model = SentenceTransformer("Qwen/Qwen3-Embedding-0.6B")
-print("Tải model thành công.")
+        elapsed = time.perf_counter() - started
+        memory = process_memory()
+        print(f"\n--- Pipeline: {counts['extracted']} chunk trích xuất, {counts['embedded']} chunk embed/nạp trong "
+              f"{elapsed:.1f}s ({counts['embedded'] / elapsed if elapsed else 0:.1f} chunk/s), "
+              f"RSS đỉnh {memory['peak_rss_mb']:.0f} MB ---")
+        if store is not None:
+            store_stats = store.stats()
+            print(f"   Store embedding: {store_stats['hits']} chunk có sẵn, {store_stats['misses']} chunk embed mới "
+                  f"(tổng {store_stats['size']} vector).")
 
-# extrac từ file pdf và làm sạch, chunking data
-chunks = process_all_pdfs_in_directory(
-    pdf_directory,
-    output_directory,
-    config_path=config_path,
-    default_start_page=1,
-    default_end_page=None,   # None = tới cuối file
-    chunk_size_words=512,
-    chunk_overlap_words=128
-)
-chunks_with_embeddings = embedd_chunks(chunks, embedding_model)
-load_data_to_weaviate(chunks_with_embeddings, collection)
+    # File trích xuất lỗi (hoặc không có chunk nào) giữ nguyên chunk cũ và trạng thái manifest, lần chạy sau sẽ thử lại
+    failed = [f for f in to_process if f not in new_uuids_by_file]
+    if failed:
+        print(f"   ! Không trích xuất được {len(failed)} file, giữ nguyên dữ liệu cũ: {', '.join(failed)}")
+    processed = [f for f in to_process if f in new_uuids_by_file]
 
+    # UUID cũ không còn xuất hiện trong lần xử lý mới (chunk trùng UUID đã được ghi đè)
+    keep_uuids = {u for uuids in new_uuids_by_file.values() for u in uuids}
+    keep_uuids.update(manifest.uuids_for(plan["unchanged"] + failed))
+    stale_uuids = [u for u in manifest.uuids_for(processed + plan["removed"]) if u not in keep_uuids]
 
+    # Chunk cũ chỉ bị xoá sau khi chunk mới đã được nạp
+    if local_sink is not None:
+        # --full dựng lại toàn bộ index nhưng vẫn giữ chunk cũ của các file trích xuất lỗi (giống Weaviate và manifest)
+        local_sink.finish(keep_existing=True, drop_uuids=stale_uuids, keep_uuids=keep_uuids if args.full else None)
+    if upload_failed:
+        # nạp lỗi một phần: giữ chunk cũ (không xoá gì) để collection không bị hổng, lần chạy sau sẽ thử lại
+        print("   ! Có chunk nạp lỗi: không xoá chunk cũ khỏi Weaviate, manifest không được cập nhật cho các file "
+              "vừa xử lý / đã xoá, lần chạy sau sẽ thử lại.")
+    else:
+        if collection is not None and stale_uuids:
+            delete_from_weaviate(collection, stale_uuids)
+        for filename in processed:
+            manifest.record(filename, plan["fingerprints"][filename], new_uuids_by_file[filename])
+        for filename in plan["removed"]:
+            manifest.forget(filename)
+    manifest.save()
+    print(f"Đã cập nhật manifest: {args.manifest}")
 
 
+if __name__ == "__main__":
+    main()
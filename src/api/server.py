@@ -0,0 +1,107 @@
+"""
+API HTTP bất đồng bộ cho RAG chain (ngoài giao diện Streamlit trong app.py).
+
+Endpoint:
+    POST /chat          -> {"answer": ..., "elapsed_ms": ...}
+    POST /chat/stream   -> stream text/plain từng token, danh sách nguồn ở cuối
+    GET  /stats         -> thống kê micro-batcher (thời gian chờ hàng đợi), cache, bộ nhớ tiến trình
+    GET  /health
+
+Embedding câu truy vấn của các request đồng thời được gom lại bởi MicroBatchEncoder
+(EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH_SIZE).
+
+Cách chạy:
+    python -m src.api.server --port 8000
+    uvicorn src.api.server:app --host 0.0.0.0 --port 8000
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import argparse
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from src.core.config import API_HOST, API_PORT, EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH_SIZE, PREWARM_ON_STARTUP
+from src.core.chain import set_query_encoder
+from src.core.micro_batcher import MicroBatchEncoder
+from src.core.resources import get_registry
+
+
+class ChatRequest(BaseModel):
+    question: str
+    llm_choice: str = "gemini"
+    search_type: str = Field("hybrid", pattern="^(hybrid|semantic|keyword)$")
+    top_k: int = Field(5, ge=1, le=20)
+    chat_history: str = ""
+    use_web_search: bool = False
+
+
+class ChatResponse(BaseModel):
+    answer: str
+    elapsed_ms: float
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry = get_registry()
+    batcher = MicroBatchEncoder(
+        registry.embedding_model, window_ms=EMBED_BATCH_WINDOW_MS, max_batch_size=EMBED_MAX_BATCH_SIZE
+    )
+    set_query_encoder(batcher)
+    if PREWARM_ON_STARTUP:
+        registry.warm(background=True)
+    app.state.registry = registry
+    app.state.batcher = batcher
+    try:
+        yield
+    finally:
+        set_query_encoder(None)
+        batcher.close()
+        registry.shutdown()
+
+
+app = FastAPI(title="Chatbot Lịch sử Việt Nam", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    start = time.perf_counter()
+    answer = await app.state.registry.rag_chain.ainvoke(request.model_dump())
+    return ChatResponse(answer=answer, elapsed_ms=(time.perf_counter() - start) * 1000.0)
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    return StreamingResponse(
+        app.state.registry.astream_rag_answer(request.model_dump()),
+        media_type="text/plain; charset=utf-8",
+    )
+
+
+@app.get("/stats")
+async def stats():
+    return {"embedding_batcher": app.state.batcher.stats(), **app.state.registry.stats()}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Chạy API server cho RAG chain.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+from src.core.config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL,
+    INGESTION_VERSION,
+)
+
+
+def make_answer_scope(inputs: Dict[str, Any]) -> tuple:
+    """
+    Phạm vi của một câu trả lời: chỉ tái sử dụng khi cùng cấu hình truy xuất/sinh
+    và cùng phiên bản dữ liệu đã ingest.
+    """
+    return (
+        inputs.get("llm_choice", "gemini"),
+        inputs.get("search_type", "hybrid"),
+        int(inputs.get("top_k", 5)),
+        bool(inputs.get("use_web_search", False)),
+        INGESTION_VERSION,
+    )
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo embedding của câu hỏi độc lập: trúng cache khi cosine với
+    một câu hỏi đã trả lời (cùng phạm vi) >= `threshold`. Giới hạn bằng TTL + LRU.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl: Optional[float] = 86400):
+        self.threshold = threshold
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        # entry_id -> (scope, vector đã chuẩn hoá, answer, created_at)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _evict_expired(self) -> None:
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        expired = [eid for eid, (_, _, _, created_at) in self._entries.items() if now - created_at > self.ttl]
+        for eid in expired:
+            del self._entries[eid]
+
+    def lookup(self, vector, scope: Hashable) -> Optional[str]:
+        query = self._normalize(vector)
+        with self._lock:
+            self._evict_expired()
+            candidates = [(eid, entry) for eid, entry in self._entries.items() if entry[0] == scope]
+            if candidates:
+                matrix = np.stack([entry[1] for _, entry in candidates])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    eid, entry = candidates[best]
+                    self._entries.move_to_end(eid)
+                    self.hits += 1
+                    return entry[2]
+            self.misses += 1
+            return None
+
+    def store(self, vector, scope: Hashable, answer: str) -> None:
+        vec = self._normalize(vector)
+        with self._lock:
+            self._entries[next(self._ids)] = (scope, vec, answer, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl=ANSWER_CACHE_TTL,
+) if ANSWER_CACHE_ENABLED else None
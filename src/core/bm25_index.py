@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.core.local_index import load_chunk_metadata, record_to_result
+
+# Các file của index BM25, nằm cùng thư mục (và cùng thứ tự hàng) với index vector cục bộ:
+#   bm25_postings.bin - posting list nén varint: [delta doc id ...][tf ...] cho từng term
+#   bm25_lexicon.json - term -> [offset, số byte, df]
+#   bm25_doclens.u32  - độ dài (số âm tiết) của từng chunk
+#   bm25_info.json    - số chunk, avgdl, k1, b
+POSTINGS_FILENAME = "bm25_postings.bin"
+LEXICON_FILENAME = "bm25_lexicon.json"
+DOCLENS_FILENAME = "bm25_doclens.u32"
+BM25_INFO_FILENAME = "bm25_info.json"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize_vi(text: str) -> List[str]:
+    """
+    Tách từ tiếng Việt ở mức âm tiết (tiếng Việt viết cách nhau bằng khoảng trắng),
+    giữ nguyên dấu thanh: chỉ chuẩn hoá NFC và chuyển chữ thường.
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return _TOKEN_RE.findall(text)
+
+
+def varint_encode(values) -> bytes:
+    """Nén một dãy số nguyên không âm (< 2^35) theo varint, vector hoá bằng NumPy."""
+    v = np.asarray(values, dtype=np.uint64)
+    if v.size == 0:
+        return b""
+    nbytes = 1 + sum((v >= (1 << (7 * i))).astype(np.int64) for i in range(1, 5))
+    offsets = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for i in range(5):
+        mask = nbytes > i
+        if not mask.any():
+            break
+        byte = (v[mask] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        cont = (nbytes[mask] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[mask] + i] = (byte | cont).astype(np.uint8)
+    return out.tobytes()
+
+
+def varint_decode(buf) -> np.ndarray:
+    """Giải nén varint (ngược với `varint_encode`), trả về mảng uint64."""
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if b.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    is_last = b < 0x80
+    ends = np.flatnonzero(is_last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.concatenate(([0], np.cumsum(is_last[:-1])))
+    shift = (np.arange(b.size) - starts[group]) * 7
+    payload = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(payload, starts)
+
+
+class BM25IndexWriter:
+    """
+    Xây index BM25 lúc ingestion. Hàng (doc id) của mỗi chunk phải trùng với thứ tự
+    trong metadata.jsonl của index cục bộ.
+    """
+
+    def __init__(self, index_dir: str, k1: float = BM25_K1, b: float = BM25_B):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)  # term -> [(doc_id, tf), ...]
+        self._doc_lens = []
+        os.makedirs(index_dir, exist_ok=True)
+
+    def add(self, content: str) -> int:
+        doc_id = len(self._doc_lens)
+        tokens = tokenize_vi(content)
+        tf = defaultdict(int)
+        for tok in tokens:
+            tf[tok] += 1
+        for term, count in tf.items():
+            self._postings[term].append((doc_id, count))
+        self._doc_lens.append(len(tokens))
+        return doc_id
+
+    def close(self) -> None:
+        lexicon = {}
+        offset = 0
+        with open(os.path.join(self.index_dir, POSTINGS_FILENAME), "wb") as f:
+            for term in sorted(self._postings):
+                postings = self._postings[term]
+                doc_ids = np.fromiter((d for d, _ in postings), dtype=np.int64, count=len(postings))
+                tfs = np.fromiter((t for _, t in postings), dtype=np.int64, count=len(postings))
+                deltas = np.diff(doc_ids, prepend=0)
+                data = varint_encode(np.concatenate([deltas, tfs]))
+                f.write(data)
+                lexicon[term] = [offset, len(data), len(postings)]
+                offset += len(data)
+
+        np.asarray(self._doc_lens, dtype=np.uint32).tofile(os.path.join(self.index_dir, DOCLENS_FILENAME))
+        with open(os.path.join(self.index_dir, LEXICON_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, ensure_ascii=False)
+        n_docs = len(self._doc_lens)
+        info = {
+            "count": n_docs,
+            "avgdl": (sum(self._doc_lens) / n_docs) if n_docs else 0.0,
+            "k1": self.k1,
+            "b": self.b,
+            "terms": len(lexicon),
+        }
+        with open(os.path.join(self.index_dir, BM25_INFO_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        self._postings.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class BM25Index:
+    """
+    Index BM25 cục bộ trên đĩa: posting list được memory-map, giải nén và chấm điểm
+    bằng NumPy nên mỗi truy vấn chỉ mất vài mili giây.
+    """
+
+    def __init__(self, index_dir: str, records: Optional[List[Dict[str, Any]]] = None):
+        self.index_dir = index_dir
+        info_path = os.path.join(index_dir, BM25_INFO_FILENAME)
+        if not os.path.exists(info_path):
+            raise FileNotFoundError(
+                f"Không tìm thấy index BM25 tại '{index_dir}'. Hãy chạy scripts/ingest_data.py với BM25_BACKEND=local."
+            )
+        with open(info_path, "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        with open(os.path.join(index_dir, LEXICON_FILENAME), "r", encoding="utf-8") as f:
+            self.lexicon = json.load(f)
+        self.count = int(self.info["count"])
+        self.k1 = float(self.info["k1"])
+        doc_lens = np.fromfile(os.path.join(index_dir, DOCLENS_FILENAME), dtype=np.uint32).astype(np.float32)
+        avgdl = float(self.info["avgdl"]) or 1.0
+        # Phần mẫu số chỉ phụ thuộc độ dài chunk, tính sẵn một lần
+        self._len_norm = self.k1 * (1.0 - self.info["b"] + self.info["b"] * doc_lens / avgdl)
+        postings_path = os.path.join(index_dir, POSTINGS_FILENAME)
+        if os.path.getsize(postings_path) > 0:
+            self._postings = np.memmap(postings_path, dtype=np.uint8, mode="r")
+        else:
+            self._postings = np.zeros(0, dtype=np.uint8)
+        self.records = records if records is not None else load_chunk_metadata(index_dir)
+        print(f"Đã nạp index BM25 cục bộ: {self.count} chunk, {len(self.lexicon)} term.")
+
+    def postings(self, term: str):
+        """Trả về (doc_ids, tfs) của một term, hoặc None nếu term không có trong index."""
+        entry = self.lexicon.get(term)
+        if entry is None:
+            return None
+        offset, nbytes, df = entry
+        values = varint_decode(self._postings[offset:offset + nbytes])
+        doc_ids = np.cumsum(values[:df]).astype(np.int64)
+        tfs = values[df:].astype(np.float32)
+        return doc_ids, tfs
+
+    def search(self, query_text: str, limit: int) -> List[tuple]:
+        """Top-`limit` chunk theo điểm BM25: danh sách (row, score) giảm dần."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        matched = False
+        for term in set(tokenize_vi(query_text)):
+            postings = self.postings(term)
+            if postings is None:
+                continue
+            doc_ids, tfs = postings
+            df = doc_ids.shape[0]
+            idf = np.log(1.0 + (self.count - df + 0.5) / (df + 0.5))
+            scores[doc_ids] += idf * tfs * (self.k1 + 1.0) / (tfs + self._len_norm[doc_ids])
+            matched = True
+        if not matched:
+            return []
+
+        candidates = np.flatnonzero(scores > 0)
+        k = min(int(limit), candidates.shape[0])
+        if k <= 0:
+            return []
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def query(self, query_text: str, limit: int) -> List[Dict]:
+        """Tương đương nhánh `hybrid(alpha=0.0)` của Weaviate."""
+        hits = self.search(query_text, limit)
+        return [record_to_result(self.records[row], score, rank) for rank, (row, score) in enumerate(hits, start=1)]
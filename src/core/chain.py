@@ -1,7 +1,10 @@
 import sys
 import os
 import re
-from typing import Dict, List, Any
+import asyncio
+import threading
+import time
+from typing import Dict, List, Any, Iterator, AsyncIterator
 
 # Thêm thư mục gốc vào sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
@@ -10,36 +13,87 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda, RunnableBranch, RunnableParallel
 
-from sentence_transformers import SentenceTransformer
+from src.core.config import QUALITY_GATE_MODE, PREWARM_ON_STARTUP
+from src.core.retriever import retriever_fn, aretriever_fn, warm_retrieval_backend
+from src.core.llm_handle import LLM_MAP, get_llm, lazy_llm
+from src.core.prompt import prompt as final_rag_prompt, CONDENSE_QUESTION_PROMPT, QUALITY_CHECK_PROMPT, TITLE_PROMPT
+from src.core.web_search import web_search_fn, aweb_search_fn
+from src.core.embedding_cache import get_query_embedding
+from src.core.answer_cache import answer_cache, make_answer_scope
+from src.core.question_condenser import needs_condensing, make_condense_key, condense_cache
+from src.core.quality_gate import score_quality_decision
+from src.core.context_packer import pack_context
+from src.core.lazy import LazySingleton
+from src.core.embedding_model import load_embedding_model
+from src.core.memory_stats import process_memory
 
-from src.core.config import embedding_model_name
-from src.core.retriever import retriever_fn
-from src.core.llm_handle import get_llm
-from src.core.prompt import prompt as final_rag_prompt, CONDENSE_QUESTION_PROMPT, QUALITY_CHECK_PROMPT
-from src.core.web_search import web_search_fn
+# Model (SentenceTransformer hoặc ONNX int8, theo EMBEDDING_BACKEND) chỉ được tải ở lần encode đầu tiên (câu hỏi trúng cache embedding thì không cần tải)
+embedding_model = LazySingleton(load_embedding_model, "embedding_model")
 
-embedding_model = SentenceTransformer(embedding_model_name)
+# Encoder cho câu truy vấn: mặc định là model embedding, API server thay bằng MicroBatchEncoder
+query_encoder = embedding_model
+
+def set_query_encoder(encoder=None) -> None:
+    """Thay encoder dùng cho câu truy vấn (None: quay lại model embedding)."""
+    global query_encoder
+    query_encoder = encoder if encoder is not None else embedding_model
 
 # --- CÁC HÀM VÀ CHAIN CƠ BẢN (giữ nguyên) ---
 
 standalone_question_chain = (
-    CONDENSE_QUESTION_PROMPT | get_llm("gemini") | StrOutputParser()
+    CONDENSE_QUESTION_PROMPT | lazy_llm("gemini") | StrOutputParser()
 )
 
-retriever_runnable = RunnableLambda(
-    lambda x: retriever_fn(
+def run_retriever(x: Dict) -> Dict:
+    return retriever_fn(
+        query=x["standalone_question"],
+        embedding_model=query_encoder,
+        search_type=x.get("search_type", "hybrid"),
+        top_k=x.get("top_k", 5)
+    )
+
+async def arun_retriever(x: Dict) -> Dict:
+    return await aretriever_fn(
         query=x["standalone_question"],
-        embedding_model=embedding_model,
+        embedding_model=query_encoder,
         search_type=x.get("search_type", "hybrid"),
         top_k=x.get("top_k", 5)
     )
+
+def condense_question(x: Dict) -> str:
+    """Viết lại câu hỏi bằng LLM, có cache theo hash(lịch sử chat + câu hỏi)."""
+    key = make_condense_key(x["question"], x.get("chat_history"))
+    cached = condense_cache.get(key)
+    if cached is not None:
+        return cached
+    standalone = standalone_question_chain.invoke(x)
+    condense_cache.put(key, standalone)
+    return standalone
+
+async def acondense_question(x: Dict) -> str:
+    key = make_condense_key(x["question"], x.get("chat_history"))
+    cached = condense_cache.get(key)
+    if cached is not None:
+        return cached
+    standalone = await standalone_question_chain.ainvoke(x)
+    condense_cache.put(key, standalone)
+    return standalone
+
+# Có cả bản sync và async: invoke/batch/stream dùng bản sync, ainvoke/abatch/astream dùng bản async
+condense_runnable = RunnableLambda(condense_question, afunc=acondense_question)
+
+retriever_runnable = RunnableLambda(run_retriever, afunc=arun_retriever)
+
+web_search_runnable = RunnableLambda(
+    lambda x: web_search_fn(x["standalone_question"]),
+    afunc=lambda x: aweb_search_fn(x["standalone_question"])
 )
 
 def create_final_answer_chain():
     return RunnableBranch(
-        (lambda x: x.get("llm_choice") == "openai", final_rag_prompt | get_llm("openai") | StrOutputParser()),
-        (lambda x: x.get("llm_choice") == "cohere", final_rag_prompt | get_llm("cohere") | StrOutputParser()),
-        final_rag_prompt | get_llm("gemini") | StrOutputParser(),
+        (lambda x: x.get("llm_choice") == "openai", final_rag_prompt | lazy_llm("openai") | StrOutputParser()),
+        (lambda x: x.get("llm_choice") == "cohere", final_rag_prompt | lazy_llm("cohere") | StrOutputParser()),
+        final_rag_prompt | lazy_llm("gemini") | StrOutputParser(),
     )
 final_answer_chain = create_final_answer_chain()
 
@@ -49,19 +103,32 @@ quality_check_chain = (
         context=lambda x: x["retrieved_docs"]["context"]
     )
     | QUALITY_CHECK_PROMPT
-    | get_llm("gemini")
+    | lazy_llm("gemini")
     | StrOutputParser()
 )
 
+# Đặt tiêu đề hội thoại: dựng một lần, dùng lại cho mọi lần gọi
+title_chain = TITLE_PROMPT | lazy_llm("gemini") | StrOutputParser()
+
+# Quality gate: LLM judge (mặc định) hoặc quyết định cục bộ từ tín hiệu retrieval, không tốn lời gọi LLM
+if QUALITY_GATE_MODE in ("score", "classifier"):
+    quality_decision_runnable = RunnableLambda(
+        lambda x: score_quality_decision(x["retrieved_docs"].get("signals"), mode=QUALITY_GATE_MODE)
+    )
+else:
+    quality_decision_runnable = quality_check_chain
+
 # <--- LOGIC ĐIỀU PHỐI VÀ HÀM HỖ TRỢ (VIẾT LẠI HOÀN TOÀN) --->
 
+NO_INFO_STRING = "tôi xin lỗi, thông tin này không có trong các tài liệu của tôi"
+
 def orchestrate_context_and_sources(inputs: Dict) -> Dict:
     """
     Hàm điều phối chính: quyết định và xây dựng context/sources cuối cùng.
     Hàm này đảm bảo context và sources luôn đồng bộ 100%.
     """
     decision = inputs["quality_decision"].strip().upper()
-    rag_docs = inputs["retrieved_docs"]["sources"] # Đây là danh sách các doc từ retriever
+    rag_docs = inputs["retrieved_docs"]["docs"]  # Tài liệu gốc (có nội dung) từ retriever
     web_docs = inputs["web_search_results"]      # Đây là danh sách các doc từ web_search_fn
     
     print(f"Quyết định của Quality Check: {decision}")
@@ -77,44 +144,24 @@ def orchestrate_context_and_sources(inputs: Dict) -> Dict:
         print("Kết hợp sources từ RAG và Web Search.")
         final_docs_to_process = rag_docs + web_docs
 
-    if not final_docs_to_process:
+    # Đóng gói context và sources cùng lúc (khử lặp, ngân sách token) nên số thứ tự [SOURCE n] luôn khớp sources
+    packed = pack_context(final_docs_to_process)
+    if not packed["sources"]:
         return {"context": "Không tìm thấy thông tin phù hợp.", "sources": []}
-
-    # Xây dựng context và sources cuối cùng từ danh sách đã chọn
-    final_context_parts = []
-    final_sources = []
-    for i, doc in enumerate(final_docs_to_process):
-        # Lấy nội dung từ retriever_fn (đã có trong source object) hoặc web_search_fn
-        content = doc.get("content", "Không có nội dung.")
-        final_context_parts.append(f"[SOURCE {i+1}]:\n{content}")
-        
-        # Tạo đối tượng source nhất quán để định dạng cuối cùng
-        final_sources.append({
-            "document_name": doc.get("document_name"),
-            "url": doc.get("url"),
-            "page": doc.get("page") # Sẽ là None cho nguồn web, không sao cả
-        })
-        
-    final_context = "\n\n---\n\n".join(final_context_parts)
-    
-    return {"context": final_context, "sources": final_sources}
+    return packed
 
 
-def format_final_response(input_dict: Dict) -> str:
+def format_sources_markdown(llm_answer: str, original_sources: List[Dict]) -> str:
     """
-    Phân tích câu trả lời của LLM, chỉ hiển thị các nguồn thực sự được trích dẫn.
-    (Hàm này giữ nguyên như phiên bản sửa lỗi trước, nó đã đúng)
+    Tạo phần "Nguồn tham khảo" chỉ gồm các nguồn thực sự được trích dẫn trong câu trả lời.
+    Trả về chuỗi rỗng nếu không có nguồn nào cần hiển thị.
     """
-    llm_answer = input_dict.get("llm_answer", "")
-    original_sources = input_dict.get("sources", [])
-    
-    no_info_string = "tôi xin lỗi, thông tin này không có trong các tài liệu của tôi"
-    if no_info_string in llm_answer.lower() or not original_sources:
-        return llm_answer
+    if NO_INFO_STRING in llm_answer.lower() or not original_sources:
+        return ""
 
     cited_indices = re.findall(r'\[(\d+)\]', llm_answer)
     if not cited_indices:
-        return llm_answer
+        return ""
 
     cited_doc_indices = sorted(list(set([int(i) - 1 for i in cited_indices])))
     
@@ -124,7 +171,7 @@ def format_final_response(input_dict: Dict) -> str:
             filtered_sources.append(original_sources[i])
 
     if not filtered_sources:
-        return llm_answer
+        return ""
 
     source_list_md = "\n\n---\n\n**Nguồn tham khảo:**\n"
     for i, source in enumerate(filtered_sources):
@@ -137,23 +184,66 @@ def format_final_response(input_dict: Dict) -> str:
             source_item += f" (Trang {page})"
         source_list_md += source_item + "\n"
 
-    return llm_answer + source_list_md
+    return source_list_md
+
+
+def format_final_response(input_dict: Dict) -> str:
+    """
+    Phân tích câu trả lời của LLM, chỉ hiển thị các nguồn thực sự được trích dẫn.
+    """
+    llm_answer = input_dict.get("llm_answer", "")
+    return llm_answer + format_sources_markdown(llm_answer, input_dict.get("sources", []))
+
+# --- CACHE CÂU TRẢ LỜI THEO NGỮ NGHĨA ---
+
+def lookup_cached_answer(x: Dict):
+    """Tìm câu trả lời đã cache cho câu hỏi độc lập (None nếu không có hoặc cache bị tắt)."""
+    if answer_cache is None:
+        return None
+    vector = get_query_embedding(x["standalone_question"], query_encoder)
+    cached = answer_cache.lookup(vector, make_answer_scope(x))
+    if cached is not None:
+        print("Trúng cache câu trả lời, bỏ qua retrieval và sinh câu trả lời.")
+    return cached
+
+async def alookup_cached_answer(x: Dict):
+    return await asyncio.to_thread(lookup_cached_answer, x)
+
+def store_cached_answer(x: Dict, response: str) -> None:
+    """Lưu câu trả lời hoàn chỉnh vào cache (không lưu câu trả lời "không có thông tin")."""
+    if answer_cache is None or not response or NO_INFO_STRING in response.lower():
+        return
+    vector = get_query_embedding(x["standalone_question"], query_encoder)
+    answer_cache.store(vector, make_answer_scope(x), response)
+
+def finalize_answer(x: Dict) -> str:
+    response = format_final_response({
+        "llm_answer": x["llm_answer"],
+        "sources": x["final_context_and_sources"]["sources"]
+    })
+    store_cached_answer(x, response)
+    return response
+
+def is_cache_hit(x: Dict) -> bool:
+    return x.get("cached_answer") is not None
 
 # --- XÂY DỰNG RAG CHAIN HOÀN CHỈNH (giữ nguyên cấu trúc) ---
 
 # Bước 1: Tạo câu hỏi độc lập
+# Chỉ gọi LLM khi có lịch sử chat VÀ câu hỏi có dấu hiệu tham chiếu tới lượt trước
 prepare_standalone_question = RunnablePassthrough.assign(
     standalone_question=RunnableBranch(
-        (lambda x: x.get("chat_history"), standalone_question_chain),
+        (lambda x: needs_condensing(x["question"], x.get("chat_history")), condense_runnable),
         lambda x: x["question"],
     )
 )
 
 # Bước 2: Truy xuất tài liệu RAG và chạy Web Search (nếu cần) song song
+# (với ainvoke, hai nhánh chạy đồng thời trên event loop)
 retrieval_and_search = RunnablePassthrough.assign(
     retrieved_docs=retriever_runnable,
     web_search_results=RunnableBranch(
-        (lambda x: x.get("use_web_search", False), RunnableLambda(lambda x: web_search_fn(x["standalone_question"]))),
+        (lambda x: x.get("use_web_search", False), web_search_runnable),
         lambda x: [] # Trả về danh sách rỗng nếu không dùng web search
     )
 )
@@ -163,7 +253,7 @@ orchestration_chain = RunnableBranch(
     (
         lambda x: x.get("use_web_search", False),
         RunnablePassthrough.assign(
-            quality_decision=quality_check_chain,
+            quality_decision=quality_decision_runnable,
         ) | RunnableLambda(orchestrate_context_and_sources)
     ),
     # Nếu không dùng web search, chỉ cần lấy kết quả từ retriever
@@ -182,19 +272,119 @@ final_llm_input_constructor = lambda x: {
 }
 
 # Bước 5: Ghép nối tất cả lại thành chuỗi cuối cùng
-rag_chain = (
+# Cache câu trả lời nằm ngay sau bước tạo câu hỏi độc lập: khi trúng cache thì bỏ qua
+# toàn bộ retrieval, quality check và bước sinh câu trả lời.
+lookup_answer_cache = RunnablePassthrough.assign(
+    cached_answer=RunnableLambda(lookup_cached_answer, afunc=alookup_cached_answer)
+)
+
+# rag_context_chain dừng trước bước sinh câu trả lời để phần sinh có thể được stream riêng
+rag_context_chain = (
     prepare_standalone_question
-    | retrieval_and_search
-    | RunnablePassthrough.assign(
-        final_context_and_sources=orchestration_chain
-    )
-    | RunnablePassthrough.assign(
-        llm_answer=(final_llm_input_constructor | final_answer_chain)
+    | lookup_answer_cache
+    | RunnableBranch(
+        (is_cache_hit, RunnablePassthrough()),
+        retrieval_and_search
+        | RunnablePassthrough.assign(
+            final_context_and_sources=orchestration_chain
+        )
     )
-    | RunnableLambda(
-        lambda x: format_final_response({
-            "llm_answer": x["llm_answer"],
-            "sources": x["final_context_and_sources"]["sources"]
-        })
+)
+
+rag_chain = (
+    rag_context_chain
+    | RunnableBranch(
+        (is_cache_hit, lambda x: x["cached_answer"]),
+        RunnablePassthrough.assign(
+            llm_answer=(final_llm_input_constructor | final_answer_chain)
+        )
+        | RunnableLambda(finalize_answer)
     )
-)
\ No newline at end of file
+)
+
+# --- STREAMING CÂU TRẢ LỜI ---
+
+def stream_final_answer(context_state: Dict) -> Iterator[str]:
+    """
+    Stream từng token của câu trả lời từ `final_answer_chain` dựa trên kết quả của `rag_context_chain`.
+    Danh sách nguồn được trích dẫn chỉ tính được khi đã có toàn bộ câu trả lời, nên được gửi ở cuối.
+    """
+    if is_cache_hit(context_state):
+        yield context_state["cached_answer"]
+        return
+    answer_parts = []
+    for chunk in final_answer_chain.stream(final_llm_input_constructor(context_state)):
+        answer_parts.append(chunk)
+        yield chunk
+    llm_answer = "".join(answer_parts)
+    sources_md = format_sources_markdown(llm_answer, context_state["final_context_and_sources"]["sources"])
+    if sources_md:
+        yield sources_md
+    store_cached_answer(context_state, llm_answer + sources_md)
+
+async def astream_final_answer(context_state: Dict) -> AsyncIterator[str]:
+    """Phiên bản async của `stream_final_answer`."""
+    if is_cache_hit(context_state):
+        yield context_state["cached_answer"]
+        return
+    answer_parts = []
+    async for chunk in final_answer_chain.astream(final_llm_input_constructor(context_state)):
+        answer_parts.append(chunk)
+        yield chunk
+    llm_answer = "".join(answer_parts)
+    sources_md = format_sources_markdown(llm_answer, context_state["final_context_and_sources"]["sources"])
+    if sources_md:
+        yield sources_md
+    await asyncio.to_thread(store_cached_answer, context_state, llm_answer + sources_md)
+
+def stream_rag_answer(input_data: Dict) -> Iterator[str]:
+    """Chạy toàn bộ pipeline và stream câu trả lời (kèm nguồn ở cuối)."""
+    yield from stream_final_answer(rag_context_chain.invoke(input_data))
+
+async def astream_rag_answer(input_data: Dict) -> AsyncIterator[str]:
+    """Phiên bản async của `stream_rag_answer`."""
+    context_state = await rag_context_chain.ainvoke(input_data)
+    async for chunk in astream_final_answer(context_state):
+        yield chunk
+
+# --- PREWARM (TUỲ CHỌN) ---
+
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+
+def prewarm(background: bool = False) -> Dict[str, Any]:
+    """
+    Khởi tạo trước các singleton nặng: model embedding, backend truy xuất và các LLM client.
+    Lỗi của từng thành phần (thiếu khoá API, mất kết nối, ...) chỉ được ghi lại, không làm dừng app.
+    Với `background=True`, chạy trong một luồng nền (chỉ khởi động một lần) và trả về ngay.
+    """
+    global _prewarm_thread
+    if background:
+        with _prewarm_lock:
+            if _prewarm_thread is None:
+                _prewarm_thread = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+                _prewarm_thread.start()
+        return {}
+
+    steps = {"embedding_model": embedding_model.get, "retrieval_backend": warm_retrieval_backend}
+    for name in LLM_MAP:
+        steps[f"llm:{name}"] = (lambda n: lambda: get_llm(n))(name)
+
+    report = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        rss_before = process_memory()["rss_mb"]
+        try:
+            step()
+            report[name] = {"ok": True}
+        except Exception as e:
+            print(f"   ! Prewarm {name} thất bại: {e}")
+            report[name] = {"ok": False, "error": str(e)}
+        rss_after = process_memory()["rss_mb"]
+        report[name]["seconds"] = time.perf_counter() - start
+        # Lượng RSS tăng thêm khi nạp thành phần này (None nếu hệ điều hành không hỗ trợ đo)
+        report[name]["rss_delta_mb"] = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return report
+
+if PREWARM_ON_STARTUP:
+    prewarm(background=True)
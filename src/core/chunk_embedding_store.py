@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.core.config import CHUNK_EMBEDDING_STORE_DIR, CHUNK_EMBEDDING_STORE_DTYPE, EMBEDDING_MODEL_ID
+
+# Cấu trúc thư mục của mỗi model trong store:
+#   vectors.bin - ma trận (n x dim) float32 hoặc float16, chỉ ghi nối thêm, đọc bằng np.memmap
+#   keys.bin    - n khoá 16 byte (sha256 rút gọn của nội dung chunk), cùng thứ tự với hàng trong ma trận
+#   info.json   - tên model, số chiều, kiểu dữ liệu
+VECTORS_FILENAME = "vectors.bin"
+KEYS_FILENAME = "keys.bin"
+INFO_FILENAME = "info.json"
+KEY_BYTES = 16
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def content_key(text: str) -> bytes:
+    """Khoá theo nội dung: cùng một đoạn văn bản luôn có cùng khoá, bất kể file / vị trí của chunk."""
+    return hashlib.sha256(text.encode("utf-8")).digest()[:KEY_BYTES]
+
+
+def _model_dirname(model_name: str) -> str:
+    slug = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name).strip("_") or "model"
+    return f"{slug}-{hashlib.sha256(model_name.encode('utf-8')).hexdigest()[:8]}"
+
+
+class ChunkEmbeddingStore:
+    """
+    Store embedding của chunk, định địa chỉ theo nội dung (hash của text) và tách riêng theo model.
+    Vector được lưu float32 / float16 trong file memory-mapped, chỉ nối thêm; mỗi lần ingest chỉ các
+    chunk chưa có trong store (cache miss) mới được đưa vào `encode`, theo các nhóm có độ dài gần nhau
+    để giảm padding. Dùng chung được cho mọi công cụ offline cần vector của chunk (`get` / `get_many`).
+    """
+
+    def __init__(self, root_dir: str = CHUNK_EMBEDDING_STORE_DIR, model_name: str = EMBEDDING_MODEL_ID,
+                 dtype: str = CHUNK_EMBEDDING_STORE_DTYPE):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype phải là một trong {SUPPORTED_DTYPES}, nhận được '{dtype}'.")
+        self.model_name = model_name
+        self.dir = os.path.join(root_dir, _model_dirname(model_name))
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    # ---------- Đọc / ghi file ----------
+    def _load(self) -> None:
+        info_path = os.path.join(self.dir, INFO_FILENAME)
+        if not os.path.exists(info_path):
+            return
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("model_name") != self.model_name:
+            raise ValueError(f"Store tại '{self.dir}' thuộc model '{info.get('model_name')}', không phải '{self.model_name}'.")
+        # kiểu dữ liệu của store đã có được giữ nguyên
+        self.dtype = np.dtype(info["dtype"])
+        self.dim = int(info["dim"])
+
+        keys_path = os.path.join(self.dir, KEYS_FILENAME)
+        vectors_path = os.path.join(self.dir, VECTORS_FILENAME)
+        # info.json có thể đã được ghi trong khi vectors.bin / keys.bin chưa kịp tạo: coi như rỗng
+        keys_size = os.path.getsize(keys_path) if os.path.exists(keys_path) else 0
+        vectors_size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        row_bytes = self.dim * self.dtype.itemsize
+        count = min(keys_size // KEY_BYTES, vectors_size // row_bytes)
+        if keys_size != count * KEY_BYTES or vectors_size != count * row_bytes:
+            # lần ghi trước bị dừng giữa chừng: bỏ phần dư không khớp ("ab" tạo file nếu chưa có)
+            with open(keys_path, "ab") as f:
+                f.truncate(count * KEY_BYTES)
+            with open(vectors_path, "ab") as f:
+                f.truncate(count * row_bytes)
+        if count:
+            keys = np.fromfile(keys_path, dtype=np.uint8, count=count * KEY_BYTES).reshape(count, KEY_BYTES)
+            self._rows = {key.tobytes(): row for row, key in enumerate(keys)}
+
+    def _write_info(self) -> None:
+        with open(os.path.join(self.dir, INFO_FILENAME), "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f, ensure_ascii=False, indent=2)
+
+    def _vectors(self) -> np.ndarray:
+        """Ma trận memory-mapped; được map lại khi store có thêm hàng."""
+        count = len(self._rows)
+        if self._matrix is None or self._matrix.shape[0] != count:
+            self._matrix = np.memmap(os.path.join(self.dir, VECTORS_FILENAME), dtype=self.dtype, mode="r",
+                                     shape=(count, self.dim)) if count else np.zeros((0, self.dim or 0), dtype=self.dtype)
+        return self._matrix
+
+    def _append(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self._write_info()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector có {vectors.shape[1]} chiều, store yêu cầu {self.dim} chiều.")
+        # vector ghi trước, khoá ghi sau: nếu bị dừng giữa chừng thì phần dư bị bỏ khi mở lại
+        with open(os.path.join(self.dir, VECTORS_FILENAME), "ab") as f:
+            f.write(np.ascontiguousarray(vectors.astype(self.dtype)).tobytes())
+        with open(os.path.join(self.dir, KEYS_FILENAME), "ab") as f:
+            f.write(b"".join(keys))
+        for key in keys:
+            self._rows[key] = len(self._rows)
+
+    # ---------- API ----------
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, text: str) -> bool:
+        return content_key(text) in self._rows
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Vector float32 của `text`, hoặc None nếu chưa có."""
+        with self._lock:
+            row = self._rows.get(content_key(text))
+            return None if row is None else np.asarray(self._vectors()[row], dtype=np.float32)
+
+    def get_many(self, texts: Iterable[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            matrix = self._vectors()
+            rows = [self._rows.get(content_key(t)) for t in texts]
+            return [None if row is None else np.asarray(matrix[row], dtype=np.float32) for row in rows]
+
+    def encode(self, texts: Sequence[str], embedding_model, batch_size: int = 32) -> np.ndarray:
+        """
+        Ma trận float32 (len(texts) x dim) embedding của `texts`. Chỉ các text chưa có trong store
+        (mỗi nội dung một lần) được embed, sắp theo độ dài và chia thành nhóm `batch_size` câu dài gần
+        nhau để giảm padding; kết quả được ghi vào store trước khi trả về.
+        """
+        texts = list(texts)
+        keys = [content_key(t) for t in texts]
+        with self._lock:
+            missing: Dict[bytes, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            # text trùng nhau trong cùng lời gọi chỉ tính một lần miss
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                items = sorted(missing.items(), key=lambda kv: len(kv[1]))
+                for start in range(0, len(items), max(1, batch_size)):
+                    bucket = items[start:start + batch_size]
+                    vectors = embedding_model.encode([t for _, t in bucket], batch_size=len(bucket), show_progress_bar=False)
+                    self._append([k for k, _ in bucket], np.asarray(vectors, dtype=np.float32).reshape(len(bucket), -1))
+
+            if not texts:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            matrix = self._vectors()
+            return np.asarray(matrix[[self._rows[k] for k in keys]], dtype=np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "dir": self.dir,
+            "dtype": self.dtype.name,
+            "dim": self.dim,
+            "size": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._matrix = None
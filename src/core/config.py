@@ -1,2 +1,115 @@
+import os
+
 embedding_model_name = "Qwen/Qwen3-Embedding-0.6B"
-class_name = "VNHistoryDocument"
\ No newline at end of file
+class_name = "VNHistoryDocument"
+
+# Thư mục gốc của dự án và thư mục chứa các file cache cục bộ
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache"))
+
+# ---------- Backend chạy model embedding ----------
+# "torch": SentenceTransformer (fp32); "onnx": ONNX Runtime int8 trên CPU (xuất bằng scripts/export_onnx_model.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+ONNX_MODEL_DIR = os.getenv(
+    "ONNX_MODEL_DIR", os.path.join(PROJECT_ROOT, "models/onnx", embedding_model_name.replace("/", "__"))
+)
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model_int8.onnx")
+# Độ dài tối đa (token) khi encode bằng ONNX và số luồng (0 = mặc định của ONNX Runtime)
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", "512"))
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))
+# Định danh model dùng làm khoá cache embedding: vector int8 lệch nhẹ so với fp32 nên không dùng chung cache
+EMBEDDING_MODEL_ID = embedding_model_name if EMBEDDING_BACKEND == "torch" else f"{embedding_model_name}#{EMBEDDING_BACKEND}"
+
+# ---------- Cache embedding cho câu truy vấn ----------
+# Số embedding tối đa giữ trong bộ nhớ (LRU)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+# File SQLite cho tầng cache trên đĩa; đặt chuỗi rỗng để tắt tầng này
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "query_embeddings.sqlite"))
+# Số embedding tối đa lưu trên đĩa, vượt quá sẽ xoá các bản ghi ít dùng nhất
+EMBEDDING_CACHE_MAX_DISK_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_DISK_ENTRIES", "100000"))
+
+# ---------- Store embedding của chunk (ingestion / công cụ offline) ----------
+# Thư mục store định địa chỉ theo nội dung (mỗi model một thư mục con); đặt chuỗi rỗng để tắt khi ingest
+CHUNK_EMBEDDING_STORE_DIR = os.getenv("CHUNK_EMBEDDING_STORE_DIR", os.path.join(CACHE_DIR, "chunk_embeddings"))
+# Kiểu lưu vector của store mới: "float32" (giữ nguyên vector) hoặc "float16" (giảm một nửa dung lượng)
+CHUNK_EMBEDDING_STORE_DTYPE = os.getenv("CHUNK_EMBEDDING_STORE_DTYPE", "float32")
+
+# ---------- Hybrid search ----------
+# Timeout (giây) riêng cho từng nhánh BM25 / vector khi chạy song song
+HYBRID_BM25_TIMEOUT = float(os.getenv("HYBRID_BM25_TIMEOUT", "8"))
+HYBRID_VECTOR_TIMEOUT = float(os.getenv("HYBRID_VECTOR_TIMEOUT", "8"))
+
+# ---------- Backend truy xuất ----------
+# "weaviate" (mặc định, Weaviate Cloud) hoặc "local" (index NumPy memory-mapped, chạy offline)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "weaviate").strip().lower()
+# Thư mục chứa index cục bộ (vectors + metadata), được tạo bởi scripts/ingest_data.py
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(PROJECT_ROOT, "data/local_index"))
+# Nhánh từ khoá (BM25) của hybrid search: "weaviate" hoặc "local" (inverted index trên đĩa trong LOCAL_INDEX_DIR).
+# Mặc định dùng index cục bộ khi backend truy xuất là "local".
+BM25_BACKEND = os.getenv("BM25_BACKEND", "local" if RETRIEVAL_BACKEND == "local" else "weaviate").strip().lower()
+
+# ---------- Cache câu trả lời theo ngữ nghĩa ----------
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Ngưỡng cosine giữa embedding của câu hỏi độc lập mới và câu hỏi đã cache để coi là trùng
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Phiên bản dữ liệu đã ingest; tăng giá trị này sau mỗi lần ingest lại để vô hiệu cache cũ
+INGESTION_VERSION = os.getenv("INGESTION_VERSION", "1")
+
+# ---------- Viết lại câu hỏi (condense question) ----------
+# Số kết quả viết lại (theo hash lịch sử + câu hỏi) giữ trong bộ nhớ
+CONDENSE_CACHE_SIZE = int(os.getenv("CONDENSE_CACHE_SIZE", "1024"))
+
+# ---------- Quality gate (khi bật web search) ----------
+# "llm": hỏi Gemini GOOD/OKAY/BAD (như trước); "score": quyết định cục bộ theo tín hiệu retrieval;
+# "classifier": hồi quy logistic nhỏ trên các tín hiệu đó (trọng số do script hiệu chỉnh tạo ra)
+QUALITY_GATE_MODE = os.getenv("QUALITY_GATE_MODE", "llm").strip().lower()
+# File ngưỡng/trọng số được tạo bởi scripts/calibrate_quality_gate.py trên evaluate/generated_dataset.jsonl
+QUALITY_GATE_THRESHOLDS_PATH = os.getenv(
+    "QUALITY_GATE_THRESHOLDS_PATH", os.path.join(PROJECT_ROOT, "src/core/quality_gate_thresholds.json")
+)
+
+# ---------- Web search ----------
+# Deadline chung (giây) cho cả giai đoạn web search: trang nào về muộn hơn sẽ bị bỏ
+WEB_SEARCH_DEADLINE = float(os.getenv("WEB_SEARCH_DEADLINE", "6"))
+# Timeout cho từng request HTTP
+WEB_REQUEST_TIMEOUT = float(os.getenv("WEB_REQUEST_TIMEOUT", "10"))
+# Số trang scrape đồng thời (cũng là kích thước connection pool)
+WEB_SCRAPE_WORKERS = int(os.getenv("WEB_SCRAPE_WORKERS", "8"))
+# Cache trên đĩa (SQLite) cho kết quả Google CSE và nội dung trang đã scrape; chuỗi rỗng để tắt
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", os.path.join(CACHE_DIR, "web_cache.sqlite"))
+# TTL (giây) riêng cho từng tầng: kết quả tìm kiếm và nội dung trang
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", str(24 * 3600)))
+WEB_PAGE_CACHE_TTL = float(os.getenv("WEB_PAGE_CACHE_TTL", str(7 * 24 * 3600)))
+# Dung lượng tối đa của cache (byte, tính trên dữ liệu đã nén); vượt quá sẽ xoá mục ít dùng nhất
+WEB_CACHE_MAX_BYTES = int(os.getenv("WEB_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# ---------- Đóng gói context cho LLM ----------
+# Ngân sách token (ước lượng) cho toàn bộ context và cho từng nguồn
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+CONTEXT_MAX_TOKENS_PER_SOURCE = int(os.getenv("CONTEXT_MAX_TOKENS_PER_SOURCE", "1200"))
+# Số token trung bình cho mỗi âm tiết tiếng Việt (dùng để ước lượng, không cần tokenizer của từng LLM)
+TOKENS_PER_WORD = float(os.getenv("TOKENS_PER_WORD", "1.6"))
+
+# ---------- Gộp chunk liền kề sau RRF ----------
+# Gộp các chunk kề nhau (cửa sổ trượt chồng lấn) của cùng một tài liệu thành một đoạn duy nhất
+MERGE_ADJACENT_CHUNKS = os.getenv("MERGE_ADJACENT_CHUNKS", "true").strip().lower() in ("1", "true", "yes")
+
+# ---------- Khởi động ----------
+# Model embedding, backend truy xuất và các LLM client đều được tạo ở lần dùng đầu tiên.
+# Bật cờ này để nạp trước chúng trong một luồng nền ngay khi app khởi động (tránh câu hỏi đầu tiên bị chậm)
+PREWARM_ON_STARTUP = os.getenv("PREWARM_ON_STARTUP", "false").strip().lower() in ("1", "true", "yes")
+
+# ---------- API server (src/api/server.py) ----------
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+# Micro-batching embedding câu truy vấn: gom các câu đến trong cửa sổ này (ms), tối đa chừng này câu mỗi lần encode
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+
+# ---------- Ingestion ----------
+# Manifest của lần ingest trước (hash PDF, config entry, tham số chunk, UUID các chunk) cho ingest tăng dần
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", os.path.join(PROJECT_ROOT, "data/ingest_manifest.json"))
+# Báo cáo các object không nạp được vào Weaviate sau mọi lần thử lại (JSONL, nạp lại bằng --replay-failures)
+INGEST_FAILURE_REPORT_PATH = os.getenv("INGEST_FAILURE_REPORT_PATH", os.path.join(PROJECT_ROOT, "data/ingest_failures.jsonl"))
@@ -0,0 +1,123 @@
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+from src.core.config import CONTEXT_MAX_TOKENS, CONTEXT_MAX_TOKENS_PER_SOURCE, TOKENS_PER_WORD
+
+# Độ dài (số từ) của shingle dùng để phát hiện đoạn lặp giữa các nguồn
+SHINGLE_WORDS = 8
+# Chỉ cắt những đoạn lặp dài ít nhất chừng này từ (tránh cắt các cụm từ phổ biến)
+MIN_DUPLICATE_RUN_WORDS = 24
+# Nguồn còn ít hơn chừng này từ sau khi khử lặp / cắt ngân sách thì bỏ hẳn
+MIN_SOURCE_WORDS = 20
+ELLIPSIS = " … "
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token theo số từ (âm tiết)."""
+    return math.ceil(len(_WORD_RE.findall(text or "")) * TOKENS_PER_WORD)
+
+
+def _shingle_keys(words: List[str], n: int) -> List[int]:
+    return [hash(tuple(words[i:i + n])) for i in range(len(words) - n + 1)]
+
+
+def remove_seen_spans(text: str, seen_shingles: set, n: int = SHINGLE_WORDS,
+                      min_run: int = MIN_DUPLICATE_RUN_WORDS) -> str:
+    """
+    Bỏ các đoạn (>= `min_run` từ) đã xuất hiện trong những nguồn trước đó, ví dụ phần overlap
+    128 từ giữa hai chunk liền nhau của cùng một cuốn sách. Giữ nguyên khoảng trắng của phần còn lại.
+    """
+    spans = [(m.start(), m.end()) for m in _WORD_RE.finditer(text)]
+    if len(spans) < n:
+        return text
+    words = [text[s:e].lower() for s, e in spans]
+    covered = [False] * len(words)
+    for i, key in enumerate(_shingle_keys(words, n)):
+        if key in seen_shingles:
+            for j in range(i, i + n):
+                covered[j] = True
+
+    pieces = []
+    i = 0
+    keep_start = 0
+    while i < len(words):
+        if not covered[i]:
+            i += 1
+            continue
+        run_end = i
+        while run_end < len(words) and covered[run_end]:
+            run_end += 1
+        if run_end - i >= min_run:
+            if i > keep_start:
+                pieces.append(text[spans[keep_start][0]:spans[i - 1][1]])
+            pieces.append(None)  # đánh dấu chỗ đã cắt
+            keep_start = run_end
+        i = run_end
+    if keep_start < len(words):
+        pieces.append(text[spans[keep_start][0]:spans[-1][1]])
+
+    out = ""
+    for piece in pieces:
+        if piece is None:
+            out = out.rstrip() + ELLIPSIS if out else ""
+        else:
+            out += piece
+    return out.strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt văn bản theo ngân sách token (theo ranh giới từ)."""
+    max_words = int(max_tokens / TOKENS_PER_WORD)
+    spans = [m.end() for m in _WORD_RE.finditer(text)]
+    if len(spans) <= max_words:
+        return text
+    if max_words <= 0:
+        return ""
+    return text[:spans[max_words - 1]].rstrip() + " …"
+
+
+def pack_context(docs: List[Dict[str, Any]], max_total_tokens: Optional[int] = None,
+                 max_tokens_per_source: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Đóng gói danh sách tài liệu (theo thứ tự ưu tiên) thành context cho LLM:
+    1. khử các đoạn lặp giữa các nguồn (overlap giữa các chunk, trang web trích lại sách, ...)
+    2. cắt mỗi nguồn theo ngân sách token riêng, rồi dừng khi hết ngân sách tổng
+    Chỉ các nguồn thực sự có mặt trong context mới được đánh số `[SOURCE n]`, nên danh sách
+    `sources` luôn khớp với số thứ tự mà LLM trích dẫn.
+    """
+    max_total_tokens = CONTEXT_MAX_TOKENS if max_total_tokens is None else max_total_tokens
+    max_tokens_per_source = CONTEXT_MAX_TOKENS_PER_SOURCE if max_tokens_per_source is None else max_tokens_per_source
+
+    seen_shingles = set()
+    remaining = max_total_tokens
+    context_parts = []
+    sources = []
+    for doc in docs:
+        content = (doc.get("content") or "").strip()
+        if not content:
+            continue
+        deduped = remove_seen_spans(content, seen_shingles)
+        seen_shingles.update(_shingle_keys([w.lower() for w in _WORD_RE.findall(content)], SHINGLE_WORDS))
+
+        budget = min(max_tokens_per_source, remaining)
+        packed = truncate_to_tokens(deduped, budget)
+        n_words = len(_WORD_RE.findall(packed))
+        # Bỏ nguồn rỗng, hoặc chỉ còn mảnh vụn sau khi khử lặp / cắt ngân sách
+        if n_words == 0 or (packed != content and n_words < MIN_SOURCE_WORDS):
+            continue
+
+        context_parts.append(f"[SOURCE {len(sources) + 1}]:\n{packed}")
+        sources.append({
+            "uuid": doc.get("uuid"),
+            "document_name": doc.get("document_name"),
+            "url": doc.get("url"),
+            "page": doc.get("page"),  # None cho nguồn web
+        })
+        remaining -= estimate_tokens(packed)
+        if remaining < MIN_SOURCE_WORDS * TOKENS_PER_WORD:
+            break
+
+    return {"context": "\n\n---\n\n".join(context_parts), "sources": sources}
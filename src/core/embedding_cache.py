@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.core.cache_utils import LRUCache, normalize_text
+from src.core.config import (
+    EMBEDDING_MODEL_ID,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_DISK_ENTRIES,
+)
+
+
+def make_cache_key(query: str, model_name: str) -> str:
+    """Khoá cache = hash(tên model + câu truy vấn đã chuẩn hoá)."""
+    raw = f"{model_name}\x00{normalize_text(query)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Tầng cache trên đĩa (SQLite), giữ lại embedding giữa các lần khởi động lại.
+    Vector được lưu dạng bytes float32.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, blob, time.time()),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                # Xoá các bản ghi lâu không dùng nhất
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding hai tầng: LRU trong bộ nhớ + (tuỳ chọn) SQLite trên đĩa.
+    Khi trúng tầng đĩa, vector được đưa ngược lên tầng bộ nhớ.
+    """
+
+    def __init__(self, max_size: int = 2048, disk_path: Optional[str] = None, max_disk_entries: int = 100000):
+        self.memory = LRUCache(max_size=max_size)
+        self.disk = None
+        if disk_path:
+            try:
+                self.disk = DiskEmbeddingStore(disk_path, max_entries=max_disk_entries)
+            except sqlite3.Error as e:
+                print(f"   ! Không mở được cache embedding trên đĩa ({disk_path}): {e}. Chỉ dùng cache bộ nhớ.")
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self.memory.put(key, vector)
+                return vector
+        self.misses += 1
+        return None
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        self.memory.put(key, vector)
+        if self.disk is not None:
+            self.disk.put(key, vector)
+
+    def encode(self, query: str, embedding_model, model_name: str = EMBEDDING_MODEL_ID) -> np.ndarray:
+        """Trả về embedding của `query`, chỉ gọi `embedding_model.encode` khi chưa có trong cache."""
+        key = make_cache_key(query, model_name)
+        vector = self.get(key)
+        if vector is None:
+            vector = np.asarray(embedding_model.encode(query), dtype=np.float32)
+            self.put(key, vector)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        memory_stats = self.memory.stats()
+        total = memory_stats["hits"] + self.disk_hits + self.misses
+        return {
+            "memory_hits": memory_stats["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": ((memory_stats["hits"] + self.disk_hits) / total) if total else 0.0,
+            "memory_size": memory_stats["size"],
+            "disk_size": len(self.disk) if self.disk is not None else 0,
+        }
+
+
+query_embedding_cache = EmbeddingCache(
+    max_size=EMBEDDING_CACHE_SIZE,
+    disk_path=EMBEDDING_CACHE_PATH or None,
+    max_disk_entries=EMBEDDING_CACHE_MAX_DISK_ENTRIES,
+)
+
+
+def get_query_embedding(query: str, embedding_model, model_name: str = EMBEDDING_MODEL_ID) -> List[float]:
+    """Hàm tiện ích cho retriever: embedding của câu truy vấn dạng list (đi qua cache)."""
+    return query_embedding_cache.encode(query, embedding_model, model_name=model_name).tolist()
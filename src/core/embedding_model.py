@@ -0,0 +1,16 @@
+from typing import Optional
+
+from src.core.config import embedding_model_name, EMBEDDING_BACKEND
+
+
+def load_embedding_model(backend: Optional[str] = None):
+    """
+    Tạo model embedding theo EMBEDDING_BACKEND. Cả hai backend có cùng giao diện `.encode(...)`,
+    nên dùng được cho `retriever_fn`, `get_query_embedding` và `embedd_chunks`.
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "onnx":
+        from src.core.onnx_encoder import OnnxEmbeddingEncoder
+        return OnnxEmbeddingEncoder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(embedding_model_name)
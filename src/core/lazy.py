@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Tất cả singleton đã khai báo, theo tên (dùng cho prewarm / thống kê thời gian khởi tạo)
+_REGISTRY: Dict[str, "LazySingleton"] = {}
+
+
+class LazySingleton(Generic[T]):
+    """
+    Đối tượng nặng (model, client, index) chỉ được tạo ở lần dùng đầu tiên.
+    Thread-safe: nhiều luồng gọi `get()` cùng lúc thì `factory` vẫn chỉ chạy một lần.
+    Các thuộc tính khác được chuyển tiếp tới đối tượng thật, nên có thể truyền thẳng singleton
+    vào chỗ cần model, ví dụ `embedding_model.encode(...)` chỉ tải model khi thực sự encode.
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str, closer: Optional[Callable[[T], None]] = None):
+        self._factory = factory
+        self._closer = closer
+        self._lock = threading.Lock()
+        self._instance: Optional[T] = None
+        self.name = name
+        self.init_seconds: Optional[float] = None
+        _REGISTRY[name] = self
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> T:
+        instance = self._instance
+        if instance is not None:
+            return instance
+        with self._lock:
+            if self._instance is None:
+                start = time.perf_counter()
+                self._instance = self._factory()
+                self.init_seconds = time.perf_counter() - start
+                print(f"   -> Đã khởi tạo {self.name} ({self.init_seconds:.2f}s).")
+            return self._instance
+
+    def reset(self) -> None:
+        """Huỷ đối tượng hiện tại (gọi `closer` nếu có); lần `get()` sau sẽ tạo lại."""
+        with self._lock:
+            instance, self._instance = self._instance, None
+            self.init_seconds = None
+        if instance is not None and self._closer is not None:
+            try:
+                self._closer(instance)
+            except Exception as e:
+                print(f"   ! Lỗi khi đóng {self.name}: {e}")
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+
+def singleton_stats() -> Dict[str, Dict[str, Any]]:
+    """Trạng thái và thời gian khởi tạo của từng singleton đã khai báo."""
+    return {
+        name: {"initialized": s.initialized, "init_seconds": s.init_seconds}
+        for name, s in _REGISTRY.items()
+    }
@@ -1,11 +1,8 @@
-from langchain_cohere import ChatCohere
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
 import os
 from dotenv import load_dotenv
-from langchain_core.runnables import RunnableBranch, RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from src.core.lazy import LazySingleton
 
 
 load_dotenv()
@@ -14,36 +11,49 @@ cohere_api_key = os.getenv("COHERE_API_KEY")
 openai_api_key = os.getenv("OPENAI_API_KEY")
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 
-llm_cohere = ChatCohere(
-    cohere_api_key=cohere_api_key,
-    model="command-r-plus", 
-    temperature=0.7
-
-)
-
-llm_openai = ChatOpenAI(
-    base_url="http://10.0.6.170:30132/v1", 
-    api_key=openai_api_key,
-    model="gpt-4.1",  # Model mặc định
-    temperature=0.7,
-    default_headers={"App-Code": "fresher"}, # Header bắt buộc
-    model_kwargs={"extra_body": {
-        "service": "generate_summary_for_langchain_app", # Tham số bổ sung cho logging
-   
-    }}
-)
-
-llm_gemini = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key = gemini_api_key, temperature = 0.7)
+# Mỗi client (và thư viện của nó) chỉ được import / khởi tạo khi LLM đó được dùng lần đầu
+
+def create_cohere():
+    from langchain_cohere import ChatCohere
+    return ChatCohere(
+        cohere_api_key=cohere_api_key,
+        model="command-r-plus", 
+        temperature=0.7
+
+    )
+
+def create_openai():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        base_url="http://10.0.6.170:30132/v1", 
+        api_key=openai_api_key,
+        model="gpt-4.1",  # Model mặc định
+        temperature=0.7,
+        default_headers={"App-Code": "fresher"}, # Header bắt buộc
+        model_kwargs={"extra_body": {
+            "service": "generate_summary_for_langchain_app", # Tham số bổ sung cho logging
+       
+        }}
+    )
+
+def create_gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key = gemini_api_key, temperature = 0.7)
 
 LLM_MAP = {
-    "gemini": llm_gemini,
-    "openai": llm_openai,
-    "cohere": llm_cohere,
+    "gemini": LazySingleton(create_gemini, "llm:gemini"),
+    "openai": LazySingleton(create_openai, "llm:openai"),
+    "cohere": LazySingleton(create_cohere, "llm:cohere"),
     #"default": llm_gemini
 }
 
 def get_llm(llm_choice: str):
     """Hàm tiện ích để lấy LLM từ map, nếu không có thì trả về default."""
-    return LLM_MAP.get(llm_choice, LLM_MAP["gemini"])
-
-
+    return LLM_MAP.get(llm_choice, LLM_MAP["gemini"]).get()
+
+def lazy_llm(llm_choice: str) -> Runnable:
+    """
+    Runnable đại diện cho LLM, dùng khi dựng chain lúc import: client chỉ được tạo ở lần gọi đầu tiên.
+    (RunnableLambda trả về một Runnable thì Runnable đó được gọi tiếp với cùng input, kể cả khi stream.)
+    """
+    return RunnableLambda(lambda _: get_llm(llm_choice), name=f"llm_{llm_choice}")
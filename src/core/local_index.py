@@ -0,0 +1,164 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Cấu trúc thư mục index cục bộ:
+#   vectors.f32     - ma trận float32 (n x dim) đã chuẩn hoá L2, đọc bằng np.memmap
+#   metadata.jsonl  - mỗi dòng là properties của một chunk (cùng thứ tự với hàng trong ma trận)
+#   index_info.json - số chunk, số chiều, tên model
+VECTORS_FILENAME = "vectors.f32"
+METADATA_FILENAME = "metadata.jsonl"
+INFO_FILENAME = "index_info.json"
+
+# Số hàng của ma trận được nhân mỗi lần khi tìm kiếm (giới hạn bộ nhớ tạm)
+SEARCH_BLOCK_ROWS = 32768
+
+
+def load_chunk_metadata(index_dir: str) -> List[Dict[str, Any]]:
+    """Đọc metadata.jsonl của index cục bộ."""
+    records = []
+    with open(os.path.join(index_dir, METADATA_FILENAME), "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def record_to_result(record: Dict[str, Any], score: float, rank: int, distance: Optional[float] = None) -> Dict[str, Any]:
+    """Chuyển một dòng metadata thành kết quả cùng định dạng với `safe_extract_obj`."""
+    return {
+        "uuid": record.get("uuid"),
+        "content_uuid": record.get("content_uuid"),
+        "content": record.get("content"),
+        "document_name": record.get("document_name"),
+        "page": record.get("pages"),
+        "url": record.get("url"),
+        "score": score,
+        "distance": distance,
+        "rank": rank,
+    }
+
+
+class LocalIndexWriter:
+    """
+    Ghi index cục bộ theo kiểu nối thêm: vector được ghi thẳng xuống file nhị phân,
+    metadata ghi thành từng dòng JSON, nên không cần giữ toàn bộ corpus trong RAM.
+    """
+
+    def __init__(self, index_dir: str, model_name: Optional[str] = None):
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.dim = None
+        self.count = 0
+        os.makedirs(index_dir, exist_ok=True)
+        self._vec_file = open(os.path.join(index_dir, VECTORS_FILENAME), "wb")
+        self._meta_file = open(os.path.join(index_dir, METADATA_FILENAME), "w", encoding="utf-8")
+
+    def add(self, record: Dict[str, Any], vector) -> None:
+        """`record` là properties của chunk (phải có "uuid"), `vector` là embedding của nó."""
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if self.dim is None:
+            self.dim = vec.shape[0]
+        elif vec.shape[0] != self.dim:
+            raise ValueError(f"Vector có {vec.shape[0]} chiều, index yêu cầu {self.dim} chiều.")
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        self._vec_file.write(vec.tobytes())
+        self._meta_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        self._vec_file.close()
+        self._meta_file.close()
+        info = {"count": self.count, "dim": self.dim, "model_name": self.model_name, "normalized": True}
+        with open(os.path.join(self.index_dir, INFO_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class LocalVectorIndex:
+    """
+    Index vector trong tiến trình: ma trận embedding được memory-map từ đĩa,
+    tìm top-k chính xác (exact) bằng tích ma trận theo từng khối hàng.
+    Trả kết quả cùng định dạng với `safe_extract_obj` trong retriever.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        info_path = os.path.join(index_dir, INFO_FILENAME)
+        if not os.path.exists(info_path):
+            raise FileNotFoundError(
+                f"Không tìm thấy index cục bộ tại '{index_dir}'. Hãy chạy scripts/ingest_data.py với RETRIEVAL_BACKEND=local."
+            )
+        with open(info_path, "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.count = int(self.info["count"])
+        self.dim = int(self.info["dim"] or 0)
+        if self.count:
+            self.vectors = np.memmap(
+                os.path.join(index_dir, VECTORS_FILENAME), dtype=np.float32, mode="r", shape=(self.count, self.dim)
+            )
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.records = load_chunk_metadata(index_dir)
+        if len(self.records) != self.count:
+            raise ValueError(f"Index hỏng: {self.count} vector nhưng có {len(self.records)} dòng metadata.")
+        print(f"Đã nạp index cục bộ: {self.count} chunk, {self.dim} chiều ({index_dir}).")
+
+    def search(self, query_vectors, limit: int) -> List[List[tuple]]:
+        """
+        Tìm top-`limit` cho một hoặc nhiều vector truy vấn.
+        Trả về, cho mỗi truy vấn, danh sách (row, cosine_score) giảm dần theo score.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+
+        n_queries = queries.shape[0]
+        limit = min(int(limit), self.count)
+        if limit <= 0:
+            return [[] for _ in range(n_queries)]
+
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((n_queries, 0), dtype=np.int64)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS])
+            scores = queries @ block.T  # (n_queries, block_rows)
+            rows = np.broadcast_to(np.arange(start, start + block.shape[0]), scores.shape)
+            # Gộp ứng viên của khối này với top-k hiện tại rồi chỉ giữ lại top-k
+            cand_scores = np.concatenate([best_scores, scores], axis=1)
+            cand_rows = np.concatenate([best_rows, rows], axis=1)
+            k = min(limit, cand_scores.shape[1])
+            part = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(cand_scores, part, axis=1)
+            best_rows = np.take_along_axis(cand_rows, part, axis=1)
+
+        results = []
+        for q in range(n_queries):
+            order = np.argsort(-best_scores[q], kind="stable")
+            results.append([(int(best_rows[q, i]), float(best_scores[q, i])) for i in order])
+        return results
+
+    def query(self, query_text: str, vector, alpha: float, limit: int) -> List[Dict]:
+        """Tương đương `collection.query.hybrid` cho backend cục bộ."""
+        if alpha < 1.0:
+            # Nhánh từ khoá do BM25Index đảm nhận (xem src/core/bm25_index.py)
+            print("   ! Index vector cục bộ không hỗ trợ tìm kiếm từ khoá (cần BM25_BACKEND=local), nhánh này trả về rỗng.")
+            return []
+        hits = self.search(vector, limit)[0]
+        return [
+            record_to_result(self.records[row], score, rank, distance=1.0 - score)
+            for rank, (row, score) in enumerate(hits, start=1)
+        ]
+
@@ -0,0 +1,39 @@
+import os
+import sys
+from typing import Dict, Optional
+
+
+def _read_proc_status() -> Dict[str, int]:
+    """Các dòng VmRSS / VmHWM (kB) trong /proc/self/status (chỉ có trên Linux)."""
+    values = {}
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    values[key] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def _peak_rss_kb_from_rusage() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS trả về byte, Linux trả về kB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """Bộ nhớ của tiến trình hiện tại (MB): RSS hiện tại và RSS cao nhất từ lúc khởi động."""
+    status = _read_proc_status()
+    peak_kb = status.get("VmHWM") or _peak_rss_kb_from_rusage()
+    rss_kb = status.get("VmRSS")
+    return {
+        "pid": os.getpid(),
+        "rss_mb": rss_kb / 1024 if rss_kb is not None else None,
+        "peak_rss_mb": peak_kb / 1024 if peak_kb is not None else None,
+    }
@@ -0,0 +1,124 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+import numpy as np
+
+from src.core.config import EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH_SIZE
+
+# Số mẫu gần nhất dùng để tính phân vị thời gian chờ
+STATS_WINDOW = 2048
+
+_STOP = object()
+
+
+class MicroBatchEncoder:
+    """
+    Gom các câu truy vấn đến đồng thời trong một cửa sổ ngắn (`window_ms`) rồi embed chúng
+    bằng MỘT lời gọi `embedding_model.encode(list)`, thay vì mỗi câu một lần encode.
+    Có cùng giao diện `.encode(text)` với SentenceTransformer nên dùng thay thế được trong
+    `get_query_embedding` / `retriever_fn`; gọi được từ bất kỳ luồng nào, bản async là `aencode`.
+    """
+
+    def __init__(self, embedding_model, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch_size: int = EMBED_MAX_BATCH_SIZE):
+        self.embedding_model = embedding_model
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._queue_waits = deque(maxlen=STATS_WINDOW)
+        self._batch_sizes = deque(maxlen=STATS_WINDOW)
+        self._encode_seconds = deque(maxlen=STATS_WINDOW)
+        self.total_requests = 0
+        self.total_batches = 0
+        self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    # ---------- API cho người gọi ----------
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._worker.join(timeout=5)
+
+    # ---------- Luồng gom batch ----------
+    def _collect_batch(self, first) -> List[Any]:
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # xử lý nốt batch này rồi mới dừng
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect_batch(first)
+            started = time.perf_counter()
+
+            # Câu trùng nhau trong cùng batch chỉ encode một lần
+            unique_texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = np.asarray(self.embedding_model.encode(unique_texts), dtype=np.float32)
+                by_text = dict(zip(unique_texts, vectors))
+                for text, future, _ in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self._stats_lock:
+                self.total_requests += len(batch)
+                self.total_batches += 1
+                self._batch_sizes.append(len(batch))
+                self._encode_seconds.append(time.perf_counter() - started)
+                self._queue_waits.extend(started - enqueued_at for _, _, enqueued_at in batch)
+
+    # ---------- Thống kê ----------
+    def stats(self) -> Dict[str, Any]:
+        """Thời gian chờ trong hàng đợi (từ lúc gửi tới lúc batch bắt đầu encode), kích thước batch."""
+        with self._stats_lock:
+            waits = np.array(self._queue_waits, dtype=np.float64) * 1000.0
+            sizes = np.array(self._batch_sizes, dtype=np.float64)
+            encode_ms = np.array(self._encode_seconds, dtype=np.float64) * 1000.0
+            total_requests, total_batches = self.total_requests, self.total_batches
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "total_requests": total_requests,
+            "total_batches": total_batches,
+            "pending": self._queue.qsize(),
+            "avg_batch_size": float(sizes.mean()) if sizes.size else 0.0,
+            "queue_wait_ms": {
+                "p50": float(np.percentile(waits, 50)) if waits.size else 0.0,
+                "p95": float(np.percentile(waits, 95)) if waits.size else 0.0,
+                "max": float(waits.max()) if waits.size else 0.0,
+            },
+            "avg_encode_ms": float(encode_ms.mean()) if encode_ms.size else 0.0,
+        }
@@ -0,0 +1,164 @@
+"""
+Backend ONNX Runtime (CPU, int8) cho model embedding.
+
+- `export_onnx`: xuất model trong `embedding_model_name` sang ONNX (fp32) rồi lượng tử hoá động int8
+- `OnnxEmbeddingEncoder`: encoder có cùng giao diện `.encode(...)` với SentenceTransformer,
+  dùng thay thế được trong `retriever_fn`, `get_query_embedding` và `embedd_chunks`
+
+Qwen3-Embedding dùng pooling theo token cuối (last-token) và chuẩn hoá L2, giống cấu hình
+sentence-transformers của model. Kiểm tra độ lệch so với model fp32: scripts/check_onnx_parity.py.
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from src.core.config import embedding_model_name, ONNX_MODEL_DIR, ONNX_MODEL_FILE, ONNX_MAX_LENGTH, ONNX_NUM_THREADS
+
+FP32_FILE = "model_fp32.onnx"
+INT8_FILE = "model_int8.onnx"
+INFO_FILE = "onnx_info.json"
+
+
+def export_onnx(model_name: str = embedding_model_name, output_dir: str = ONNX_MODEL_DIR,
+                opset: int = 17, quantize: bool = True) -> str:
+    """
+    Xuất model (chỉ phần transformer, không có KV cache) sang ONNX với batch / độ dài động,
+    lưu tokenizer cùng thư mục, sau đó lượng tử hoá động trọng số sang int8.
+    Trả về đường dẫn file model sẽ được dùng (int8 nếu `quantize`, ngược lại fp32).
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # attention "eager" xuất sang ONNX ổn định hơn SDPA
+    model = AutoModel.from_pretrained(model_name, torch_dtype=torch.float32, attn_implementation="eager")
+    model.config.use_cache = False
+    model.eval()
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).last_hidden_state
+
+    sample = tokenizer(["Trận Bạch Đằng năm 938", "Chiến thắng Điện Biên Phủ"], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    print(f"Đang xuất {model_name} sang ONNX (opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    model_path = fp32_path
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        model_path = os.path.join(output_dir, INT8_FILE)
+        print("Đang lượng tử hoá động sang int8...")
+        # Model fp32 > 2GB được lưu kèm external data
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+
+    with open(os.path.join(output_dir, INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "opset": opset,
+            "model_file": os.path.basename(model_path),
+            "pooling": "last_token",
+            "normalize": True,
+            "dimension": int(model.config.hidden_size),
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Hoàn tất: {model_path}")
+    return model_path
+
+
+def last_token_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Embedding = trạng thái ẩn của token thật cuối cùng (hỗ trợ cả padding trái và phải)."""
+    if attention_mask[:, -1].all():  # padding trái (mặc định của tokenizer Qwen3)
+        return hidden[:, -1]
+    last = attention_mask.sum(axis=1) - 1
+    return hidden[np.arange(hidden.shape[0]), last]
+
+
+class OnnxEmbeddingEncoder:
+    """
+    Encoder embedding chạy bằng ONNX Runtime trên CPU.
+    `encode` nhận một chuỗi (trả về vector 1 chiều) hoặc list chuỗi (trả về ma trận), giống SentenceTransformer;
+    các tham số không dùng tới của SentenceTransformer (show_progress_bar, ...) được bỏ qua.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, model_file: Optional[str] = ONNX_MODEL_FILE,
+                 max_length: int = ONNX_MAX_LENGTH, num_threads: int = ONNX_NUM_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        info_path = os.path.join(model_dir, INFO_FILE)
+        self.info: Dict[str, Any] = {}
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                self.info = json.load(f)
+        model_file = model_file or self.info.get("model_file", INT8_FILE)
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"Không tìm thấy model ONNX tại '{model_path}'. Chạy scripts/export_onnx_model.py trước."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+        self.model_path = model_path
+        print(f"Đã nạp model ONNX: {model_path}")
+
+    def get_sentence_embedding_dimension(self) -> Optional[int]:
+        return self.info.get("dimension")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        attention_mask = tokens["attention_mask"].astype(np.int64)
+        hidden = self.session.run(
+            ["last_hidden_state"],
+            {"input_ids": tokens["input_ids"].astype(np.int64), "attention_mask": attention_mask},
+        )[0]
+        return last_token_pool(hidden, attention_mask).astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension() or 0), dtype=np.float32)
+
+        # Gom các câu có độ dài gần nhau vào cùng batch để giảm padding, rồi trả lại đúng thứ tự
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        outputs: List[Optional[np.ndarray]] = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            vectors = self._encode_batch([texts[i] for i in idx])
+            for i, vector in zip(idx, vectors):
+                outputs[i] = vector
+        embeddings = np.stack(outputs)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
@@ -56,3 +56,12 @@ Ngữ cảnh: {context}
 ---
 
 Quyết định của bạn (GOOD, OKAY, hoặc BAD):""")
+
+
+# Prompt đặt tiêu đề cho cuộc hội thoại (dùng model nhanh)
+TITLE_PROMPT = ChatPromptTemplate.from_template(
+    "Dựa vào câu hỏi và câu trả lời đầu tiên dưới đây, hãy tạo ra một tiêu đề ngắn gọn (tối đa 7 từ) cho cuộc trò chuyện này.\n\n"
+    "Câu hỏi: {question}\n"
+    "Câu trả lời: {answer}\n\n"
+    "Tiêu đề:"
+)
@@ -0,0 +1,99 @@
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+from src.core.config import QUALITY_GATE_THRESHOLDS_PATH
+
+# Ngưỡng mặc định khi chưa chạy scripts/calibrate_quality_gate.py.
+# Có thể ghi đè bằng file JSON cùng khoá tại QUALITY_GATE_THRESHOLDS_PATH.
+DEFAULT_THRESHOLDS = {
+    # Độ tương đồng cosine của chunk gần nhất (nhánh vector)
+    "good_similarity": 0.75,
+    "bad_similarity": 0.55,
+    # Tỉ lệ trùng top-10 giữa nhánh BM25 và nhánh vector
+    "good_agreement": 0.2,
+    # Điểm RRF cao nhất (tối đa 2 / (RRF_K + 1) ~ 0.0328 khi cả hai nhánh cùng xếp hạng 1)
+    "good_rrf": 0.030,
+    "bad_rrf": 0.018,
+    # Chế độ "classifier": xác suất context hữu ích
+    "classifier_good_prob": 0.7,
+    "classifier_bad_prob": 0.3,
+}
+
+# Thứ tự đặc trưng của bộ phân loại logistic
+FEATURE_NAMES = ["top_vector_similarity", "leg_agreement", "top_rrf_score_scaled"]
+
+
+def load_gate_config(path: str = QUALITY_GATE_THRESHOLDS_PATH) -> Dict[str, Any]:
+    """Đọc ngưỡng (và trọng số classifier nếu có) từ file hiệu chỉnh, gộp với giá trị mặc định."""
+    config = {"thresholds": dict(DEFAULT_THRESHOLDS), "classifier": None}
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            config["thresholds"].update(data.get("thresholds", {}))
+            config["classifier"] = data.get("classifier")
+        except Exception as e:
+            print(f"   ! Lỗi khi đọc file ngưỡng quality gate {path}: {e}. Dùng ngưỡng mặc định.")
+    return config
+
+
+gate_config = load_gate_config()
+
+
+def signal_features(signals: Dict[str, Any]) -> List[float]:
+    """Vector đặc trưng cho classifier; tín hiệu thiếu được thay bằng 0."""
+    rrf = signals.get("top_rrf_score")
+    return [
+        float(signals.get("top_vector_similarity") or 0.0),
+        float(signals.get("leg_agreement") or 0.0),
+        # đưa điểm RRF về khoảng [0, 1] (RRF_K = 60)
+        float(rrf) * 61.0 / 2.0 if rrf is not None else 0.0,
+    ]
+
+
+def classifier_probability(signals: Dict[str, Any], classifier: Dict[str, Any]) -> float:
+    z = classifier.get("bias", 0.0) + sum(w * x for w, x in zip(classifier["weights"], signal_features(signals)))
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def score_quality_decision(signals: Optional[Dict[str, Any]], mode: str = "score", config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Quyết định GOOD / OKAY / BAD cục bộ từ tín hiệu retrieval, thay cho lời gọi LLM QUALITY_CHECK.
+    - GOOD: chunk gần nhất rất sát câu hỏi và (ở hybrid) hai nhánh đồng thuận
+    - BAD: chunk gần nhất vẫn xa câu hỏi
+    - OKAY: còn lại (kết hợp RAG + web)
+    """
+    config = config or gate_config
+    t = config["thresholds"]
+    if not signals or not signals.get("num_docs"):
+        return "BAD"
+
+    if mode == "classifier" and config.get("classifier"):
+        prob = classifier_probability(signals, config["classifier"])
+        if prob >= t["classifier_good_prob"]:
+            return "GOOD"
+        if prob < t["classifier_bad_prob"]:
+            return "BAD"
+        return "OKAY"
+
+    similarity = signals.get("top_vector_similarity")
+    agreement = signals.get("leg_agreement")
+    rrf = signals.get("top_rrf_score")
+
+    if similarity is not None:
+        agreement_ok = agreement is None or agreement >= t["good_agreement"]
+        if similarity >= t["good_similarity"] and agreement_ok:
+            return "GOOD"
+        if similarity < t["bad_similarity"]:
+            return "BAD"
+        return "OKAY"
+
+    # Chế độ keyword: chỉ còn điểm RRF (nếu có) để dựa vào
+    if rrf is not None:
+        if rrf >= t["good_rrf"]:
+            return "GOOD"
+        if rrf < t["bad_rrf"]:
+            return "BAD"
+    return "OKAY"
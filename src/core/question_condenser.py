@@ -0,0 +1,51 @@
+import hashlib
+import re
+from typing import Optional
+
+from src.core.cache_utils import LRUCache, normalize_text
+from src.core.config import CONDENSE_CACHE_SIZE
+
+# Các cụm từ cho thấy câu hỏi đang tham chiếu tới lượt hội thoại trước
+# (đại từ, chỉ định từ, từ nối tiếp ý). So khớp theo ranh giới âm tiết trên câu đã chuẩn hoá.
+REFERENCE_PHRASES = [
+    "ông ấy", "bà ấy", "anh ấy", "chị ấy", "cô ấy", "cậu ấy", "ông ta", "bà ta", "anh ta", "hắn",
+    "họ", "nó", "người đó", "người này", "vị này", "vị đó", "ngài",
+    "đó", "này", "ấy", "kia", "đấy", "nọ",
+    "nói trên", "kể trên", "đã nêu", "vừa rồi", "vừa nói", "câu trước", "câu hỏi trước", "lúc nãy",
+    "như vậy", "thế còn", "vậy còn", "còn gì", "thì sao",
+    "tiếp theo", "sau đó", "trước đó", "cùng thời",
+    "kể thêm", "nói thêm", "giải thích thêm", "chi tiết hơn", "cụ thể hơn", "rõ hơn",
+]
+# Từ mở đầu câu thường dùng để hỏi nối tiếp ("Còn Lê Lợi?", "Vậy tại sao...")
+CONTINUATION_STARTERS = {"còn", "vậy", "và", "nhưng", "rồi"}
+# Câu hỏi quá ngắn ("Tại sao?", "Khi nào?") gần như luôn cần ngữ cảnh
+MIN_SELF_CONTAINED_WORDS = 4
+
+_REFERENCE_RE = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(p) for p in sorted(REFERENCE_PHRASES, key=len, reverse=True)) + r")(?!\w)"
+)
+
+
+def needs_condensing(question: str, chat_history: Optional[str]) -> bool:
+    """
+    Kiểm tra nhanh (không gọi LLM) xem câu hỏi có cần viết lại theo lịch sử chat hay không.
+    Chỉ khi có lịch sử và câu hỏi có dấu hiệu tham chiếu tới lượt trước thì mới cần.
+    """
+    if not chat_history or not chat_history.strip():
+        return False
+    q = normalize_text(question)
+    words = re.findall(r"\w+", q)
+    if len(words) < MIN_SELF_CONTAINED_WORDS:
+        return True
+    if words[0] in CONTINUATION_STARTERS:
+        return True
+    return _REFERENCE_RE.search(q) is not None
+
+
+def make_condense_key(question: str, chat_history: Optional[str]) -> str:
+    raw = f"{chat_history or ''}\x00{normalize_text(question)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Cache kết quả viết lại câu hỏi: gửi lại / rerun Streamlit không gọi LLM lần nữa
+condense_cache = LRUCache(max_size=CONDENSE_CACHE_SIZE)
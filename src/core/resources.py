@@ -0,0 +1,151 @@
+import asyncio
+import atexit
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from src.core import chain, retriever
+from src.core.answer_cache import answer_cache
+from src.core.embedding_cache import query_embedding_cache
+from src.core.lazy import LazySingleton
+from src.core.llm_handle import LLM_MAP
+from src.core.memory_stats import process_memory
+from src.core.question_condenser import condense_cache
+from src.core.weaviate_client import weaviate_client
+from src.core.web_search import http_session
+
+T = TypeVar("T")
+
+
+class ResourceRegistry:
+    """
+    Tài nguyên dùng chung cho cả tiến trình (mọi session / rerun của Streamlit, mọi request của API):
+    model embedding, backend truy xuất, các LLM client và các chain đã dựng sẵn.
+    Các tài nguyên nặng là LazySingleton: `reload` huỷ để lần dùng sau tạo lại (chain giữ tham chiếu tới
+    singleton nên không cần dựng lại), `shutdown` đóng kết nối và giải phóng bộ nhớ.
+    """
+
+    def __init__(self):
+        self.embedding_model = chain.embedding_model
+        self.llms = LLM_MAP
+        self.rag_chain = chain.rag_chain
+        self.rag_context_chain = chain.rag_context_chain
+        self.title_chain = chain.title_chain
+        self.astream_final_answer = chain.astream_final_answer
+        self.astream_rag_answer = chain.astream_rag_answer
+        self.created_at = time.time()
+        self.reload_count = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+
+    # ---------- Event loop dùng chung ----------
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Event loop chạy suốt vòng đời tiến trình trên một thread nền. Client async của các LLM (grpc.aio,
+        httpx.AsyncClient) gắn với loop dùng chúng lần đầu, nên mọi coroutine phải chạy trên cùng loop này
+        thay vì `asyncio.run` (mỗi lần tạo loop mới).
+        """
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="resources-event-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Chạy `coro` trên event loop dùng chung và chờ kết quả (gọi từ code đồng bộ)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.event_loop()).result()
+
+    def iter_async(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """Duyệt async generator trên event loop dùng chung như một generator đồng bộ (cho `st.write_stream`)."""
+        loop = self.event_loop()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            # người dùng dừng giữa chừng: đóng generator trên chính loop của nó
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+    def singletons(self) -> Dict[str, LazySingleton]:
+        # Thứ tự: thành phần phụ thuộc đứng trước (collection trước client, bm25 trước local_index)
+        items = {
+            "embedding_model": self.embedding_model,
+            "bm25_index": retriever.bm25_index,
+            "local_index": retriever.local_index,
+            "weaviate_collection": retriever.collection,
+            "weaviate_client": weaviate_client,
+        }
+        items.update({f"llm:{name}": llm for name, llm in self.llms.items()})
+        return items
+
+    def warm(self, background: bool = False) -> Dict[str, Any]:
+        return chain.prewarm(background=background)
+
+    def reload(self, names: Optional[Iterable[str]] = None, clear_caches: bool = True) -> List[str]:
+        """
+        Huỷ các tài nguyên `names` (mặc định: tất cả) để lần dùng sau tạo lại, ví dụ sau khi ingest
+        lại dữ liệu hoặc đổi model. `clear_caches` xoá luôn cache câu trả lời và câu hỏi đã viết lại.
+        """
+        with self._lock:
+            selected = set(names) if names is not None else None
+            reset = []
+            for name, singleton in self.singletons().items():
+                if selected is None or name in selected:
+                    singleton.reset()
+                    reset.append(name)
+            if clear_caches:
+                if answer_cache is not None:
+                    answer_cache.clear()
+                condense_cache.clear()
+            self.reload_count += 1
+        print(f"Đã tải lại tài nguyên: {', '.join(reset) or 'không có'}.")
+        return reset
+
+    def shutdown(self) -> None:
+        """Đóng kết nối (Weaviate, HTTP) và giải phóng model / index. Gọi nhiều lần không sao."""
+        with self._lock:
+            if self.closed:
+                return
+            for singleton in self.singletons().values():
+                singleton.reset()
+            http_session.close()
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join(timeout=5)
+                self._loop.close()
+            self.closed = True
+        print("Đã giải phóng toàn bộ tài nguyên.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": process_memory(),
+            "uptime_seconds": time.time() - self.created_at,
+            "reload_count": self.reload_count,
+            "singletons": {
+                name: {"initialized": s.initialized, "init_seconds": s.init_seconds}
+                for name, s in self.singletons().items()
+            },
+            "embedding_cache": query_embedding_cache.stats(),
+            "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+            "condense_cache": condense_cache.stats(),
+        }
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """Registry của tiến trình; tạo mới nếu chưa có hoặc registry cũ đã bị shutdown."""
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.closed:
+            _registry = ResourceRegistry()
+            atexit.register(_registry.shutdown)
+        return _registry
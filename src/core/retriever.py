@@ -2,19 +2,61 @@
 
 import sys
 import os
+import time
+import asyncio
+import json
+import re
 from collections import defaultdict
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Optional
 
 # Thêm thư mục gốc của dự án (đi lên 2 cấp từ file hiện tại) vào sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from src.core.weaviate_client import client
-from src.core.config import class_name
+from src.core.config import (class_name, HYBRID_BM25_TIMEOUT, HYBRID_VECTOR_TIMEOUT, RETRIEVAL_BACKEND, BM25_BACKEND, LOCAL_INDEX_DIR,
+                            MERGE_ADJACENT_CHUNKS)
+from src.core.embedding_cache import get_query_embedding
+from src.core.context_packer import pack_context
+from src.core.lazy import LazySingleton
 
 TOP_K_BM25 = 50
 TOP_K_VEC = 50
 RRF_K = 60
+# Số kết quả đầu của mỗi nhánh dùng để đo độ đồng thuận BM25 / vector
+AGREEMENT_DEPTH = 10
+# Hai chunk chỉ được coi là cửa sổ liền kề khi phần cuối của chunk này trùng phần đầu của chunk kia ít nhất chừng này từ
+MERGE_MIN_OVERLAP_WORDS = 16
 
-collection = client.collections.get(class_name)
+# Backend được chọn theo config (Weaviate Cloud hoặc index cục bộ) và chỉ được kết nối / nạp
+# ở truy vấn đầu tiên, nên import module này không chặn lúc khởi động
+def _create_local_index():
+    from src.core.local_index import LocalVectorIndex
+    return LocalVectorIndex(LOCAL_INDEX_DIR)
+
+def _create_collection():
+    from src.core.weaviate_client import get_client
+    return get_client().collections.get(class_name)
+
+def _create_bm25_index():
+    # Nhánh từ khoá có thể phục vụ cục bộ kể cả khi nhánh vector vẫn dùng Weaviate
+    from src.core.bm25_index import BM25Index
+    records = local_index.get().records if RETRIEVAL_BACKEND == "local" else None
+    return BM25Index(LOCAL_INDEX_DIR, records=records)
+
+local_index = LazySingleton(_create_local_index, "local_index")
+collection = LazySingleton(_create_collection, "weaviate_collection")
+bm25_index = LazySingleton(_create_bm25_index, "bm25_index")
+
+def warm_retrieval_backend() -> None:
+    """Nạp trước backend đang cấu hình (dùng cho prewarm)."""
+    if RETRIEVAL_BACKEND == "local":
+        local_index.get()
+    else:
+        collection.get()
+    if BM25_BACKEND == "local":
+        bm25_index.get()
+
+# Thread pool dùng chung cho hai nhánh BM25 / vector của hybrid search
+_hybrid_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-leg")
 
 def safe_extract_obj(o):
     """
@@ -28,18 +70,22 @@ def safe_extract_obj(o):
     metadata = getattr(o, "metadata", None)
     
     score = None
+    distance = None
     if metadata: 
         score = getattr(metadata, "score", None) or \
                 getattr(metadata, "certainty", None) or \
                 getattr(metadata, "distance", None)
+        distance = getattr(metadata, "distance", None)
 
     return {
         "uuid": str(getattr(o, "uuid", None)),
+        "content_uuid": props.get("content_uuid"),
         "content": props.get("content"),
         "document_name": props.get("document_name"),
         "page": props.get("pages"),
         "url": props.get("url"),
-        "score": score
+        "score": score,
+        "distance": distance
     }
 
 
@@ -47,16 +93,31 @@ def query_hybrid_alpha(query_text, vector, alpha, limit) -> List[Dict]:
     """
     Thực hiện truy vấn hybrid và trả về danh sách các đối tượng với siêu dữ liệu.
     """
-    response = collection.query.hybrid(
-        query=query_text,
-        vector=vector,
-        alpha=alpha,
-        limit=limit,
-        query_properties=['content'],
-        # Yêu cầu Weaviate trả về các thuộc tính này
-        return_properties=["content", "document_name", "pages", "url"],
-        return_metadata=["score", "certainty", "distance"] # Yêu cầu trả về các metadata liên quan
-    )
+    if alpha == 0.0 and BM25_BACKEND == "local":
+        return bm25_index.get().query(query_text, limit)
+    if RETRIEVAL_BACKEND == "local":
+        return local_index.get().query(query_text, vector, alpha, limit)
+
+    if alpha == 1.0:
+        # alpha=1.0 chỉ dùng vector: truy vấn near_vector cho cùng thứ tự kết quả và trả về
+        # khoảng cách cosine thật (hybrid chỉ trả về score đã chuẩn hoá tương đối)
+        response = collection.get().query.near_vector(
+            near_vector=vector,
+            limit=limit,
+            return_properties=["content", "content_uuid", "document_name", "pages", "url"],
+            return_metadata=["distance"]
+        )
+    else:
+        response = collection.get().query.hybrid(
+            query=query_text,
+            vector=vector,
+            alpha=alpha,
+            limit=limit,
+            query_properties=['content'],
+            # Yêu cầu Weaviate trả về các thuộc tính này
+            return_properties=["content", "content_uuid", "document_name", "pages", "url"],
+            return_metadata=["score", "certainty", "distance"] # Yêu cầu trả về các metadata liên quan
+        )
 
     results = []
     for idx, o in enumerate(response.objects):
@@ -65,6 +126,69 @@ def query_hybrid_alpha(query_text, vector, alpha, limit) -> List[Dict]:
         results.append(info)
     return results
 
+def _record_stage(timings: Optional[Dict[str, float]], stage: str, started: float) -> None:
+    """Cộng thời gian (giây) của một bước vào `timings` nếu người gọi muốn đo."""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started)
+
+def _timed_query(timings, stage, query_text, vector, alpha, limit) -> List[Dict]:
+    started = time.perf_counter()
+    try:
+        return query_hybrid_alpha(query_text, vector, alpha, limit)
+    finally:
+        _record_stage(timings, stage, started)
+
+def run_hybrid_legs(query_text, vector, bm25_limit=TOP_K_BM25, vec_limit=TOP_K_VEC,
+                    bm25_timeout=HYBRID_BM25_TIMEOUT, vec_timeout=HYBRID_VECTOR_TIMEOUT,
+                    timings: Optional[Dict[str, float]] = None):
+    """
+    Chạy song song nhánh BM25 (alpha=0.0) và nhánh vector (alpha=1.0).
+    Mỗi nhánh có timeout riêng; nhánh nào quá hạn hoặc lỗi sẽ trả về danh sách rỗng
+    để kết quả của nhánh còn lại vẫn được dùng.
+    Với `timings`, thời gian của từng nhánh được ghi vào "bm25" / "vector" (nhánh quá hạn không được ghi).
+    """
+    legs = {
+        "bm25": (_hybrid_executor.submit(_timed_query, timings, "bm25", query_text, vector, 0.0, bm25_limit), bm25_timeout),
+        "vector": (_hybrid_executor.submit(_timed_query, timings, "vector", query_text, vector, 1.0, vec_limit), vec_timeout),
+    }
+    # Hai nhánh chạy đồng thời nên deadline tính từ lúc submit, không cộng dồn
+    start = time.monotonic()
+    results = {}
+    for name, (future, timeout) in legs.items():
+        remaining = max(0.0, timeout - (time.monotonic() - start))
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            future.cancel()
+            print(f"   ! Nhánh {name} quá thời gian ({timeout}s), bỏ qua kết quả của nhánh này.")
+            results[name] = []
+        except Exception as e:
+            print(f"   ! Nhánh {name} gặp lỗi: {e}")
+            results[name] = []
+    return results["bm25"], results["vector"]
+
+async def aquery_hybrid_alpha(query_text, vector, alpha, limit) -> List[Dict]:
+    """Phiên bản async của `query_hybrid_alpha` (client Weaviate đồng bộ được chạy trong thread riêng)."""
+    return await asyncio.to_thread(query_hybrid_alpha, query_text, vector, alpha, limit)
+
+async def arun_hybrid_legs(query_text, vector, bm25_limit=TOP_K_BM25, vec_limit=TOP_K_VEC,
+                           bm25_timeout=HYBRID_BM25_TIMEOUT, vec_timeout=HYBRID_VECTOR_TIMEOUT):
+    """Phiên bản async của `run_hybrid_legs`: hai nhánh chạy đồng thời, mỗi nhánh có timeout riêng."""
+    async def run_leg(name, alpha, limit, timeout):
+        try:
+            return await asyncio.wait_for(aquery_hybrid_alpha(query_text, vector, alpha, limit), timeout)
+        except asyncio.TimeoutError:
+            print(f"   ! Nhánh {name} quá thời gian ({timeout}s), bỏ qua kết quả của nhánh này.")
+        except Exception as e:
+            print(f"   ! Nhánh {name} gặp lỗi: {e}")
+        return []
+
+    bm25_results, vec_results = await asyncio.gather(
+        run_leg("bm25", 0.0, bm25_limit, bm25_timeout),
+        run_leg("vector", 1.0, vec_limit, vec_timeout),
+    )
+    return bm25_results, vec_results
+
 def rrf_fusion(lists_of_results, k=RRF_K, top_k=5) -> List[Dict]:
     """
     Thực hiện RRF fusion và giữ lại đầy đủ thông tin của tài liệu.
@@ -86,48 +210,203 @@ def rrf_fusion(lists_of_results, k=RRF_K, top_k=5) -> List[Dict]:
     fused.sort(key=lambda x: x["rrf_score"], reverse=True)
     return fused[:top_k]
 
+_MERGE_WORD_RE = re.compile(r"\S+")
+
+
+def _parse_pages(pages) -> List[int]:
+    """`pages` được lưu dạng chuỗi JSON ("[12, 13]"), list hoặc một số trang."""
+    if pages is None:
+        return []
+    if isinstance(pages, str):
+        try:
+            pages = json.loads(pages)
+        except ValueError:
+            return []
+    if isinstance(pages, (int, float)):
+        return [int(pages)]
+    try:
+        return [int(p) for p in pages]
+    except (TypeError, ValueError):
+        return []
+
+
+def _text_overlap(head_words: List[str], tail_words: List[str], min_overlap: int) -> int:
+    """Số từ dài nhất mà cuối `head_words` trùng với đầu `tail_words` (0 nếu ít hơn `min_overlap`)."""
+    if len(head_words) < min_overlap or len(tail_words) < min_overlap:
+        return 0
+    probe = tail_words[:min_overlap]
+    best = 0
+    for i in range(len(head_words) - min_overlap + 1):
+        if head_words[i:i + min_overlap] != probe:
+            continue
+        n = len(head_words) - i
+        if n <= len(tail_words) and head_words[i:] == tail_words[:n]:
+            best = max(best, n)
+            break  # vị trí khớp sớm nhất cho đoạn chồng lấn dài nhất
+    return best
+
+
+def _try_merge(first: Dict, second: Dict, min_overlap: int):
+    """Nối `second` vào sau `first` nếu chúng là hai cửa sổ chồng lấn liên tiếp; None nếu không."""
+    first_pages, second_pages = _parse_pages(first.get("page")), _parse_pages(second.get("page"))
+    if first_pages and second_pages and (max(first_pages) + 1 < min(second_pages) or max(second_pages) + 1 < min(first_pages)):
+        return None  # hai trang cách xa nhau: không thể là cửa sổ kề nhau
+    first_text, second_text = first.get("content") or "", second.get("content") or ""
+    second_spans = [m.span() for m in _MERGE_WORD_RE.finditer(second_text)]
+    overlap = _text_overlap(_MERGE_WORD_RE.findall(first_text), [second_text[s:e] for s, e in second_spans], min_overlap)
+    if not overlap:
+        return None
+
+    merged = dict(first if first.get("rrf_score", 0.0) >= second.get("rrf_score", 0.0) else second)
+    rest = second_text[second_spans[overlap - 1][1]:] if overlap < len(second_spans) else ""
+    merged["content"] = first_text + rest
+    pages = sorted(set(first_pages) | set(second_pages))
+    merged["page"] = json.dumps(pages) if isinstance(first.get("page"), str) else pages
+    merged["rrf_score"] = max(first.get("rrf_score", 0.0), second.get("rrf_score", 0.0))
+    distances = [d for d in (first.get("distance"), second.get("distance")) if d is not None]
+    merged["distance"] = min(distances) if distances else None
+    merged["merged_uuids"] = first.get("merged_uuids", [first["uuid"]]) + second.get("merged_uuids", [second["uuid"]])
+    # UUID theo nội dung của từng thành viên (ground truth của bộ đánh giá dùng cách tạo UUID này);
+    # object tạo trước khi có property content_uuid có uuid chính là UUID theo nội dung
+    merged["merged_content_uuids"] = (first.get("merged_content_uuids", [first.get("content_uuid") or first["uuid"]])
+                                      + second.get("merged_content_uuids", [second.get("content_uuid") or second["uuid"]]))
+    return merged
+
+
+def merge_adjacent_chunks(docs: List[Dict], min_overlap: int = MERGE_MIN_OVERLAP_WORDS) -> List[Dict]:
+    """
+    Gộp các chunk là những cửa sổ trượt liên tiếp của cùng một tài liệu (trang chồng lấn / kề nhau
+    và văn bản chồng lấn) thành một đoạn duy nhất với dải trang gộp.
+    Đoạn gộp giữ điểm RRF tốt nhất của các thành viên; kết quả được xếp hạng lại theo điểm đó.
+    """
+    groups = defaultdict(list)
+    for doc in docs:
+        groups[doc.get("document_name")].append(doc)
+
+    passages = []
+    for document_name, members in groups.items():
+        if document_name is None or len(members) == 1:
+            passages.extend(members)
+            continue
+        merged_any = True
+        while merged_any:
+            merged_any = False
+            for i in range(len(members)):
+                for j in range(len(members)):
+                    if i == j:
+                        continue
+                    merged = _try_merge(members[i], members[j], min_overlap)
+                    if merged is not None:
+                        members = [m for k, m in enumerate(members) if k not in (i, j)] + [merged]
+                        merged_any = True
+                        break
+                if merged_any:
+                    break
+        passages.extend(members)
+
+    passages.sort(key=lambda x: x.get("rrf_score", 0.0), reverse=True)
+    for rank, passage in enumerate(passages, start=1):
+        passage["rank"] = rank
+    return passages
+
+
 def format_retrieved_docs(docs: List[Dict]) -> Dict[str, any]:
     """
     Định dạng tài liệu truy xuất thành context string cho LLM và danh sách nguồn.
+    Context được đóng gói bởi `pack_context` (khử đoạn overlap giữa các chunk, giới hạn token);
+    `docs` giữ lại tài liệu gốc (có nội dung) để bước điều phối có thể đóng gói lại cùng nguồn web.
     """
-    # Tạo context string với chỉ mục nguồn
-    formatted_context = []
-    for i, doc in enumerate(docs):
-        if doc.get("content"):
-            formatted_context.append(f"[SOURCE {i+1}]:\n{doc['content']}")
-    
-    context_string = "\n\n---\n\n".join(formatted_context)
-    
-    # Tạo danh sách nguồn để hiển thị
-    sources = [
-        {
-            "document_name": doc.get("document_name"),
-            "page": doc.get("pages"),
-            "url": doc.get("url")
-        }
-        for doc in docs
-    ]
-    
-    return {"context": context_string, "sources": sources}
+    packed = pack_context(docs)
+    return {"context": packed["context"], "sources": packed["sources"], "docs": docs}
 
 
-def retriever_fn(query: str, embedding_model, search_type: str, top_k: int) -> Dict[str, any]:
+def _top_ids(results: List[Dict], depth: int) -> set:
+    return {item["uuid"] for item in results[:depth]}
+
+def compute_retrieval_signals(search_type: str, final_docs: List[Dict], bm25_results=None, vec_results=None,
+                              agreement_depth: int = AGREEMENT_DEPTH) -> Dict[str, any]:
+    """
+    Các tín hiệu chất lượng của lần truy xuất, dùng cho quality gate cục bộ (src/core/quality_gate.py):
+    - top_rrf_score: điểm RRF cao nhất (chỉ có ở chế độ hybrid)
+    - top_vector_similarity: 1 - khoảng cách cosine nhỏ nhất của nhánh vector
+    - leg_agreement: tỉ lệ trùng nhau giữa top-`agreement_depth` của nhánh BM25 và nhánh vector
+    """
+    vector_hits = vec_results if vec_results is not None else (final_docs if search_type == "semantic" else [])
+    distances = [item["distance"] for item in vector_hits if item.get("distance") is not None]
+
+    leg_agreement = None
+    if bm25_results and vec_results:
+        depth = min(agreement_depth, len(bm25_results), len(vec_results))
+        leg_agreement = len(_top_ids(bm25_results, depth) & _top_ids(vec_results, depth)) / depth
+
+    return {
+        "search_type": search_type,
+        "num_docs": len(final_docs),
+        "top_rrf_score": final_docs[0].get("rrf_score") if final_docs else None,
+        "top_vector_similarity": (1.0 - min(distances)) if distances else None,
+        "leg_agreement": leg_agreement,
+    }
+
+def retriever_fn(query: str, embedding_model, search_type: str, top_k: int,
+                 timings: Optional[Dict[str, float]] = None) -> Dict[str, any]:
     """
     Hàm retriever chính, trả về một dictionary chứa context và sources.
+    Nếu truyền `timings` (dict), thời gian từng bước (giây) được ghi vào đó: "embed", "search"
+    (semantic / keyword) hoặc "bm25" + "vector" + "legs" (hybrid, hai nhánh chạy song song), "fusion", "format".
     """
-    query_vector = embedding_model.encode(query).tolist()
+    started = time.perf_counter()
+    query_vector = get_query_embedding(query, embedding_model)
+    _record_stage(timings, "embed", started)
     final_docs = []
+    bm25_results = vec_results = None
 
     print(f"Executing {search_type} search with top_k={top_k}")
 
+    started = time.perf_counter()
     if search_type == "semantic":
         final_docs = query_hybrid_alpha(query, query_vector, alpha=1.0, limit=top_k)
+        _record_stage(timings, "search", started)
     elif search_type == "keyword":
         final_docs = query_hybrid_alpha(query, query_vector, alpha=0.0, limit=top_k)
+        _record_stage(timings, "search", started)
     else:  # Mặc định là 'hybrid'
-        bm25_results = query_hybrid_alpha(query, query_vector, alpha=0.0, limit=TOP_K_BM25)
-        vec_results = query_hybrid_alpha(query, query_vector, alpha=1.0, limit=TOP_K_VEC)
+        bm25_results, vec_results = run_hybrid_legs(query, query_vector, timings=timings)
+        _record_stage(timings, "legs", started)
+        started = time.perf_counter()
         final_docs = rrf_fusion([bm25_results, vec_results], k=RRF_K, top_k=top_k)
+        if MERGE_ADJACENT_CHUNKS:
+            final_docs = merge_adjacent_chunks(final_docs)
+        _record_stage(timings, "fusion", started)
     
     # Định dạng kết quả cuối cùng
-    return format_retrieved_docs(final_docs)
\ No newline at end of file
+    started = time.perf_counter()
+    retrieved = format_retrieved_docs(final_docs)
+    retrieved["signals"] = compute_retrieval_signals(search_type, final_docs, bm25_results, vec_results)
+    _record_stage(timings, "format", started)
+    return retrieved
+
+
+async def aretriever_fn(query: str, embedding_model, search_type: str, top_k: int) -> Dict[str, any]:
+    """
+    Phiên bản async của `retriever_fn`, dùng cho `rag_chain.ainvoke/abatch/astream`.
+    Việc encode và truy vấn Weaviate (đều là thao tác chặn) được đẩy sang thread để không khoá event loop.
+    """
+    query_vector = await asyncio.to_thread(get_query_embedding, query, embedding_model)
+
+    bm25_results = vec_results = None
+
+    print(f"Executing {search_type} search with top_k={top_k} (async)")
+
+    if search_type == "semantic":
+        final_docs = await aquery_hybrid_alpha(query, query_vector, alpha=1.0, limit=top_k)
+    elif search_type == "keyword":
+        final_docs = await aquery_hybrid_alpha(query, query_vector, alpha=0.0, limit=top_k)
+    else:  # Mặc định là 'hybrid'
+        bm25_results, vec_results = await arun_hybrid_legs(query, query_vector)
+        final_docs = rrf_fusion([bm25_results, vec_results], k=RRF_K, top_k=top_k)
+        if MERGE_ADJACENT_CHUNKS:
+            final_docs = merge_adjacent_chunks(final_docs)
+
+    retrieved = format_retrieved_docs(final_docs)
+    retrieved["signals"] = compute_retrieval_signals(search_type, final_docs, bm25_results, vec_results)
+    return retrieved
@@ -1,28 +1,47 @@
 import os
-import weaviate
-from weaviate.classes.init import Auth
-import os
 from dotenv import load_dotenv
 
+from src.core.lazy import LazySingleton
+
 load_dotenv()
 
 # Lấy từ biến môi trường
 WEAVIATE_CLUSTER_URL = os.getenv("WEAVIATE_CLUSTER_URL")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY")
 
-if not all([WEAVIATE_CLUSTER_URL, WEAVIATE_API_KEY]):
-    raise ValueError("Client URL và API KEY chưa được thiết lập.")
 
-# Khởi tạo Weaviate Client
-print("\nĐang kết nối đến Weaviate...")
-client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=WEAVIATE_CLUSTER_URL,
-    auth_credentials=Auth.api_key(WEAVIATE_API_KEY),
-)
+def create_client():
+    """Kết nối tới Weaviate Cloud (chỉ chạy ở lần dùng đầu tiên, xem `get_client`)."""
+    import weaviate
+    from weaviate.classes.init import Auth
+
+    if not all([WEAVIATE_CLUSTER_URL, WEAVIATE_API_KEY]):
+        raise ValueError("Client URL và API KEY chưa được thiết lập.")
+
+    # Khởi tạo Weaviate Client
+    print("\nĐang kết nối đến Weaviate...")
+    client = weaviate.connect_to_weaviate_cloud(
+        cluster_url=WEAVIATE_CLUSTER_URL,
+        auth_credentials=Auth.api_key(WEAVIATE_API_KEY),
+    )
+
+    if client.is_ready():
+        print("Kết nối Weaviate thành công!")
+    else:
+        client.close()
+        raise ConnectionError("Không thể kết nối đến Weaviate. Vui lòng kiểm tra URL và API Key.")
+    return client
+
+
+weaviate_client = LazySingleton(create_client, "weaviate_client", closer=lambda c: c.close())
+
 
-if client.is_ready():
-    print("Kết nối Weaviate thành công!")
-else:
-    raise ConnectionError("Không thể kết nối đến Weaviate. Vui lòng kiểm tra URL và API Key.")
+def get_client():
+    return weaviate_client.get()
 
 
+def __getattr__(name):
+    # Tương thích với `from src.core.weaviate_client import client` (kết nối khi được import tên này)
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from src.core.cache_utils import normalize_text
+from src.core.config import WEB_CACHE_PATH, WEB_SEARCH_CACHE_TTL, WEB_PAGE_CACHE_TTL, WEB_CACHE_MAX_BYTES
+
+
+class WebCache:
+    """
+    Cache bền vững (SQLite) cho hai tầng của web search:
+    - kết quả Google CSE, khoá theo câu truy vấn đã chuẩn hoá + số kết quả
+    - nội dung đã trích xuất của từng URL (nén zlib), kèm ETag / Last-Modified để revalidate có điều kiện
+    Mỗi tầng có TTL riêng; tổng dung lượng bị giới hạn, vượt quá thì xoá các mục lâu không dùng nhất.
+    """
+
+    def __init__(self, path: str, search_ttl: float = 86400, page_ttl: float = 604800, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.search_ttl = search_ttl
+        self.page_ttl = page_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS search_results (
+                key TEXT PRIMARY KEY, results BLOB NOT NULL, size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL, last_access REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY, content BLOB NOT NULL, etag TEXT, last_modified TEXT, size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL, last_access REAL NOT NULL);
+            """
+        )
+        self._conn.commit()
+        # Tổng dung lượng được cộng dồn khi ghi thay vì SUM(size) trên cả hai bảng mỗi lần ghi
+        self._total_bytes = self._total_bytes_locked()
+        self.stats_counter = {"search_hits": 0, "search_misses": 0, "page_hits": 0, "page_revalidated": 0, "page_misses": 0}
+
+    @staticmethod
+    def _search_key(query: str, num: int) -> str:
+        return hashlib.sha256(f"{num}\x00{normalize_text(query)}".encode("utf-8")).hexdigest()
+
+    # ---------- Tầng kết quả tìm kiếm ----------
+    def get_search(self, query: str, num: int) -> Optional[List[Dict[str, Any]]]:
+        key = self._search_key(query, num)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT results, fetched_at FROM search_results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.search_ttl:
+                self.stats_counter["search_misses"] += 1
+                return None
+            self._conn.execute("UPDATE search_results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats_counter["search_hits"] += 1
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put_search(self, query: str, num: int, results: List[Dict[str, Any]]) -> None:
+        blob = zlib.compress(json.dumps(results, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        key = self._search_key(query, num)
+        with self._lock:
+            old_size = self._size_locked("search_results", "key", key)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, results, size, fetched_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._total_bytes += len(blob) - old_size
+            self._evict_locked()
+            self._conn.commit()
+
+    # ---------- Tầng nội dung trang ----------
+    def get_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Trả về {"content", "etag", "last_modified", "fresh"} hoặc None.
+        Mục hết hạn vẫn được trả về (fresh=False) để người gọi revalidate bằng ETag / Last-Modified.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                self.stats_counter["page_misses"] += 1
+                return None
+            self._conn.execute("UPDATE pages SET last_access = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+        fresh = now - row[3] <= self.page_ttl
+        if fresh:
+            self.stats_counter["page_hits"] += 1
+        return {
+            "content": zlib.decompress(row[0]).decode("utf-8"),
+            "etag": row[1],
+            "last_modified": row[2],
+            "fresh": fresh,
+        }
+
+    def put_page(self, url: str, content: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        blob = zlib.compress((content or "").encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old_size = self._size_locked("pages", "url", url)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, content, etag, last_modified, size, fetched_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, blob, etag, last_modified, len(blob), now, now),
+            )
+            self._total_bytes += len(blob) - old_size
+            self._evict_locked()
+            self._conn.commit()
+
+    def mark_page_revalidated(self, url: str) -> None:
+        """Server trả 304 Not Modified: làm mới thời điểm fetch mà không tải lại nội dung."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self._conn.commit()
+            self.stats_counter["page_revalidated"] += 1
+
+    # ---------- Giới hạn dung lượng ----------
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes_locked()
+
+    def _total_bytes_locked(self) -> int:
+        a = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM search_results").fetchone()[0]
+        b = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        return a + b
+
+    def _size_locked(self, table: str, column: str, key: str) -> int:
+        row = self._conn.execute(f"SELECT size FROM {table} WHERE {column} = ?", (key,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def _evict_locked(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Tính lại tổng chính xác trước khi xoá (file cache có thể được tiến trình khác ghi cùng)
+        total = self._total_bytes_locked()
+        if total <= self.max_bytes:
+            self._total_bytes = total
+            return
+        # Xoá theo last_access tăng dần trên cả hai bảng cho tới khi còn ~90% giới hạn
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT 'search_results', key, size, last_access FROM search_results"
+            " UNION ALL SELECT 'pages', url, size, last_access FROM pages ORDER BY last_access ASC"
+        ).fetchall()
+        for table, key, size, _ in rows:
+            if total <= target:
+                break
+            column = "key" if table == "search_results" else "url"
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+            total -= size
+        self._total_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.stats_counter, total_bytes=self.total_bytes())
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_web_cache() -> Optional[WebCache]:
+    if not WEB_CACHE_PATH:
+        return None
+    try:
+        return WebCache(
+            WEB_CACHE_PATH,
+            search_ttl=WEB_SEARCH_CACHE_TTL,
+            page_ttl=WEB_PAGE_CACHE_TTL,
+            max_bytes=WEB_CACHE_MAX_BYTES,
+        )
+    except sqlite3.Error as e:
+        print(f"   ! Không mở được web cache ({WEB_CACHE_PATH}): {e}. Chạy không có cache.")
+        return None
+
+
+web_cache = create_web_cache()
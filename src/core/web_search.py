@@ -1,18 +1,50 @@
 import os
+import asyncio
+import re
+import time
 import requests
-from bs4 import BeautifulSoup
+import lxml.html
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
+
+from src.core.config import WEB_SEARCH_DEADLINE, WEB_REQUEST_TIMEOUT, WEB_SCRAPE_WORKERS
+from src.core.web_cache import web_cache
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
 
-if not all([GOOGLE_API_KEY, GOOGLE_CSE_ID]):
-    raise ValueError("GOOGLE_API_KEY và GOOGLE_CSE_ID phải được thiết lập trong file .env")
+_missing_keys_reported = False
+
+def google_keys_configured() -> bool:
+    return all([GOOGLE_API_KEY, GOOGLE_CSE_ID])
+
+def require_google_keys() -> None:
+    """Chỉ kiểm tra khoá khi web search thực sự được dùng, để app vẫn khởi động được khi thiếu khoá."""
+    if not google_keys_configured():
+        raise ValueError("GOOGLE_API_KEY và GOOGLE_CSE_ID phải được thiết lập trong file .env")
+
+SCRAPE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def create_http_session(pool_size: int = WEB_SCRAPE_WORKERS) -> requests.Session:
+    """Session dùng chung (connection pool + keep-alive) cho Google API và scraping."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(SCRAPE_HEADERS)
+    return session
+
+http_session = create_http_session()
+_scrape_executor = ThreadPoolExecutor(max_workers=WEB_SCRAPE_WORKERS, thread_name_prefix="web-scrape")
 
 def build_payload(query: str, num: int = 5, **params: Any) -> Dict[str, Any]:
+    require_google_keys()
     payload = {
         'key': GOOGLE_API_KEY,
         'cx': GOOGLE_CSE_ID,
@@ -22,18 +54,32 @@ def build_payload(query: str, num: int = 5, **params: Any) -> Dict[str, Any]:
     payload.update(params)
     return payload
 
-def make_request(payload: Dict[str, Any]) -> Dict[str, Any]:
+def make_request(payload: Dict[str, Any], timeout: float = WEB_REQUEST_TIMEOUT) -> Dict[str, Any]:
     try:
-        response = requests.get('https://www.googleapis.com/customsearch/v1', params=payload, timeout=10)
+        response = http_session.get('https://www.googleapis.com/customsearch/v1', params=payload, timeout=timeout)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Lỗi khi gọi Google API: {e}")
         return {}
 
-def get_google_search_results(query: str, num_results: int = 5) -> List[Dict[str, str]]:
+def get_google_search_results(query: str, num_results: int = 5, timeout: float = WEB_REQUEST_TIMEOUT) -> List[Dict[str, str]]:
+    if web_cache is not None:
+        cached = web_cache.get_search(query, num_results)
+        if cached is not None:
+            print("Dùng kết quả Google Search từ cache.")
+            return cached
+
+    # Thiếu khoá: bỏ qua web search (câu trả lời vẫn dùng tài liệu đã truy xuất), chỉ báo một lần
+    if not google_keys_configured():
+        global _missing_keys_reported
+        if not _missing_keys_reported:
+            print("   ! Thiếu GOOGLE_API_KEY / GOOGLE_CSE_ID trong file .env, bỏ qua web search.")
+            _missing_keys_reported = True
+        return []
+
     payload = build_payload(query, num=num_results)
-    response_json = make_request(payload)
+    response_json = make_request(payload, timeout=timeout)
     
     search_results = []
     for item in response_json.get('items', []):
@@ -42,25 +88,90 @@ def get_google_search_results(query: str, num_results: int = 5) -> List[Dict[str
             'link': item.get('link'),
             'snippet': item.get('snippet')
         })
+    # Chỉ cache khi có kết quả (lỗi quota / mạng không được lưu lại)
+    if search_results and web_cache is not None:
+        web_cache.put_search(query, num_results, search_results)
     return search_results
 
-def scrape_url_content(url: str) -> str:
+def extract_meaningful_text(html: Union[bytes, str], encoding: Optional[str] = None) -> str:
+    """
+    Lấy nội dung các thẻ <p> có hơn 10 từ. Dùng thẳng lxml.html (C) thay vì dựng cây BeautifulSoup
+    cho cả trang, nhanh hơn nhiều lần mà vẫn cùng parser với trước đây.
+    Nên truyền bytes: lxml từ chối chuỗi str có khai báo encoding (<?xml ... encoding="utf-8"?>).
+    `encoding` (nếu có) ghi đè khai báo trong trang.
+    """
+    if not html or not html.strip():
+        return ""
+    parser = lxml.html.HTMLParser(encoding=encoding) if encoding and isinstance(html, bytes) else None
+    root = lxml.html.fromstring(html, parser=parser)
+    paragraphs = [p.text_content() for p in root.iter('p')]
+    meaningful_text = " ".join(p for p in paragraphs if len(p.split()) > 10)
+    return meaningful_text.strip()
+
+_CHARSET_DECLARATION_RE = re.compile(rb"""<meta[^>]+charset|<\?xml[^>]+encoding""", re.IGNORECASE)
+
+def _response_encoding(response: requests.Response) -> Optional[str]:
+    """
+    Encoding để giải mã trang: charset trong header Content-Type, nếu không có thì để lxml đọc khai báo
+    trong trang (<meta charset>, <?xml encoding>), trang không khai báo gì thì coi là UTF-8.
+    """
+    if "charset" in response.headers.get("Content-Type", "").lower():
+        return response.encoding
+    if _CHARSET_DECLARATION_RE.search(response.content[:2048]):
+        return None
+    return "utf-8"
+
+def scrape_url_content(url: str, timeout: float = WEB_REQUEST_TIMEOUT, session: Optional[requests.Session] = None) -> str:
+    cached = web_cache.get_page(url) if web_cache is not None else None
+    if cached is not None and cached["fresh"]:
+        return cached["content"]
+
+    # Mục đã hết hạn: revalidate có điều kiện, server trả 304 thì dùng lại nội dung cũ
+    headers = {}
+    if cached is not None:
+        if cached["etag"]:
+            headers['If-None-Match'] = cached["etag"]
+        if cached["last_modified"]:
+            headers['If-Modified-Since'] = cached["last_modified"]
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = (session or http_session).get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached is not None:
+            web_cache.mark_page_revalidated(url)
+            return cached["content"]
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        paragraphs = [p.get_text() for p in soup.find_all('p')]
-        meaningful_text = " ".join(p for p in paragraphs if len(p.split()) > 10)
-        return meaningful_text.strip()
+        content = extract_meaningful_text(response.content, encoding=_response_encoding(response))
+        # Chỉ cache khi lấy được nội dung (trang rỗng / parse lỗi sẽ được thử lại ở lần sau)
+        if content and web_cache is not None:
+            web_cache.put_page(url, content, etag=response.headers.get('ETag'),
+                               last_modified=response.headers.get('Last-Modified'))
+        return content
     except requests.exceptions.RequestException as e:
         print(f"Lỗi khi scraping URL {url}: {e}")
-        return ""
+        # Không tải được trang: dùng tạm bản cache cũ nếu có
+        return cached["content"] if cached is not None else ""
     except Exception as e:
         print(f"Lỗi không xác định khi xử lý URL {url}: {e}")
-        return ""
+        # Lỗi parse / encoding khi tải lại: bản cache cũ (dù hết hạn) vẫn tốt hơn trang rỗng
+        return cached["content"] if cached is not None else ""
+
+def scrape_urls_parallel(urls: List[str], deadline: float = WEB_SEARCH_DEADLINE) -> List[str]:
+    """
+    Scrape đồng thời nhiều URL qua session dùng chung. Trang nào chưa xong khi hết `deadline`
+    (giây) sẽ bị bỏ qua (trả về chuỗi rỗng) để không kéo dài cả lượt trả lời.
+    """
+    if not urls:
+        return []
+    if deadline <= 0:
+        # hết thời gian: không gửi các request chắc chắn bị bỏ
+        return [""] * len(urls)
+    per_request_timeout = min(WEB_REQUEST_TIMEOUT, max(deadline, 0.1))
+    futures = [_scrape_executor.submit(scrape_url_content, url, per_request_timeout) for url in urls]
+    done, not_done = wait(futures, timeout=max(deadline, 0.0))
+    for future in not_done:
+        future.cancel()
+    if not_done:
+        print(f"   ! {len(not_done)} trang chưa scrape xong sau {deadline:.1f}s, bỏ qua.")
+    return [future.result() if future in done else "" for future in futures]
 
 def web_search_fn(query: str) -> List[Dict[str, Any]]:
     """
@@ -73,25 +184,44 @@ def web_search_fn(query: str) -> List[Dict[str, Any]]:
     }
     """
     print(f"Đang thực hiện Web Search cho câu hỏi: '{query}'")
+    start = time.monotonic()
     
-    search_results = get_google_search_results(query, num_results=3)
+    # Lời gọi Google cũng nằm trong deadline chung của giai đoạn web
+    search_results = get_google_search_results(query, num_results=3,
+                                               timeout=min(WEB_REQUEST_TIMEOUT, WEB_SEARCH_DEADLINE))
     
     if not search_results:
         print("Google Search không trả về kết quả nào.")
         return []
 
+    # Một deadline chung cho cả giai đoạn web (gồm cả thời gian gọi Google)
+    remaining = WEB_SEARCH_DEADLINE - (time.monotonic() - start)
+    if remaining <= 0:
+        print(f"   ! Google Search dùng hết {WEB_SEARCH_DEADLINE:.1f}s, bỏ qua bước scraping.")
+        return []
+    print(f"Đang scraping song song {len(search_results)} trang (còn {remaining:.1f}s)...")
+    contents = scrape_urls_parallel([result['link'] for result in search_results], deadline=remaining)
+
+    return build_sources_with_content(search_results, contents)
+
+def build_sources_with_content(search_results: List[Dict[str, str]], contents: List[str]) -> List[Dict[str, Any]]:
+    """Ghép kết quả Google với nội dung đã scrape, bỏ các trang không lấy được nội dung."""
     sources_with_content = []
-    for result in search_results:
-        print(f"Đang scraping: {result['link']}")
-        content = scrape_url_content(result['link'])
+    for result, content in zip(search_results, contents):
         if content:
             sources_with_content.append({
                 "document_name": result['title'],
                 "url": result['link'],
                 "content": content
             })
-            
+
     if not sources_with_content:
         print("Scraping không lấy được nội dung từ bất kỳ URL nào.")
 
-    return sources_with_content
\ No newline at end of file
+    return sources_with_content
+
+async def aweb_search_fn(query: str) -> List[Dict[str, Any]]:
+    """
+    Phiên bản async của `web_search_fn` (việc scrape vốn đã song song trên thread pool dùng chung).
+    """
+    return await asyncio.to_thread(web_search_fn, query)
@@ -0,0 +1,248 @@
+"""
+Nạp hàng loạt vào Weaviate: tự điều chỉnh kích thước batch / số request song song theo độ trễ đo được,
+thử lại các object lỗi với backoff, ghi báo cáo lỗi (JSONL) có thể nạp lại và báo cáo thông lượng.
+
+Điều chỉnh theo kiểu AIMD:
+  - batch xong nhanh hơn `target_latency` và không lỗi: tăng dần kích thước batch (x1.25),
+    sau vài batch tốt liên tiếp thì thêm một request song song
+  - batch chậm hơn `target_latency` hoặc lỗi cả batch (timeout, quá tải...): giảm nửa kích thước batch
+    và bớt một request song song
+"""
+import heapq
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Số batch tốt liên tiếp trước khi tăng số request song song
+GOOD_BATCHES_BEFORE_SCALE_UP = 3
+
+
+class BulkLoadReport:
+    """Kết quả một lần nạp: số object, thông lượng, độ trễ, số lần thử lại, object lỗi cuối cùng."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.latencies: List[float] = []
+        self.batch_sizes: List[int] = []
+        self.concurrency: List[int] = []
+        self.failure_report_path: Optional[str] = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        latencies = np.array(self.latencies or [0.0]) * 1000.0
+        return {
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "seconds": self.seconds,
+            "objects_per_second": self.succeeded / self.seconds if self.seconds else 0.0,
+            "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95))},
+            "avg_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "final_batch_size": self.batch_sizes[-1] if self.batch_sizes else 0,
+            "max_concurrency": max(self.concurrency) if self.concurrency else 0,
+            "failure_report": self.failure_report_path,
+        }
+
+    def print_summary(self) -> None:
+        s = self.as_dict()
+        print(f"--- Nạp Weaviate: {s['succeeded']}/{s['submitted']} object trong {s['seconds']:.1f}s "
+              f"({s['objects_per_second']:.1f} object/s), {s['batches']} batch, batch TB {s['avg_batch_size']:.0f} "
+              f"(cuối {s['final_batch_size']}), song song tối đa {s['max_concurrency']}, "
+              f"độ trễ p50 {s['latency_ms']['p50']:.0f} ms / p95 {s['latency_ms']['p95']:.0f} ms, "
+              f"{s['retries']} lần thử lại, {s['failed']} lỗi ---")
+        if self.failure_report_path:
+            print(f"   ! Object lỗi được ghi tại {self.failure_report_path} (nạp lại: scripts/ingest_data.py --replay-failures)")
+
+
+class AdaptiveBulkLoader:
+    """
+    Nạp các chunk {"uuid", "content", "vector", "metadata"} vào `collection` bằng `collection.data.insert_many`,
+    nhiều batch song song trên thread pool. Nguồn được đọc dần (có thể là generator), số object đang
+    xử lý tối đa là batch_size x số request song song.
+    """
+
+    def __init__(self, collection, batch_size: int = 100, min_batch_size: int = 10, max_batch_size: int = 1000,
+                 concurrency: int = 2, max_concurrency: int = 8, target_latency: float = 2.0,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 failure_report_path: Optional[str] = None):
+        self.collection = collection
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = min(max(1, concurrency), self.max_concurrency)
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_report_path = failure_report_path
+        self._good_streak = 0
+
+    # ---------- Gửi một batch ----------
+    def _insert(self, items: List[Dict[str, Any]]):
+        """Trả về (độ trễ, {vị trí trong batch: thông báo lỗi}, lỗi cả batch hay không)."""
+        from weaviate.classes.data import DataObject
+        from src.data_processing.ingestion_utils import prepare_properties_from_metadata
+
+        started = time.perf_counter()
+        try:
+            objects = [
+                # vector numpy float32 được client tự đóng gói, không cần đổi sang list
+                DataObject(properties=prepare_properties_from_metadata(item["content"], item["metadata"]),
+                           vector=item["vector"], uuid=item["uuid"])
+                for item in items
+            ]
+            result = self.collection.data.insert_many(objects)
+        except Exception as e:
+            message = f"{type(e).__name__}: {e}"
+            return time.perf_counter() - started, {i: message for i in range(len(items))}, True
+        errors = {int(i): getattr(err, "message", str(err)) for i, err in (getattr(result, "errors", None) or {}).items()}
+        return time.perf_counter() - started, errors, False
+
+    def _tune(self, latency: float, batch_failed: bool) -> None:
+        if batch_failed or latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.concurrency = max(1, self.concurrency - 1)
+            self._good_streak = 0
+            return
+        self.batch_size = min(self.max_batch_size, max(self.batch_size + 1, int(self.batch_size * 1.25)))
+        self._good_streak += 1
+        if self._good_streak >= GOOD_BATCHES_BEFORE_SCALE_UP and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self._good_streak = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # exponential backoff có jitter để các batch lỗi không cùng thử lại một lúc
+        return min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))) * random.uniform(0.5, 1.0)
+
+    # ---------- Vòng nạp chính ----------
+    def load(self, chunks_with_embeddings: Iterable[Dict[str, Any]]) -> BulkLoadReport:
+        from src.data_processing.ingestion_utils import generate_uuid
+
+        report = BulkLoadReport()
+        source: Iterator[Dict[str, Any]] = iter(chunks_with_embeddings)
+        source_done = False
+        retry_heap: List = []   # (thời điểm được thử lại, seq, item)
+        seq = 0
+        failures: List[Dict[str, Any]] = []
+        in_flight: Dict[Any, List[Dict[str, Any]]] = {}
+
+        def next_batch() -> List[Dict[str, Any]]:
+            nonlocal source_done
+            batch = []
+            now = time.monotonic()
+            while retry_heap and retry_heap[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(retry_heap)[2])
+            while not source_done and len(batch) < self.batch_size:
+                try:
+                    data_obj = next(source)
+                except StopIteration:
+                    source_done = True
+                    break
+                content = data_obj.get("content", "")
+                metadata = data_obj.get("metadata", {}) or {}
+                batch.append({
+                    "uuid": data_obj.get("uuid") or generate_uuid(content, metadata),
+                    "content": content,
+                    "metadata": metadata,
+                    "vector": data_obj.get("vector"),
+                    "attempts": data_obj.get("attempts", 0),
+                })
+                report.submitted += 1
+            return batch
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="weaviate-bulk") as executor:
+            while True:
+                while len(in_flight) < self.concurrency:
+                    batch = next_batch()
+                    if not batch:
+                        break
+                    in_flight[executor.submit(self._insert, batch)] = batch
+                    report.concurrency.append(len(in_flight))
+                if not in_flight:
+                    if source_done and not retry_heap:
+                        break
+                    # chỉ còn object chờ thử lại: đợi tới lượt sớm nhất
+                    time.sleep(max(0.0, retry_heap[0][0] - time.monotonic()))
+                    continue
+
+                # còn chỗ cho batch mới thì thức dậy khi có object tới lượt thử lại
+                timeout = None
+                if retry_heap and len(in_flight) < self.concurrency:
+                    timeout = max(0.0, retry_heap[0][0] - time.monotonic())
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED, timeout=timeout)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    latency, errors, batch_failed = future.result()
+                    report.batches += 1
+                    report.latencies.append(latency)
+                    report.batch_sizes.append(len(batch))
+                    report.succeeded += len(batch) - len(errors)
+                    self._tune(latency, batch_failed)
+                    for i, message in errors.items():
+                        item = batch[i]
+                        item["attempts"] += 1
+                        item["error"] = message
+                        if item["attempts"] <= self.max_retries:
+                            report.retries += 1
+                            seq += 1
+                            heapq.heappush(retry_heap, (time.monotonic() + self._backoff(item["attempts"]), seq, item))
+                        else:
+                            failures.append(item)
+
+        report.failed = len(failures)
+        report.finished = time.perf_counter()
+        if failures and self.failure_report_path:
+            write_failure_report(self.failure_report_path, failures)
+            report.failure_report_path = self.failure_report_path
+        elif self.failure_report_path and os.path.exists(self.failure_report_path):
+            # báo cáo của lần chạy trước đã lỗi thời: không để --replay-failures nạp lại object cũ
+            os.remove(self.failure_report_path)
+        return report
+
+
+def write_failure_report(path: str, failures: List[Dict[str, Any]]) -> None:
+    """Mỗi dòng một object lỗi (uuid, content, metadata, vector, lỗi cuối, số lần thử) để nạp lại được."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for item in failures:
+            vector = item.get("vector")
+            f.write(json.dumps({
+                "uuid": item["uuid"],
+                "content": item["content"],
+                "metadata": item["metadata"],
+                "vector": np.asarray(vector, dtype=np.float32).tolist() if vector is not None else None,
+                "error": item.get("error"),
+                "attempts": item.get("attempts", 0),
+            }, ensure_ascii=False) + "\n")
+
+
+def read_failure_report(path: str) -> Iterator[Dict[str, Any]]:
+    """Đọc báo cáo lỗi thành các chunk dùng lại được cho `AdaptiveBulkLoader.load` (số lần thử được đặt lại)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("vector") is not None:
+                item["vector"] = np.asarray(item["vector"], dtype=np.float32)
+            item.pop("error", None)
+            item["attempts"] = 0
+            yield item
@@ -0,0 +1,102 @@
+"""
+Sửa lỗi OCR / font theo bảng tra (sai -> đúng) trong MỘT lượt quét.
+
+Các mục của bảng được dựng thành một trie rồi biên dịch thành một regex duy nhất, nên chi phí
+mỗi trang gần như không phụ thuộc số mục (kể cả từ điển ngoài hàng chục nghìn mục):
+  - ưu tiên mục khớp DÀI NHẤT tại mỗi vị trí ("I I I" -> "III" chứ không phải "II I")
+  - chỉ khớp trọn từ: trước / sau mục không được là chữ cái, chữ số hay dấu thanh tổ hợp tiếng Việt,
+    nên "bo" không sửa nhầm bên trong "bom", "sô" không sửa nhầm bên trong "sông"
+  - văn bản đã thay không bị quét lại, nên các mục không sửa chồng lên kết quả của nhau
+"""
+import json
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+# Ký tự được coi là một phần của từ: \w (Unicode) và dấu thanh tổ hợp (văn bản PDF chưa chuẩn hoá NFC)
+_WORD_CHARS = r"\w\u0300-\u036f"
+_END = ""
+
+
+def _trie_to_regex(node: dict) -> Optional[str]:
+    """Biên dịch một nút trie thành regex; nhóm `?` tham lam nên nhánh dài hơn được thử trước."""
+    is_end = _END in node
+    branches = []
+    singles = []
+    for ch in sorted(k for k in node if k != _END):
+        sub = _trie_to_regex(node[ch])
+        if sub is None:
+            singles.append(re.escape(ch))
+        else:
+            branches.append(re.escape(ch) + sub)
+    if not branches and not singles:
+        return None
+    if singles:
+        branches.append(singles[0] if len(singles) == 1 else "[" + "".join(singles) + "]")
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if is_end:
+        # nhánh con là tuỳ chọn: khớp dài nhất trước, không được thì lùi về mục ngắn hơn
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+class CorrectionEngine:
+    """Bộ sửa lỗi dựng một lần từ bảng tra; `apply(text)` sửa toàn bộ văn bản trong một lượt."""
+
+    def __init__(self, correction_map: Dict[str, str]):
+        # bỏ mục rỗng và mục không đổi gì (ví dụ "sống dã" -> "sống dã")
+        self.mapping = {wrong: correct for wrong, correct in correction_map.items() if wrong and wrong != correct}
+        self.pattern = None
+        if self.mapping:
+            trie: dict = {}
+            for wrong in self.mapping:
+                node = trie
+                for ch in wrong:
+                    node = node.setdefault(ch, {})
+                node[_END] = True
+            self.pattern = re.compile(f"(?<![{_WORD_CHARS}])(?:{_trie_to_regex(trie)})(?![{_WORD_CHARS}])")
+
+    def __len__(self) -> int:
+        return len(self.mapping)
+
+    def apply(self, text: str) -> str:
+        if self.pattern is None or not text:
+            return text
+        mapping = self.mapping
+        return self.pattern.sub(lambda m: mapping[m.group(0)], text)
+
+
+def iter_correction_file(path: str) -> Iterable[Tuple[str, str]]:
+    """
+    Đọc từ điển sửa lỗi ngoài:
+      - .json: object {"sai": "đúng", ...}
+      - định dạng khác: mỗi dòng "sai<TAB>đúng", bỏ qua dòng trống và dòng bắt đầu bằng "#"
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"Từ điển sửa lỗi {path} phải là một object JSON.")
+        yield from data.items()
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line or line.startswith("#"):
+                continue
+            wrong, sep, correct = line.partition("\t")
+            if sep:
+                yield wrong, correct
+
+
+def build_correction_engine(correction_map: Dict[str, str], extra_paths: Iterable[str] = ()) -> CorrectionEngine:
+    """Gộp bảng tra có sẵn với các từ điển ngoài (mục trong file sau ghi đè mục trước)."""
+    merged = dict(correction_map)
+    for path in extra_paths:
+        if not os.path.exists(path):
+            print(f"   ! Không tìm thấy từ điển sửa lỗi tại: {path}. Bỏ qua.")
+            continue
+        before = len(merged)
+        merged.update(iter_correction_file(path))
+        print(f"   -> Đã nạp từ điển sửa lỗi {path} ({len(merged) - before} mục mới).")
+    return CorrectionEngine(merged)
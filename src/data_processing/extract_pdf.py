@@ -2,6 +2,15 @@ import fitz  # PyMuPDF
 import os
 import re
 import json
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from src.data_processing.corrections import CorrectionEngine, build_correction_engine
 
 # ---------- CẤU HÌNH CHUNG ----------
 MARGIN_TOP = 60
@@ -13,6 +22,11 @@ MARGIN_BOTTOM_FALLBACK = 80
 # Chunk theo số từ
 CHUNK_SIZE_WORDS = 200
 CHUNK_OVERLAP_WORDS = 50
+# Chế độ theo câu: chunk chỉ được lùi về cuối câu nếu còn ít nhất tỉ lệ này của CHUNK_SIZE_WORDS
+SENTENCE_MIN_FRACTION = 0.5
+
+# Trích xuất song song: sách dài hơn số trang này được chia thành nhiều task
+MAX_PAGES_PER_TASK = 150
 
 # Đường dẫn tới file config (JSON)
 # JSON expected structure:
@@ -23,6 +37,10 @@ CHUNK_OVERLAP_WORDS = 50
 # }
 CONFIG_PATH = "/content/config.json"
 
+# Từ điển sửa lỗi bổ sung (JSON hoặc TSV "sai<TAB>đúng"), nhiều file phân tách bằng os.pathsep.
+# Được gộp với CORRECTION_MAP bên dưới (mục trong file ghi đè mục có sẵn).
+CORRECTION_DICT_PATHS = [p for p in os.getenv("CORRECTION_DICT_PATHS", "").split(os.pathsep) if p]
+
 # ---------- BẢN ĐỒ SỬA LỖI (giữ nguyên) ----------
 CORRECTION_MAP = {
     "lịch sừ": "lịch sử",
@@ -139,10 +157,23 @@ def find_config_for_filename(filename, config_dict):
     # no match
     return None, None
 
-def apply_corrections(text, correction_map):
-    for wrong, correct in correction_map.items():
-        text = text.replace(wrong, correct)
-    return text
+_correction_engine = None
+
+def get_correction_engine():
+    """Engine sửa lỗi của tiến trình (CORRECTION_MAP + CORRECTION_DICT_PATHS), dựng ở lần dùng đầu tiên."""
+    global _correction_engine
+    if _correction_engine is None:
+        _correction_engine = build_correction_engine(CORRECTION_MAP, CORRECTION_DICT_PATHS)
+    return _correction_engine
+
+def apply_corrections(text, correction_map=CORRECTION_MAP):
+    """
+    Sửa lỗi trong một lượt quét (khớp dài nhất, trọn từ), xem src/data_processing/corrections.py.
+    Với CORRECTION_MAP dùng engine dựng sẵn của tiến trình; bảng tra khác thì dựng engine riêng.
+    """
+    if correction_map is CORRECTION_MAP:
+        return get_correction_engine().apply(text)
+    return CorrectionEngine(correction_map).apply(text)
 
 def remove_citation_numbers(text):
     citation_regex = r'(?<=[\w"”’)])\d+'
@@ -179,48 +210,65 @@ def find_separator_y_by_gap_detection(page):
     return separator_y
 
 # ---------- Trích xuất từng trang ----------
+def resolve_page_range(pdf_path, start_page=None, end_page=None, total_pages=None):
+    """
+    Chuyển dải trang 1-based trong config thành (start_index, end_index) 0-based, end không tính.
+    Trả về None nếu dải trang không hợp lệ.
+    """
+    if total_pages is None:
+        with fitz.open(pdf_path) as doc:
+            total_pages = len(doc)
+
+    start_index = (start_page - 1) if start_page else 0
+    end_index = end_page if end_page else total_pages
+
+    if start_index < 0 or start_index >= total_pages:
+        start_index = 0
+        print(f"   ! Cảnh báo: start_page không hợp lệ cho {os.path.basename(pdf_path)}, sẽ bắt đầu từ trang 1.")
+    if end_index > total_pages:
+        end_index = total_pages
+    if start_index >= end_index:
+        print(f"   ! Lỗi dải trang cho {os.path.basename(pdf_path)}. Bỏ qua file này.")
+        return None
+    return start_index, end_index
+
+def extract_page_text(page):
+    separator_y = find_separator_y_by_gap_detection(page)
+
+    if separator_y:
+        bottom_boundary = separator_y - SEPARATOR_PADDING
+    else:
+        bottom_boundary = page.rect.height - MARGIN_BOTTOM_FALLBACK
+
+    content_rect = fitz.Rect(MARGIN_X, MARGIN_TOP, page.rect.width - MARGIN_X, bottom_boundary)
+    text = page.get_text("text", clip=content_rect)
+
+    text = clean_and_join_text(text)
+    text = remove_citation_numbers(text)
+    text = apply_corrections(text, CORRECTION_MAP)
+    return text
+
+def extract_page_range(doc, start_index, end_index):
+    page_texts = []
+    page_numbers = []
+    for page_num in range(start_index, end_index):
+        page_texts.append(extract_page_text(doc.load_page(page_num)))
+        page_numbers.append(page_num + 1)  # 1-based
+    return page_texts, page_numbers
+
 def extract_pages_from_pdf(pdf_path, start_page=None, end_page=None):
     try:
         doc = fitz.open(pdf_path)
-        total_pages = len(doc)
-
-        start_index = (start_page - 1) if start_page else 0
-        end_index = end_page if end_page else total_pages
-
-        if start_index < 0 or start_index >= total_pages:
-            start_index = 0
-            print(f"   ! Cảnh báo: start_page không hợp lệ cho {os.path.basename(pdf_path)}, sẽ bắt đầu từ trang 1.")
-        if end_index > total_pages:
-            end_index = total_pages
-        if start_index >= end_index:
-            print(f"   ! Lỗi dải trang cho {os.path.basename(pdf_path)}. Bỏ qua file này.")
+        page_range = resolve_page_range(pdf_path, start_page, end_page, total_pages=len(doc))
+        if page_range is None:
             doc.close()
             return None, None
+        start_index, end_index = page_range
 
         print(f"-> Đang xử lý file: {os.path.basename(pdf_path)}")
         print(f"   -> Sẽ trích xuất từ trang {start_index + 1} đến trang {end_index} (tổng cộng {end_index - start_index} trang).")
 
-        page_texts = []
-        page_numbers = []
-
-        for page_num in range(start_index, end_index):
-            page = doc.load_page(page_num)
-            separator_y = find_separator_y_by_gap_detection(page)
-
-            if separator_y:
-                bottom_boundary = separator_y - SEPARATOR_PADDING
-            else:
-                bottom_boundary = page.rect.height - MARGIN_BOTTOM_FALLBACK
-
-            content_rect = fitz.Rect(MARGIN_X, MARGIN_TOP, page.rect.width - MARGIN_X, bottom_boundary)
-            text = page.get_text("text", clip=content_rect)
-
-            text = clean_and_join_text(text)
-            text = remove_citation_numbers(text)
-            text = apply_corrections(text, CORRECTION_MAP)
-
-            page_texts.append(text)
-            page_numbers.append(page_num + 1)  # 1-based
+        page_texts, page_numbers = extract_page_range(doc, start_index, end_index)
 
         doc.close()
         total_words = sum(len(t.split()) for t in page_texts)
@@ -231,13 +279,180 @@ def extract_pages_from_pdf(pdf_path, start_page=None, end_page=None):
         print(f"*** Lỗi khi xử lý file {pdf_path}: {e}")
         return None, None
 
+# ---------- Trích xuất song song bằng process pool ----------
+def split_page_range(start_index, end_index, max_pages_per_task=MAX_PAGES_PER_TASK):
+    """Chia dải trang của sách lớn thành các đoạn liên tiếp, mỗi đoạn là một task."""
+    step = max(1, int(max_pages_per_task))
+    return [(s, min(s + step, end_index)) for s in range(start_index, end_index, step)]
+
+def extract_range_task(task):
+    """
+    Chạy trong tiến trình con: trích xuất một dải trang của một file.
+    Không ném lỗi ra ngoài: lỗi được trả về trong kết quả để chỉ file đó bị bỏ qua.
+    """
+    file_idx, pdf_path, start_index, end_index = task
+    started = time.perf_counter()
+    result = {"file_idx": file_idx, "start_index": start_index, "pid": os.getpid(), "pages": end_index - start_index}
+    try:
+        with fitz.open(pdf_path) as doc:
+            result["page_texts"], result["page_numbers"] = extract_page_range(doc, start_index, end_index)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def failed_task_result(task, error):
+    """Kết quả của task không chạy xong được trong tiến trình con (tiến trình chết, lỗi pickle...)."""
+    file_idx, _, start_index, _ = task
+    return {"file_idx": file_idx, "start_index": start_index, "pid": None, "pages": 0, "seconds": 0.0,
+            "error": f"{type(error).__name__}: {error}"}
+
+def run_task_isolated(task):
+    """Chạy lại một task trong process pool riêng một worker, để biết chính nó có làm tiến trình con chết không."""
+    with ProcessPoolExecutor(max_workers=1) as solo:
+        try:
+            return solo.submit(extract_range_task, task).result()
+        except Exception as e:
+            return failed_task_result(task, e)
+
+def iter_extraction_results(tasks, max_workers=None, max_in_flight=None):
+    """
+    Chạy các task trên process pool (hoặc tuần tự khi chỉ có 1 worker) và trả về kết quả theo thứ tự task.
+    Chỉ có tối đa `max_in_flight` task (mặc định 2 x số worker) đang chạy / chờ lấy kết quả cùng lúc,
+    nên bộ nhớ không tăng theo số file trong thư viện.
+    Task lỗi (kể cả khi tiến trình con chết hẳn, ví dụ MuPDF segfault với PDF hỏng) trả về kết quả có "error";
+    pool bị hỏng được dựng lại và các task đang chờ được gửi lại.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(tasks) <= 1:
+        for t in tasks:
+            yield extract_range_task(t)
+        return
+    max_in_flight = max(1, max_in_flight or 2 * max_workers)
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    pending = deque()  # (task, future)
+    remaining = iter(tasks)
+
+    def refill():
+        while len(pending) < max_in_flight:
+            t = next(remaining, None)
+            if t is None:
+                break
+            pending.append((t, executor.submit(extract_range_task, t)))
+
+    try:
+        refill()
+        # lấy kết quả theo đúng thứ tự task nên đầu ra luôn xác định, bất kể tiến trình nào xong trước
+        while pending:
+            task, future = pending.popleft()
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                # một tiến trình con chết hẳn: mọi task đang chạy đều mất, không biết task nào gây ra.
+                # Chạy riêng task đầu hàng đợi (chết lần nữa thì chính nó là file hỏng), rồi gửi lại các task còn lại
+                print("   ! Tiến trình trích xuất bị dừng đột ngột, dựng lại process pool.")
+                executor.shutdown(wait=True, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+                result = run_task_isolated(task)
+                lost = [t for t, _ in pending]
+                pending.clear()
+                pending.extend((t, executor.submit(extract_range_task, t)) for t in lost)
+            except Exception as e:
+                result = failed_task_result(task, e)
+            refill()
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def run_extraction_tasks(tasks, max_workers=None):
+    """Chạy các task trên process pool (hoặc tuần tự khi chỉ có 1 worker), trả về kết quả theo thứ tự task."""
+    return list(iter_extraction_results(tasks, max_workers=max_workers))
+
+def report_worker_throughput(results, wall_seconds):
+    per_worker = defaultdict(lambda: {"tasks": 0, "pages": 0, "seconds": 0.0})
+    for r in results:
+        if r["pid"] is None:
+            continue  # task không chạy xong trong tiến trình con
+        stats = per_worker[r["pid"]]
+        stats["tasks"] += 1
+        stats["pages"] += r["pages"]
+        stats["seconds"] += r["seconds"]
+    total_pages = sum(r["pages"] for r in results)
+    print(f"\n--- Thông lượng trích xuất: {total_pages} trang trong {wall_seconds:.1f}s "
+          f"({total_pages / wall_seconds if wall_seconds else 0:.1f} trang/s, {len(per_worker)} worker) ---")
+    for i, (pid, stats) in enumerate(sorted(per_worker.items()), start=1):
+        rate = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"   worker {i} (pid {pid}): {stats['tasks']} task, {stats['pages']} trang, "
+              f"bận {stats['seconds']:.1f}s, {rate:.1f} trang/s")
+    return dict(per_worker)
+
 # ---------- Chunk theo số từ với mapping page offsets ----------
-def chunk_full_text_by_words(full_text, page_offsets, chunk_size_words=CHUNK_SIZE_WORDS, chunk_overlap_words=CHUNK_OVERLAP_WORDS):
+# Mã các ký tự khoảng trắng theo str.isspace() (trùng với \s của re), ký tự lớn nhất là U+3000
+_WHITESPACE_CODES = np.array([c for c in range(0x3001) if chr(c).isspace()], dtype=np.uint32)
+# Dấu kết thúc câu và các ký tự đóng có thể theo sau (ngoặc, nháy)
+_SENTENCE_END_CODES = np.array([ord(c) for c in ".!?…"], dtype=np.uint32)
+_SENTENCE_CLOSER_CODES = np.array([ord(c) for c in "\"'”’)]»"], dtype=np.uint32)
+
+def _char_codes(text):
+    # utf-32: mỗi ký tự một phần tử, chỉ số trùng với chỉ số trong chuỗi Python
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+def word_boundaries(text):
+    """
+    Vị trí (start, end) của mọi từ (chuỗi ký tự không phải khoảng trắng, như r'\\S+') dưới dạng hai mảng int64,
+    tính bằng numpy trên mảng mã ký tự thay vì tạo một match object cho mỗi từ.
+    """
+    is_word = ~np.isin(_char_codes(text), _WHITESPACE_CODES)
+    # biên của các đoạn liên tiếp is_word = True
+    edges = np.diff(np.concatenate(([False], is_word, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends
+
+def sentence_end_words(text, word_starts, word_ends, max_closers=3):
+    """Chỉ số các từ kết thúc câu (tận cùng bằng . ! ? …, có thể kèm tối đa `max_closers` ngoặc / nháy đóng)."""
+    codes = _char_codes(text)
+    pos = word_ends - 1
+    for _ in range(max_closers):
+        closer = np.isin(codes[pos], _SENTENCE_CLOSER_CODES) & (pos > word_starts)
+        if not closer.any():
+            break
+        pos = np.where(closer, pos - 1, pos)
+    return np.flatnonzero(np.isin(codes[pos], _SENTENCE_END_CODES)).tolist()
+
+def page_spans(page_offsets, text_len, char_starts, char_ends):
+    """
+    Danh sách số trang mà mỗi đoạn [start, end) phủ lên: trang i được tính nếu start < offset trang sau
+    và end > offset trang i (giống cách quét tuyến tính cũ), tìm bằng bisect nên O(log số trang) mỗi đoạn.
+    """
+    page_nums = [p for p, _ in page_offsets]
+    offsets = [o for _, o in page_offsets]
+    next_offsets = offsets[1:] + [text_len]
+    if any(a > b for a, b in zip(offsets, next_offsets)):
+        # offset không tăng dần (không xảy ra với full_text tự dựng): quét tuyến tính như cũ
+        return [
+            [p for p, o, n in zip(page_nums, offsets, next_offsets) if s < n and e > o]
+            for s, e in zip(char_starts, char_ends)
+        ]
+    spans = []
+    for s, e in zip(char_starts, char_ends):
+        lo = bisect_right(next_offsets, s)   # trang đầu tiên có offset trang sau > start
+        hi = bisect_left(offsets, e)         # số trang có offset < end
+        spans.append(page_nums[lo:hi])
+    return spans
+
+def chunk_full_text_by_words(full_text, page_offsets, chunk_size_words=CHUNK_SIZE_WORDS, chunk_overlap_words=CHUNK_OVERLAP_WORDS, sentence_aware=False):
+    """
+    Chia `full_text` thành các chunk `chunk_size_words` từ, chồng lấn `chunk_overlap_words` từ, kèm các trang
+    mỗi chunk phủ lên. Biên từ được tính một lần thành mảng số nguyên, trang được tra bằng bisect.
+    `sentence_aware`: lùi cuối chunk về cuối câu gần nhất và đầu chunk sau về đầu câu gần nhất trong vùng
+    chồng lấn (tra bằng bisect trên danh sách cuối câu), miễn chunk còn ít nhất SENTENCE_MIN_FRACTION kích thước.
+    """
     if not full_text:
         return []
 
-    tokens = list(re.finditer(r'\S+', full_text))
-    n_words = len(tokens)
+    starts, ends = word_boundaries(full_text)
+    n_words = len(starts)
     if n_words == 0:
         return []
 
@@ -245,58 +460,59 @@ def chunk_full_text_by_words(full_text, page_offsets, chunk_size_words=CHUNK_SIZ
     chunk_overlap = max(0, int(chunk_overlap_words))
     step = max(1, chunk_size - chunk_overlap)
 
-    chunks = []
-    start_word_idx = 0
-    text_len = len(full_text)
-
-    while start_word_idx < n_words:
-        end_word_idx_excl = min(n_words, start_word_idx + chunk_size)
-        start_char = tokens[start_word_idx].start()
-        end_char = tokens[end_word_idx_excl - 1].end()
-
-        chunk_text = full_text[start_char:end_char]
-
-        # pages covered
-        pages_in_chunk = []
-        for i, (page_num, offset) in enumerate(page_offsets):
-            next_offset = page_offsets[i + 1][1] if i + 1 < len(page_offsets) else text_len
-            if start_char < next_offset and end_char > offset:
-                pages_in_chunk.append(page_num)
-
-        chunks.append({
-            "text": chunk_text,
+    # dải từ [first, last] của từng chunk
+    word_ranges = []
+    if not sentence_aware:
+        for start_word_idx in range(0, n_words, step):
+            end_word_idx_excl = min(n_words, start_word_idx + chunk_size)
+            word_ranges.append((start_word_idx, end_word_idx_excl - 1))
+            if end_word_idx_excl >= n_words:
+                break
+    else:
+        sentence_ends = sentence_end_words(full_text, starts, ends)
+        min_size = max(1, int(chunk_size * SENTENCE_MIN_FRACTION))
+        start_word_idx = 0
+        while start_word_idx < n_words:
+            end_word_idx_excl = min(n_words, start_word_idx + chunk_size)
+            if end_word_idx_excl < n_words:
+                # cuối câu cuối cùng nằm trong chunk, nếu chunk không bị ngắn quá
+                k = bisect_right(sentence_ends, end_word_idx_excl - 1) - 1
+                if k >= 0 and sentence_ends[k] + 1 - start_word_idx >= min_size:
+                    end_word_idx_excl = sentence_ends[k] + 1
+            word_ranges.append((start_word_idx, end_word_idx_excl - 1))
+            if end_word_idx_excl >= n_words:
+                break
+            # đầu chunk sau: lùi chunk_overlap từ, rồi tiến tới đầu câu gần nhất trong vùng chồng lấn
+            # (có thể đúng bằng cuối chunk hiện tại, khi đó hai chunk không chồng lấn)
+            next_start = max(start_word_idx + 1, end_word_idx_excl - chunk_overlap)
+            k = bisect_left(sentence_ends, next_start - 1)
+            if k < len(sentence_ends) and sentence_ends[k] + 1 <= end_word_idx_excl:
+                next_start = sentence_ends[k] + 1
+            start_word_idx = next_start
+
+    firsts = [f for f, _ in word_ranges]
+    lasts = [l for _, l in word_ranges]
+    char_starts = starts[firsts].tolist()
+    char_ends = ends[lasts].tolist()
+    pages = page_spans(page_offsets, len(full_text), char_starts, char_ends)
+
+    return [
+        {
+            "text": full_text[start_char:end_char],
             "start_char": start_char,
             "end_char": end_char,
             "pages": pages_in_chunk,
-            "word_start": start_word_idx,
-            "word_end": end_word_idx_excl - 1
-        })
-
-        if end_word_idx_excl >= n_words:
-            break
-        start_word_idx += step
-
-    return chunks
+            "word_start": first,
+            "word_end": last
+        }
+        for (first, last), start_char, end_char, pages_in_chunk in zip(word_ranges, char_starts, char_ends, pages)
+    ]
 
 # ---------- Hàm chính xử lý directory, đọc config và gắn metadata ----------
-def process_all_pdfs_in_directory(pdf_dir, output_dir, config_path=CONFIG_PATH, default_start_page=1, default_end_page=None, chunk_size_words=CHUNK_SIZE_WORDS, chunk_overlap_words=CHUNK_OVERLAP_WORDS):
-    os.makedirs(output_dir, exist_ok=True)
-    print(f"Bắt đầu quá trình trích xuất từ thư mục: '{pdf_dir}'")
-    print(f"Kết quả sẽ được lưu tại: '{output_dir}'\n")
-
-    config = load_config(config_path)
-    if config:
-        print(f"   -> Đã load config từ: {config_path} (tìm thấy {len(config)} entries).")
-    else:
-        print("   -> Không có config (hoặc config rỗng). Sẽ xử lý file với dải trang mặc định nếu có.")
-
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith(".pdf")]
-    if not pdf_files:
-        print("Không tìm thấy file PDF nào trong thư mục được chỉ định.")
-        return []
-
-    all_chunks = []
-
+def plan_extraction_tasks(pdf_dir, pdf_files, config, default_start_page=1, default_end_page=None, max_pages_per_task=MAX_PAGES_PER_TASK):
+    """Đọc config + dải trang của từng file và chia thành các task (file_plans, tasks)."""
+    file_plans = []
+    tasks = []
     for filename in pdf_files:
         pdf_path = os.path.join(pdf_dir, filename)
 
@@ -320,56 +536,151 @@ def process_all_pdfs_in_directory(pdf_dir, output_dir, config_path=CONFIG_PATH,
         # cfg_end can be None meaning to read till end
 
         if config_key:
-            print(f"\n-> Match config for '{filename}' -> config key: '{config_key}', doc name: '{cfg_name}'")
+            print(f"-> Match config for '{filename}' -> config key: '{config_key}', doc name: '{cfg_name}'")
         else:
-            print(f"\n-> Không tìm config cho '{filename}', sẽ dùng dải trang mặc định / toàn file.")
+            print(f"-> Không tìm config cho '{filename}', sẽ dùng dải trang mặc định / toàn file.")
 
-        # extract pages using cfg_start/cfg_end
-        page_texts, page_numbers = extract_pages_from_pdf(pdf_path, start_page=cfg_start, end_page=cfg_end)
-        if page_texts is None:
-            continue
-
-        # build full_text + page_offsets
-        full_text = ""
-        page_offsets = []
-        for pnum, ptext in zip(page_numbers, page_texts):
-            page_offsets.append((pnum, len(full_text)))
-            full_text += ptext + " "
-
-        # chunk
-        file_chunks = chunk_full_text_by_words(full_text, page_offsets, chunk_size_words=chunk_size_words, chunk_overlap_words=chunk_overlap_words)
-
-        # attach metadata from config + chunk metadata
-        for c in file_chunks:
-            metadata = {
-                "file": filename,
-                # "config_key": config_key,
-                "document_name": cfg_name,
-                "url": cfg_url,
-                # "config_start_page": cfg_start,
-                # "config_end_page": cfg_end,
-                "pages": c["pages"],
-                # "start_char": c["start_char"],
-                # "end_char": c["end_char"],
-                # "word_start": c["word_start"],
-                # "word_end": c["word_end"]
-            }
-            all_chunks.append({
-                "text": c["text"],
-                "metadata": metadata
-            })
-
-        # save cleaned full_text (optional)
-        output_filename = os.path.splitext(filename)[0] + ".txt"
-        output_path = os.path.join(output_dir, output_filename)
         try:
-            with open(output_path, "w", encoding="utf-8") as f_out:
-                f_out.write(full_text)
-            print(f"   -> Đã lưu full cleaned text vào file: {output_filename}.")
+            page_range = resolve_page_range(pdf_path, start_page=cfg_start, end_page=cfg_end)
         except Exception as e:
-            print(f"   ! Không thể lưu file {output_filename}: {e}")
+            print(f"*** Lỗi khi mở file {pdf_path}: {e}")
+            continue
+        if page_range is None:
+            continue
 
-        print(f"   -> Tạo được {len(file_chunks)} chunk cho file: {filename}")
+        file_idx = len(file_plans)
+        ranges = split_page_range(page_range[0], page_range[1], max_pages_per_task)
+        file_plans.append({"filename": filename, "name": cfg_name, "url": cfg_url, "n_tasks": len(ranges)})
+        tasks.extend((file_idx, pdf_path, s, e) for s, e in ranges)
+        print(f"   -> Trang {page_range[0] + 1} đến {page_range[1]} ({page_range[1] - page_range[0]} trang, {len(ranges)} task).")
+    return file_plans, tasks
+
+def build_file_chunks(plan, parts, output_dir, chunk_size_words=CHUNK_SIZE_WORDS, chunk_overlap_words=CHUNK_OVERLAP_WORDS, sentence_aware=False):
+    """Ghép các đoạn trang (đã theo thứ tự) của một file, lưu full text đã làm sạch, chunk và gắn metadata."""
+    filename = plan["filename"]
+    page_texts = [t for r in parts for t in r["page_texts"]]
+    page_numbers = [n for r in parts for n in r["page_numbers"]]
+
+    # build full_text + page_offsets (mỗi trang kèm một dấu cách)
+    page_offsets = []
+    offset = 0
+    for pnum, ptext in zip(page_numbers, page_texts):
+        page_offsets.append((pnum, offset))
+        offset += len(ptext) + 1
+    full_text = "".join(ptext + " " for ptext in page_texts)
+
+    # chunk
+    file_chunks = chunk_full_text_by_words(full_text, page_offsets, chunk_size_words=chunk_size_words, chunk_overlap_words=chunk_overlap_words, sentence_aware=sentence_aware)
+
+    # attach metadata from config + chunk metadata
+    chunks = []
+    for c in file_chunks:
+        metadata = {
+            "file": filename,
+            # "config_key": config_key,
+            "document_name": plan["name"],
+            "url": plan["url"],
+            # "config_start_page": cfg_start,
+            # "config_end_page": cfg_end,
+            "pages": c["pages"],
+            # "start_char": c["start_char"],
+            # "end_char": c["end_char"],
+            # "word_start": c["word_start"],
+            # "word_end": c["word_end"]
+        }
+        chunks.append({
+            "text": c["text"],
+            "metadata": metadata
+        })
+
+    # save cleaned full_text (optional)
+    output_filename = os.path.splitext(filename)[0] + ".txt"
+    output_path = os.path.join(output_dir, output_filename)
+    try:
+        with open(output_path, "w", encoding="utf-8") as f_out:
+            f_out.write(full_text)
+    except Exception as e:
+        print(f"   ! Không thể lưu file {output_filename}: {e}")
 
-    print(f"\n--- HOÀN TẤT. Tổng chunk thu được: {len(all_chunks)} ---")
-    return all_chunks
\ No newline at end of file
+    total_words = sum(len(t.split()) for t in page_texts)
+    print(f"   -> {filename}: {len(page_texts)} trang, {total_words} từ, {len(chunks)} chunk.")
+    return chunks
+
+def iter_pdf_chunks(pdf_dir, output_dir, config_path=CONFIG_PATH, default_start_page=1, default_end_page=None, chunk_size_words=CHUNK_SIZE_WORDS, chunk_overlap_words=CHUNK_OVERLAP_WORDS, max_workers=None, max_pages_per_task=MAX_PAGES_PER_TASK, only_files=None, failed_files=None, sentence_aware=False):
+    """
+    Bản streaming của `process_all_pdfs_in_directory`: trả về từng chunk (theo thứ tự file) ngay khi file
+    tương ứng trích xuất xong, thay vì gom toàn bộ thư viện vào một list.
+    Trong bộ nhớ chỉ có các task đang chạy và các trang của file đang ghép, nên bộ nhớ không phụ thuộc
+    số file. Tên các file lỗi được thêm vào `failed_files` (nếu truyền vào một list).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Bắt đầu quá trình trích xuất từ thư mục: '{pdf_dir}'")
+    print(f"Kết quả sẽ được lưu tại: '{output_dir}'\n")
+
+    config = load_config(config_path)
+    if config:
+        print(f"   -> Đã load config từ: {config_path} (tìm thấy {len(config)} entries).")
+    else:
+        print("   -> Không có config (hoặc config rỗng). Sẽ xử lý file với dải trang mặc định nếu có.")
+
+    pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.lower().endswith(".pdf"))
+    if only_files is not None:
+        only_files = set(only_files)
+        pdf_files = [f for f in pdf_files if f in only_files]
+    if not pdf_files:
+        print("Không tìm thấy file PDF nào trong thư mục được chỉ định.")
+        return
+
+    # 1) Lập kế hoạch: config + dải trang của từng file, chia thành các task
+    file_plans, tasks = plan_extraction_tasks(pdf_dir, pdf_files, config, default_start_page=default_start_page,
+                                              default_end_page=default_end_page, max_pages_per_task=max_pages_per_task)
+
+    # 2) Trích xuất song song; task của cùng một file liền nhau nên ghép và chunk được ngay khi file xong
+    print(f"\nĐang trích xuất {len(tasks)} task từ {len(file_plans)} file (max_workers={max_workers or os.cpu_count()})...")
+    failed_files = failed_files if failed_files is not None else []
+    timings = []
+    n_chunks = 0
+    parts = []
+    started = time.perf_counter()
+    for r in iter_extraction_results(tasks, max_workers=max_workers):
+        timings.append({"pid": r["pid"], "pages": r["pages"], "seconds": r["seconds"]})
+        parts.append(r)
+        plan = file_plans[r["file_idx"]]
+        if len(parts) < plan["n_tasks"]:
+            continue
+
+        # 3) Ghép trang, chunk và gắn metadata
+        errors = [p["error"] for p in parts if "error" in p]
+        parts, file_parts = [], parts
+        if errors:
+            print(f"*** Lỗi khi xử lý file {plan['filename']}: {'; '.join(errors)}. Bỏ qua file này.")
+            failed_files.append(plan["filename"])
+            continue
+        file_chunks = build_file_chunks(plan, file_parts, output_dir, chunk_size_words=chunk_size_words,
+                                        chunk_overlap_words=chunk_overlap_words, sentence_aware=sentence_aware)
+        del file_parts
+        n_chunks += len(file_chunks)
+        yield from file_chunks
+
+    report_worker_throughput(timings, time.perf_counter() - started)
+    if failed_files:
+        print(f"\n   ! {len(failed_files)} file lỗi: {', '.join(failed_files)}")
+    print(f"\n--- HOÀN TẤT. Tổng chunk thu được: {n_chunks} ---")
+
+def process_all_pdfs_in_directory(pdf_dir, output_dir, config_path=CONFIG_PATH, default_start_page=1, default_end_page=None, chunk_size_words=CHUNK_SIZE_WORDS, chunk_overlap_words=CHUNK_OVERLAP_WORDS, max_workers=None, max_pages_per_task=MAX_PAGES_PER_TASK, only_files=None, sentence_aware=False):
+    """
+    Trích xuất, làm sạch và chunk toàn bộ PDF trong `pdf_dir`.
+    Việc trích xuất trang chạy song song trên process pool (`max_workers`, mặc định = số CPU; 1 = tuần tự):
+    mỗi file là một task, sách dài hơn `max_pages_per_task` trang được chia thành nhiều task.
+    File được xử lý theo thứ tự tên và các đoạn trang được ghép lại theo thứ tự, nên danh sách chunk
+    và metadata không phụ thuộc số worker. File lỗi chỉ bị bỏ qua, không làm dừng các file khác.
+    `only_files`: chỉ xử lý các file có tên trong danh sách này (ingest tăng dần).
+    `sentence_aware`: biên chunk bám theo cuối / đầu câu, xem `chunk_full_text_by_words`.
+    Với thư viện lớn nên dùng `iter_pdf_chunks` để không giữ toàn bộ chunk trong bộ nhớ.
+    """
+    return list(iter_pdf_chunks(
+        pdf_dir, output_dir, config_path=config_path, default_start_page=default_start_page,
+        default_end_page=default_end_page, chunk_size_words=chunk_size_words, chunk_overlap_words=chunk_overlap_words,
+        max_workers=max_workers, max_pages_per_task=max_pages_per_task, only_files=only_files,
+        sentence_aware=sentence_aware,
+    ))
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def json_hash(value: Any) -> str:
+    """Hash ổn định của một giá trị JSON (khoá được sắp xếp)."""
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Manifest của lần ingest trước: với mỗi PDF lưu hash nội dung, config entry đã dùng, hash tham số chunk
+    và danh sách UUID các chunk đã nạp. Dùng để chỉ xử lý lại những file thay đổi và xoá các chunk cũ
+    theo UUID (xem scripts/ingest_data.py).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+            else:
+                print(f"   ! Manifest {path} khác phiên bản, coi như chưa ingest file nào.")
+
+    def plan(self, pdf_dir: str, filenames: Iterable[str], config_entries: Dict[str, Any],
+             params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        So sánh trạng thái hiện tại với manifest. Trả về:
+          new / changed / unchanged: tên file; removed: file có trong manifest nhưng không còn trên đĩa;
+          fingerprints: dấu vân tay mới của từng file hiện có; reasons: lý do file bị coi là thay đổi.
+        """
+        params_hash = json_hash(params)
+        plan = {"new": [], "changed": [], "unchanged": [], "removed": [], "fingerprints": {}, "reasons": {}}
+        present = set()
+        for filename in sorted(filenames):
+            present.add(filename)
+            fingerprint = {
+                "sha256": file_sha256(os.path.join(pdf_dir, filename)),
+                "config_hash": json_hash(config_entries.get(filename)),
+                "params_hash": params_hash,
+            }
+            plan["fingerprints"][filename] = fingerprint
+            previous = self.files.get(filename)
+            if previous is None:
+                plan["new"].append(filename)
+                continue
+            reasons = [
+                label for key, label in (("sha256", "nội dung PDF"), ("config_hash", "config"), ("params_hash", "tham số chunk/model"))
+                if previous.get(key) != fingerprint[key]
+            ]
+            if reasons:
+                plan["changed"].append(filename)
+                plan["reasons"][filename] = reasons
+            else:
+                plan["unchanged"].append(filename)
+        plan["removed"] = sorted(set(self.files) - present)
+        return plan
+
+    def uuids_for(self, filenames: Iterable[str]) -> List[str]:
+        uuids = []
+        for filename in filenames:
+            uuids.extend(self.files.get(filename, {}).get("uuids", []))
+        return uuids
+
+    def record(self, filename: str, fingerprint: Dict[str, Any], uuids: List[str]) -> None:
+        self.files[filename] = dict(fingerprint, uuids=list(uuids), n_chunks=len(uuids), ingested_at=time.time())
+
+    def forget(self, filename: str) -> None:
+        self.files.pop(filename, None)
+
+    def save(self) -> None:
+        """Ghi ra file tạm rồi đổi tên, để manifest không bị hỏng nếu tiến trình dừng giữa chừng."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def print_plan(plan: Dict[str, Any], manifest: Optional[IngestManifest] = None) -> None:
+    print("\n--- Kế hoạch ingest ---")
+    print(f"   Không đổi : {len(plan['unchanged'])} file")
+    for filename in plan["new"]:
+        print(f"   + Mới     : {filename}")
+    for filename in plan["changed"]:
+        old = len(manifest.uuids_for([filename])) if manifest else 0
+        print(f"   ~ Thay đổi: {filename} ({', '.join(plan['reasons'].get(filename, []))}; {old} chunk cũ)")
+    for filename in plan["removed"]:
+        old = len(manifest.uuids_for([filename])) if manifest else 0
+        print(f"   - Đã xoá  : {filename} ({old} chunk sẽ bị xoá)")
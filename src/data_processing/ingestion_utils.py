@@ -1,15 +1,22 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import uuid
 from tqdm import tqdm
 import json
+import os
 import re
+import shutil
 
-def embedd_chunks(chunks, embedding_model, batch_size=32):
+import numpy as np
+
+from src.data_processing.bulk_loader import AdaptiveBulkLoader
+from src.data_processing.streaming import batched
+
+def embedd_chunks(chunks, embedding_model, batch_size=32, store=None):
     """
     chunks: list of either
       - dict {"text": "...", "metadata": {...}}
       - or plain string "..."
     embedding_model: object with .encode(list_of_texts, show_progress_bar=True, batch_size=...)
+    store: ChunkEmbeddingStore (tuỳ chọn) - chỉ embed các chunk chưa có trong store
     Trả về list các dict: {"content": text, "vector": embedding.tolist(), "metadata": metadata}
     """
     # chuẩn bị texts
@@ -29,11 +36,14 @@ def embedd_chunks(chunks, embedding_model, batch_size=32):
         return []
 
     print(f"Bắt đầu tạo embeddings cho {len(texts)} chunk...")
-    all_embeddings = embedding_model.encode(
-        texts,
-        show_progress_bar=True,
-        batch_size=batch_size
-    )
+    if store is not None:
+        all_embeddings = store.encode(texts, embedding_model, batch_size=batch_size)
+    else:
+        all_embeddings = embedding_model.encode(
+            texts,
+            show_progress_bar=True,
+            batch_size=batch_size
+        )
 
     chunks_with_embeddings = []
     for text, emb, meta in zip(texts, all_embeddings, metadatas):
@@ -46,8 +56,40 @@ def embedd_chunks(chunks, embedding_model, batch_size=32):
     print(f"Hoàn tất. Đã tạo embedding cho {len(chunks_with_embeddings)} chunk.")
     return chunks_with_embeddings
 
-def generate_uuid(text_chunk: str):
-    return str(uuid.uuid5(uuid.NAMESPACE_DNS, text_chunk))
+def iter_embedded_batches(chunks, embedding_model, batch_size=32, store=None):
+    """
+    Bản streaming của `embedd_chunks`: nhận một iterable chunk (có thể là generator), embed từng batch
+    `batch_size` chunk và trả về từng batch list các dict {"content", "vector", "metadata"}.
+    Vector được giữ là mảng numpy float32 (không đổi sang list float của Python) để tiết kiệm bộ nhớ.
+    Với `store` (ChunkEmbeddingStore), chunk đã có vector trong store không bị embed lại.
+    """
+    for batch in batched(chunks, batch_size):
+        texts = []
+        metadatas = []
+        for c in batch:
+            if isinstance(c, dict):
+                texts.append(c.get("text") or c.get("content") or "")
+                metadatas.append(c.get("metadata", {}) or {})
+            else:
+                texts.append(str(c))
+                metadatas.append({})
+        if store is not None:
+            vectors = store.encode(texts, embedding_model, batch_size=batch_size)
+        else:
+            vectors = np.asarray(embedding_model.encode(texts, show_progress_bar=False, batch_size=batch_size), dtype=np.float32)
+        yield [{"content": text, "vector": vec, "metadata": meta} for text, vec, meta in zip(texts, vectors, metadatas)]
+
+def generate_uuid(text_chunk: str, metadata: dict = None):
+    """
+    UUID xác định (uuid5) của chunk, dùng chung cho Weaviate, index cục bộ và manifest ingest.
+    Có `metadata`: tính trên nội dung + metadata (JSON, khoá sắp xếp), nên hai chunk trùng nội dung ở hai
+    tài liệu / trang khác nhau là hai object khác nhau. Không có `metadata`: chỉ theo nội dung (cách cũ, là id
+    trong ground_truth_ids của bộ đánh giá, được lưu lại trong property `content_uuid`).
+    """
+    if not metadata:
+        return str(uuid.uuid5(uuid.NAMESPACE_DNS, text_chunk))
+    key = text_chunk + "\x00" + json.dumps(metadata, ensure_ascii=False, sort_keys=True, default=str)
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, key))
 
 
 def normalize_property_key(key: str):
@@ -72,7 +114,7 @@ def prepare_properties_from_metadata(content: str, metadata: dict):
     - convert list/dict -> JSON string (an toàn nếu schema chưa support array/object)
     - skip None
     """
-    props = {"content": content}
+    props = {"content": content, "content_uuid": generate_uuid(content)}
     if not metadata:
         return props
 
@@ -96,37 +138,110 @@ def prepare_properties_from_metadata(content: str, metadata: dict):
     return props
 
 
-def load_data_to_weaviate(chunks_with_embeddings, collection, batch_size=100, concurrent_requests=1):
+def load_data_to_weaviate(chunks_with_embeddings, collection, batch_size=100, concurrent_requests=2, failure_report_path=None, **loader_kwargs):
     """
-    chunks_with_embeddings: list of {"content":..., "vector":..., "metadata": {...}}
-    collection: object có interface .batch.fixed_size(...). Sử dụng cùng API batch của bạn.
+    chunks_with_embeddings: list (hoặc iterable / generator) of {"content":..., "vector":..., "metadata": {...}}
+    collection: collection Weaviate (dùng `collection.data.insert_many`).
+    Nạp bằng AdaptiveBulkLoader (batch / số request song song tự điều chỉnh, thử lại có backoff); object vẫn lỗi
+    sau các lần thử được ghi vào `failure_report_path` để nạp lại. Trả về số chunk nạp lỗi.
     """
-    print(f"\nĐang nhập {len(chunks_with_embeddings)} chunk (với embeddings) vào Weaviate...")
-    failed = 0
-    with collection.batch.fixed_size(batch_size=batch_size, concurrent_requests=concurrent_requests) as batch:
-        for data_obj in tqdm(chunks_with_embeddings, desc="Đang thêm chunk vào Weaviate"):
-            try:
-                content = data_obj.get("content", "")
-                vector = data_obj.get("vector")
-                metadata = data_obj.get("metadata", {}) or {}
-
-                # chuẩn bị properties (có gộp metadata)
-                properties = prepare_properties_from_metadata(content, metadata)
-
-                # tạo uuid bền vững
-                uuid_str = generate_uuid(content, metadata)
-
-                # add object
-                batch.add_object(
-                    properties=properties,
-                    vector=vector,
-                    uuid=uuid_str
-                )
-            except Exception as e:
-                failed += 1
-                print(f"  ! Lỗi khi thêm 1 chunk: {e}")
-    if failed:
-        print(f"Hoàn tất với {failed} chunk lỗi.")
-    else:
-        print("Hoàn tất import vào Weaviate thành công.")
-    
\ No newline at end of file
+    total = len(chunks_with_embeddings) if hasattr(chunks_with_embeddings, "__len__") else None
+    print(f"\nĐang nhập {total if total is not None else 'các'} chunk (với embeddings) vào Weaviate...")
+    loader = AdaptiveBulkLoader(collection, batch_size=batch_size, concurrency=concurrent_requests,
+                                failure_report_path=failure_report_path, **loader_kwargs)
+    report = loader.load(tqdm(chunks_with_embeddings, total=total, desc="Đang thêm chunk vào Weaviate"))
+    report.print_summary()
+    return report.failed
+
+
+def delete_from_weaviate(collection, uuids, batch_size=1000):
+    """Xoá các chunk theo uuid (dùng khi PDF / config / tham số chunk thay đổi hoặc file bị xoá)."""
+    from weaviate.classes.query import Filter
+
+    uuids = list(dict.fromkeys(uuids))
+    deleted = 0
+    for start in range(0, len(uuids), batch_size):
+        batch = uuids[start:start + batch_size]
+        result = collection.data.delete_many(where=Filter.by_id().contains_any(batch))
+        deleted += result.successful
+        if result.failed:
+            print(f"  ! {result.failed} chunk không xoá được.")
+    print(f"Đã xoá {deleted}/{len(uuids)} chunk cũ khỏi Weaviate.")
+    return deleted
+
+
+class LocalIndexSink:
+    """
+    Ghi chunk (cùng embeddings) vào index cục bộ theo luồng: index vector (RETRIEVAL_BACKEND=local)
+    và index BM25 (BM25_BACKEND=local) dùng chung metadata.jsonl.
+    Properties và uuid được tạo giống hệt khi nhập vào Weaviate để hai backend trả về cùng định dạng.
+    Chunk mới được ghi ra thư mục tạm (`add` / `write`); `finish` chép lại các chunk cũ cần giữ
+    (ingest tăng dần) rồi thay thế từng file, nên index cũ vẫn đọc được trong lúc ghi.
+    """
+
+    def __init__(self, index_dir, model_name=None):
+        from src.core.local_index import LocalIndexWriter
+        from src.core.bm25_index import BM25IndexWriter
+
+        self.index_dir = index_dir
+        self.tmp_dir = index_dir.rstrip("/\\") + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self._vec_writer = LocalIndexWriter(self.tmp_dir, model_name=model_name)
+        self._bm25_writer = BM25IndexWriter(self.tmp_dir)
+        self.new_uuids = set()
+
+    def add(self, data_obj):
+        content = data_obj.get("content", "")
+        metadata = data_obj.get("metadata", {}) or {}
+        record = prepare_properties_from_metadata(content, metadata)
+        record["uuid"] = generate_uuid(content, metadata)
+        self.new_uuids.add(record["uuid"])
+        self._vec_writer.add(record, data_obj.get("vector"))
+        self._bm25_writer.add(content)
+
+    def write(self, chunks_with_embeddings):
+        total = len(chunks_with_embeddings) if hasattr(chunks_with_embeddings, "__len__") else None
+        for data_obj in tqdm(chunks_with_embeddings, total=total, desc="Đang ghi chunk vào index cục bộ"):
+            self.add(data_obj)
+        return len(self.new_uuids)
+
+    def finish(self, keep_existing=False, drop_uuids=None, keep_uuids=None):
+        """
+        Với `keep_existing`, các chunk đang có trong index (trừ `drop_uuids` và chunk vừa ghi lại)
+        được giữ lại; có `keep_uuids` thì chỉ giữ các chunk có uuid trong đó (ví dụ ingest lại toàn bộ nhưng
+        vẫn giữ chunk của các file trích xuất lỗi). Trả về tổng số chunk của index mới.
+        """
+        from src.core.local_index import LocalVectorIndex, INFO_FILENAME
+
+        kept = 0
+        drop_uuids = set(drop_uuids or ())
+        keep_uuids = set(keep_uuids) if keep_uuids is not None else None
+        with self._vec_writer as vec_writer, self._bm25_writer as bm25_writer:
+            if keep_existing and os.path.exists(os.path.join(self.index_dir, INFO_FILENAME)):
+                existing = LocalVectorIndex(self.index_dir)
+                for row, record in enumerate(existing.records):
+                    uid = record.get("uuid")
+                    if uid in drop_uuids or uid in self.new_uuids or (keep_uuids is not None and uid not in keep_uuids):
+                        continue
+                    vec_writer.add(record, existing.vectors[row])
+                    bm25_writer.add(record.get("content", ""))
+                    kept += 1
+                existing = None  # đóng memmap trước khi thay file
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        for name in os.listdir(self.tmp_dir):
+            os.replace(os.path.join(self.tmp_dir, name), os.path.join(self.index_dir, name))
+        os.rmdir(self.tmp_dir)
+        print(f"Hoàn tất. Index cục bộ có {vec_writer.count} chunk ({kept} chunk giữ lại từ index cũ).")
+        return vec_writer.count
+
+
+def save_to_local_index(chunks_with_embeddings, index_dir, model_name=None, keep_existing=False, drop_uuids=None):
+    """
+    Ghi các chunk (cùng embeddings, list hoặc iterable) thành index cục bộ, xem `LocalIndexSink`.
+    Với `keep_existing`, các chunk đang có trong index (trừ `drop_uuids`) được giữ lại (ingest tăng dần).
+    """
+    sink = LocalIndexSink(index_dir, model_name=model_name)
+    print(f"\nĐang ghi chunk vào index cục bộ tại '{index_dir}'...")
+    sink.write(chunks_with_embeddings)
+    return sink.finish(keep_existing=keep_existing, drop_uuids=drop_uuids)
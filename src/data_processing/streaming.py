@@ -0,0 +1,139 @@
+"""
+Khối dựng cho pipeline ingestion dạng streaming (trích xuất -> chunk -> embedding -> nạp).
+
+Mỗi stage chạy trong một luồng riêng và nối với stage sau bằng hàng đợi có giới hạn
+(`queue.Queue(maxsize)`): các stage chạy song song, stage nhanh bị chặn lại khi hàng đợi đầy,
+nên bộ nhớ chỉ phụ thuộc kích thước hàng đợi chứ không phụ thuộc số file trong thư viện.
+Lỗi ở một stage được chuyển sang stage tiêu thụ và ném lại ở đó.
+"""
+import queue
+import threading
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Sequence
+
+_END = object()
+# Chu kỳ kiểm tra cờ dừng khi hàng đợi đầy / rỗng (giây)
+_POLL_SECONDS = 0.1
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _put(q: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """Đưa `item` vào hàng đợi, chờ khi đầy; trả về False nếu phía tiêu thụ đã dừng."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, max(1, size)))
+        if not batch:
+            return
+        yield batch
+
+
+def background_stage(iterable: Iterable[Any], maxsize: int, name: str = "stage") -> Iterator[Any]:
+    """
+    Chạy `iterable` (thường là một generator) trong luồng nền, đẩy kết quả qua hàng đợi tối đa
+    `maxsize` phần tử. Nếu phía tiêu thụ dừng sớm (lỗi / break), luồng nền dừng ở lần đẩy tiếp theo
+    và generator nguồn được đóng để giải phóng tài nguyên (process pool, file...).
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def run():
+        try:
+            for item in iterable:
+                if not _put(q, item, stop):
+                    return
+            _put(q, _END, stop)
+        except BaseException as e:
+            _put(q, _Failure(e), stop)
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    worker = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+
+
+def fan_out(iterable: Iterable[Any], consumers: Sequence[Callable[[Iterator[Any]], Any]], maxsize: int) -> List[Any]:
+    """
+    Gửi mỗi phần tử của `iterable` tới tất cả `consumers` (ví dụ: Weaviate và index cục bộ).
+    Mỗi consumer nhận một iterator và chạy trong luồng riêng với hàng đợi tối đa `maxsize` phần tử,
+    nên các đích nạp chạy song song với nhau và với các stage phía trước.
+    Trả về kết quả của từng consumer theo thứ tự; lỗi của consumer đầu tiên bị lỗi được ném lại.
+    """
+    if len(consumers) == 1:
+        return [consumers[0](iter(iterable))]
+
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=max(1, maxsize)) for _ in consumers]
+    results: List[Any] = [None] * len(consumers)
+    errors: List[BaseException] = []
+    done = [threading.Event() for _ in consumers]
+
+    def drain(q: "queue.Queue") -> Iterator[Any]:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            yield item
+
+    def run(i: int) -> None:
+        try:
+            results[i] = consumers[i](drain(queues[i]))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            done[i].set()
+
+    workers = [threading.Thread(target=run, args=(i,), name=f"ingest-sink-{i}", daemon=True) for i in range(len(consumers))]
+    for w in workers:
+        w.start()
+    try:
+        for item in iterable:
+            for q, finished in zip(queues, done):
+                # consumer đã kết thúc (kể cả lỗi) thì không nhận thêm, tránh chặn mãi khi hàng đợi đầy
+                while not finished.is_set() and not stop.is_set():
+                    try:
+                        q.put(item, timeout=_POLL_SECONDS)
+                        break
+                    except queue.Full:
+                        continue
+            if stop.is_set():
+                break
+    finally:
+        for q, finished in zip(queues, done):
+            while not finished.is_set():
+                try:
+                    q.put(_END, timeout=_POLL_SECONDS)
+                    break
+                except queue.Full:
+                    continue
+        for w in workers:
+            w.join()
+    if errors:
+        raise errors[0]
+    return results
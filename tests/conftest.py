@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Cho phép import `src.*` khi chạy pytest từ thư mục gốc của dự án (giống các script trong scripts/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,163 @@
+import threading
+import uuid
+
+import numpy as np
+import pytest
+
+from src.data_processing.bulk_loader import AdaptiveBulkLoader, read_failure_report
+from src.data_processing.ingestion_utils import generate_uuid
+
+
+class _ErrorObject:
+    def __init__(self, message):
+        self.message = message
+
+
+class _InsertResult:
+    def __init__(self, errors):
+        self.errors = errors
+
+
+class FakeData:
+    """
+    Giả lập `collection.data.insert_many`:
+      - lời gọi thứ i nằm trong `fail_calls`: lỗi cả batch (ném exception như timeout / quá tải)
+      - object có nội dung trong `always_fail`: luôn lỗi
+      - object có nội dung trong `fail_once`: chỉ lỗi ở lần gửi đầu tiên
+    """
+
+    def __init__(self, always_fail=(), fail_once=(), fail_calls=()):
+        self.always_fail = set(always_fail)
+        self.fail_once = set(fail_once)
+        self.fail_calls = set(fail_calls)
+        self.stored = {}
+        self.calls = 0
+        self.failure_events = 0
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def insert_many(self, objects):
+        with self._lock:
+            self.calls += 1
+            for obj in objects:
+                content = obj.properties["content"]
+                self.attempts[content] = self.attempts.get(content, 0) + 1
+            if self.calls in self.fail_calls:
+                self.failure_events += len(objects)
+                raise RuntimeError("batch timeout")
+            errors = {}
+            for i, obj in enumerate(objects):
+                content = obj.properties["content"]
+                if content in self.always_fail or (content in self.fail_once and self.attempts[content] == 1):
+                    errors[i] = _ErrorObject(f"cannot insert {content}")
+                    self.failure_events += 1
+                else:
+                    self.stored[str(obj.uuid)] = obj
+            return _InsertResult(errors)
+
+
+class FakeCollection:
+    def __init__(self, data):
+        self.data = data
+
+
+def make_chunks(n):
+    return [
+        {"content": f"chunk {i}", "metadata": {"file": f"book{i % 3}.pdf", "chunk_index": i},
+         "vector": np.full(4, i, dtype=np.float32)}
+        for i in range(n)
+    ]
+
+
+def make_loader(data, **kwargs):
+    params = dict(batch_size=10, min_batch_size=2, max_batch_size=40, concurrency=2, max_concurrency=4,
+                  max_retries=2, backoff_base=0.001, backoff_max=0.01)
+    params.update(kwargs)
+    return AdaptiveBulkLoader(FakeCollection(data), **params)
+
+
+def test_retries_and_failure_report(tmp_path):
+    always_fail = {"chunk 7", "chunk 42"}
+    data = FakeData(always_fail=always_fail, fail_once={"chunk 3", "chunk 20", "chunk 55"}, fail_calls={1, 4})
+    report_path = tmp_path / "failures.jsonl"
+    report = make_loader(data, failure_report_path=str(report_path)).load(iter(make_chunks(80)))
+
+    assert report.submitted == 80
+    assert report.failed == len(always_fail)
+    assert report.succeeded == 80 - len(always_fail)
+    assert len(data.stored) == 80 - len(always_fail)
+    # mọi lần lỗi đều được thử lại, trừ lần lỗi cuối của các object bỏ cuộc
+    assert report.retries == data.failure_events - len(always_fail)
+    for content in always_fail:
+        assert data.attempts[content] == 1 + 2  # lần đầu + max_retries
+    assert report.failure_report_path == str(report_path)
+
+    failed = list(read_failure_report(str(report_path)))
+    assert {item["content"] for item in failed} == always_fail
+    for item in failed:
+        index = int(item["content"].split()[1])
+        assert item["metadata"] == {"file": f"book{index % 3}.pdf", "chunk_index": index}
+        assert item["uuid"] == generate_uuid(item["content"], item["metadata"])
+        assert item["vector"].dtype == np.float32
+        np.testing.assert_array_equal(item["vector"], np.full(4, index, dtype=np.float32))
+        assert item["attempts"] == 0
+        assert "error" not in item
+
+
+def test_replay_failure_report(tmp_path):
+    report_path = tmp_path / "failures.jsonl"
+    first = FakeData(always_fail={"chunk 1", "chunk 2"})
+    make_loader(first, failure_report_path=str(report_path)).load(make_chunks(10))
+
+    # lần nạp lại thành công: toàn bộ object trong báo cáo được nạp, báo cáo cũ bị xoá
+    second = FakeData()
+    report = make_loader(second, failure_report_path=str(report_path)).load(read_failure_report(str(report_path)))
+    assert report.succeeded == 2 and report.failed == 0
+    assert set(second.stored) == {generate_uuid(f"chunk {i}", {"file": f"book{i % 3}.pdf", "chunk_index": i}) for i in (1, 2)}
+    assert not report_path.exists()
+
+
+def test_uuid_and_properties():
+    data = FakeData()
+    make_loader(data).load(make_chunks(5))
+    for i in range(5):
+        content, metadata = f"chunk {i}", {"file": f"book{i % 3}.pdf", "chunk_index": i}
+        obj = data.stored[generate_uuid(content, metadata)]
+        # content_uuid giữ cách tạo UUID cũ (chỉ theo nội dung) của ground_truth_ids
+        assert obj.properties["content_uuid"] == str(uuid.uuid5(uuid.NAMESPACE_DNS, content))
+
+    # cùng nội dung ở hai tài liệu khác nhau là hai object khác nhau, UUID xác định
+    assert generate_uuid("a", {"file": "x.pdf"}) != generate_uuid("a", {"file": "y.pdf"})
+    assert generate_uuid("a", {"file": "x.pdf", "page": 1}) == generate_uuid("a", {"page": 1, "file": "x.pdf"})
+    assert generate_uuid("a") == str(uuid.uuid5(uuid.NAMESPACE_DNS, "a"))
+
+
+def test_aimd_tuning():
+    loader = make_loader(FakeData(), batch_size=16, concurrency=2, max_concurrency=3, target_latency=1.0)
+
+    # batch nhanh: tăng dần kích thước, sau 3 batch tốt liên tiếp thì thêm một request song song
+    loader._tune(0.1, False)
+    assert loader.batch_size == 20 and loader.concurrency == 2
+    loader._tune(0.1, False)
+    loader._tune(0.1, False)
+    assert loader.batch_size == 31 and loader.concurrency == 3
+    for _ in range(10):
+        loader._tune(0.1, False)
+    assert loader.batch_size == 40 and loader.concurrency == 3  # không vượt giới hạn
+
+    # batch chậm hoặc lỗi cả batch: giảm nửa kích thước và bớt một request song song
+    loader._tune(5.0, False)
+    assert loader.batch_size == 20 and loader.concurrency == 2
+    loader._tune(0.1, True)
+    assert loader.batch_size == 10 and loader.concurrency == 1
+    for _ in range(5):
+        loader._tune(5.0, False)
+    assert loader.batch_size == 2 and loader.concurrency == 1
+
+
+@pytest.mark.parametrize("attempt", [1, 3, 10])
+def test_backoff_is_bounded(attempt):
+    loader = make_loader(FakeData(), backoff_base=0.5, backoff_max=2.0)
+    delay = loader._backoff(attempt)
+    expected = min(2.0, 0.5 * 2 ** (attempt - 1))
+    assert expected * 0.5 <= delay <= expected
@@ -0,0 +1,65 @@
+import json
+import os
+
+import numpy as np
+
+from src.core.chunk_embedding_store import (INFO_FILENAME, KEYS_FILENAME, VECTORS_FILENAME, KEY_BYTES,
+                                            ChunkEmbeddingStore)
+
+DIM = 4
+
+
+class FakeModel:
+    """Embedding xác định theo độ dài văn bản, đếm số câu đã encode."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.encoded.extend(texts)
+        return np.array([[len(t), 1.0, 2.0, 3.0] for t in texts], dtype=np.float32)
+
+
+def expected(texts):
+    return np.array([[len(t), 1.0, 2.0, 3.0] for t in texts], dtype=np.float32)
+
+
+def test_encode_only_embeds_misses_and_persists(tmp_path):
+    model = FakeModel()
+    store = ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")
+    texts = ["a", "bb", "a", "ccc"]
+    np.testing.assert_array_equal(store.encode(texts, model), expected(texts))
+    assert sorted(model.encoded) == ["a", "bb", "ccc"]
+    assert store.stats()["misses"] == 3 and store.stats()["hits"] == 1
+
+    reopened = ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")
+    model = FakeModel()
+    np.testing.assert_array_equal(reopened.encode(["ccc", "bb"], model), expected(["ccc", "bb"]))
+    assert model.encoded == []
+    assert reopened.get("missing") is None
+
+
+def test_open_with_only_info_json(tmp_path):
+    # lần ghi đầu tiên bị dừng ngay sau khi ghi info.json, trước khi có vectors.bin / keys.bin
+    store = ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")
+    with open(os.path.join(store.dir, INFO_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({"model_name": "fake-model", "dim": DIM, "dtype": "float32"}, f)
+
+    reopened = ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")
+    assert len(reopened) == 0
+    np.testing.assert_array_equal(reopened.encode(["xyz"], FakeModel()), expected(["xyz"]))
+    assert len(ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")) == 1
+
+
+def test_torn_write_is_truncated(tmp_path):
+    store = ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")
+    store.encode(["one", "two"], FakeModel())
+    # vector của chunk thứ ba đã ghi (một phần), khoá chưa kịp ghi
+    with open(os.path.join(store.dir, VECTORS_FILENAME), "ab") as f:
+        f.write(b"\x00" * (DIM * 4 + 3))
+
+    reopened = ChunkEmbeddingStore(str(tmp_path), model_name="fake-model")
+    assert len(reopened) == 2
+    assert os.path.getsize(os.path.join(store.dir, VECTORS_FILENAME)) == 2 * DIM * 4
+    assert os.path.getsize(os.path.join(store.dir, KEYS_FILENAME)) == 2 * KEY_BYTES
+    np.testing.assert_array_equal(reopened.get("two"), expected(["two"])[0])
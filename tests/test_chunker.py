@@ -0,0 +1,120 @@
+import random
+import re
+
+import pytest
+
+from src.data_processing.extract_pdf import SENTENCE_MIN_FRACTION, chunk_full_text_by_words
+
+WORDS = "lịch sử Việt Nam thời kỳ dựng nước nhà Lý nhà Trần Bạch Đằng Ngô Quyền năm 938".split()
+SPACES = [" "] * 20 + ["  ", "\n", "\t", "　", " "]
+SENTENCE_ENDINGS = [".", "!", "?", "…", ".”", "?)"]
+
+
+def baseline_chunk_full_text_by_words(full_text, page_offsets, chunk_size_words, chunk_overlap_words):
+    """Bản cài đặt trước đây (một match object cho mỗi từ, quét tuyến tính page_offsets) làm chuẩn so sánh."""
+    if not full_text:
+        return []
+    tokens = list(re.finditer(r'\S+', full_text))
+    n_words = len(tokens)
+    if n_words == 0:
+        return []
+    chunk_size = max(1, int(chunk_size_words))
+    chunk_overlap = max(0, int(chunk_overlap_words))
+    step = max(1, chunk_size - chunk_overlap)
+    chunks = []
+    start_word_idx = 0
+    text_len = len(full_text)
+    while start_word_idx < n_words:
+        end_word_idx_excl = min(n_words, start_word_idx + chunk_size)
+        start_char = tokens[start_word_idx].start()
+        end_char = tokens[end_word_idx_excl - 1].end()
+        pages_in_chunk = []
+        for i, (page_num, offset) in enumerate(page_offsets):
+            next_offset = page_offsets[i + 1][1] if i + 1 < len(page_offsets) else text_len
+            if start_char < next_offset and end_char > offset:
+                pages_in_chunk.append(page_num)
+        chunks.append({
+            "text": full_text[start_char:end_char],
+            "start_char": start_char,
+            "end_char": end_char,
+            "pages": pages_in_chunk,
+            "word_start": start_word_idx,
+            "word_end": end_word_idx_excl - 1
+        })
+        if end_word_idx_excl >= n_words:
+            break
+        start_word_idx += step
+    return chunks
+
+
+def make_book(rng, n_pages, words_per_page, sentence_rate=0.1):
+    """full_text + page_offsets như build_file_chunks (mỗi trang kèm một dấu cách), có cả trang rỗng."""
+    pages = []
+    for _ in range(n_pages):
+        if rng.random() < 0.1:
+            pages.append("")
+            continue
+        parts = []
+        for _ in range(rng.randint(1, words_per_page)):
+            word = rng.choice(WORDS)
+            if rng.random() < sentence_rate:
+                word += rng.choice(SENTENCE_ENDINGS)
+            parts.append(word + rng.choice(SPACES))
+        pages.append("".join(parts).strip())
+    page_offsets = []
+    offset = 0
+    for i, text in enumerate(pages, start=1):
+        page_offsets.append((i, offset))
+        offset += len(text) + 1
+    return "".join(p + " " for p in pages), page_offsets
+
+
+def test_matches_baseline_on_random_books():
+    rng = random.Random(0)
+    for _ in range(500):
+        text, offsets = make_book(rng, rng.randint(0, 25), rng.randint(1, 50))
+        size = rng.randint(1, 60)
+        overlap = rng.randint(0, size + 5)
+        assert chunk_full_text_by_words(text, offsets, size, overlap) == \
+            baseline_chunk_full_text_by_words(text, offsets, size, overlap), (size, overlap)
+
+
+@pytest.mark.parametrize("text", ["", "   \n\t ", "　"])
+def test_empty_text(text):
+    assert chunk_full_text_by_words(text, [(1, 0)], 10, 2) == []
+    assert chunk_full_text_by_words(text, [(1, 0)], 10, 2, sentence_aware=True) == []
+
+
+@pytest.mark.parametrize("size,overlap", [(8, 2), (8, 8), (8, 20), (1, 0), (1, 3)])
+def test_sentence_aware_without_sentence_ends_matches_word_mode(size, overlap):
+    rng = random.Random(size * 100 + overlap)
+    for _ in range(50):
+        text, offsets = make_book(rng, rng.randint(1, 10), 40, sentence_rate=0.0)
+        assert chunk_full_text_by_words(text, offsets, size, overlap, sentence_aware=True) == \
+            chunk_full_text_by_words(text, offsets, size, overlap)
+
+
+@pytest.mark.parametrize("size,overlap", [(10, 10), (10, 15), (6, 100), (12, 4), (1, 1)])
+def test_sentence_aware_invariants(size, overlap):
+    rng = random.Random(size * 1000 + overlap)
+    for _ in range(100):
+        text, offsets = make_book(rng, rng.randint(1, 8), 40, sentence_rate=0.3)
+        n_words = len(text.split())
+        chunks = chunk_full_text_by_words(text, offsets, size, overlap, sentence_aware=True)
+        if not n_words:
+            assert chunks == []
+            continue
+        # chunk đầu từ từ đầu tiên, chunk cuối tới từ cuối cùng, đầu chunk tăng dần, không bỏ sót từ nào
+        assert chunks[0]["word_start"] == 0
+        assert chunks[-1]["word_end"] == n_words - 1
+        for prev, cur in zip(chunks, chunks[1:]):
+            assert cur["word_start"] > prev["word_start"]
+            assert cur["word_start"] <= prev["word_end"] + 1
+        for c in chunks:
+            length = c["word_end"] - c["word_start"] + 1
+            assert 1 <= length <= size
+            assert len(c["text"].split()) == length
+            # chunk chỉ bị cắt ngắn (khác chunk cuối) khi kết thúc ở cuối câu và còn đủ dài
+            if length < size and c is not chunks[-1]:
+                assert c["text"].rstrip("\"'”’)]»")[-1] in ".!?…"
+                assert length >= max(1, int(size * SENTENCE_MIN_FRACTION))